@@ -0,0 +1,86 @@
+"""Measure passkey challenge throughput under concurrent begin/complete pairs.
+
+Each worker thread persists a challenge and immediately consumes it, like a `begin`/`complete`
+round trip, against a scratch SQLite database pre-filled with expired rows. `--purge-on-insert`
+reproduces the old behaviour of deleting expired rows on every `begin`.
+
+    python benchmarks/bench_challenges.py --threads 8 --pairs 500 --stale 20000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import secrets
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pairs", type=int, default=500, help="begin/complete pairs per thread")
+    parser.add_argument("--stale", type=int, default=20000, help="expired rows present before the run")
+    parser.add_argument("--purge-on-insert", action="store_true")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="wt-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}"
+
+    from workout_tracker.auth.challenge_store import (
+        MemoryChallengeStore,
+        SqlChallengeStore,
+        purge_expired_challenges,
+    )
+    from workout_tracker.database import adapter
+    from workout_tracker.models import AuthChallenge
+
+    adapter.create_schema()
+    stale_at = datetime.now(timezone.utc) - timedelta(days=1)
+    with adapter.session() as db:
+        db.add_all(
+            AuthChallenge(challenge=secrets.token_urlsafe(32), purpose="authenticate", created_at=stale_at)
+            for _ in range(args.stale)
+        )
+
+    class PurgingSqlStore(SqlChallengeStore):
+        def persist(self, db, encoded, purpose, user=None):
+            purge_expired_challenges(db)
+            return super().persist(db, encoded, purpose, user)
+
+    stores = {"memory": MemoryChallengeStore(), "sql": PurgingSqlStore() if args.purge_on_insert else SqlChallengeStore()}
+    print(f"{args.threads} threads x {args.pairs} pairs, {args.stale} stale rows, purge on insert: {args.purge_on_insert}")
+    print(f"{'backend':<8} {'pairs/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, store in stores.items():
+        latencies: list[float] = []
+        lock = threading.Lock()
+
+        def worker() -> None:
+            local: list[float] = []
+            for _ in range(args.pairs):
+                encoded = secrets.token_urlsafe(32)
+                started = time.perf_counter()
+                with adapter.session() as db:
+                    store.persist(db, encoded, "authenticate")
+                with adapter.session() as db:
+                    store.consume(db, encoded, "authenticate")
+                local.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        print(f"{name:<8} {len(latencies) / elapsed:>10.0f} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
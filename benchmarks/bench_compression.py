@@ -0,0 +1,86 @@
+"""Measure CPU cost and ratio of API response compression.
+
+Builds a `GET /workouts`-shaped JSON payload and times each available coding at the configured
+levels, both one-shot and through the streaming compressor used for chunked responses.
+
+    python benchmarks/bench_compression.py --workouts 2000 --levels 1 5 9
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from workout_tracker.compression import available_encodings, compress, stream_compressor
+
+EXERCISES = ["Back Squat", "Bench Press", "Deadlift", "Overhead Press", "Barbell Row", "Pull Up"]
+
+
+def build_payload(workouts: int) -> bytes:
+    start = datetime(2024, 1, 1, 7, 0)
+    rows = []
+    for index in range(workouts):
+        begin = start + timedelta(days=index)
+        rows.append(
+            {
+                "id": f"{index:08d}-0000-4000-8000-000000000000",
+                "title": "Full body",
+                "start_time": begin.isoformat(),
+                "end_time": (begin + timedelta(minutes=70)).isoformat(),
+                "template_id": None,
+                "body_weight": 82.5,
+                "body_weight_timing": "before",
+                "notes": "Felt strong",
+                "sets": [
+                    {"exercise": name, "exercise_type": "weighted", "reps": 5, "weight": 100.0, "unit": "kg", "rpe": 8}
+                    for name in EXERCISES
+                    for _ in range(3)
+                ],
+                "created_at": begin.isoformat(),
+                "updated_at": begin.isoformat(),
+            }
+        )
+    return json.dumps(rows, separators=(",", ":")).encode()
+
+
+def bench(data: bytes, encoding: str, level: int, repeat: int, chunk_size: int) -> tuple[float, float, float]:
+    cpu = time.process_time()
+    for _ in range(repeat):
+        size = len(compress(data, encoding, level))
+    one_shot = (time.process_time() - cpu) / repeat
+
+    cpu = time.process_time()
+    for _ in range(repeat):
+        stream = stream_compressor(encoding, level)
+        for offset in range(0, len(data), chunk_size):
+            stream.compress(data[offset : offset + chunk_size])
+            stream.flush()
+        stream.finish()
+    streaming = (time.process_time() - cpu) / repeat
+    return size / len(data), one_shot, streaming
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workouts", type=int, default=1000)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 5, 9])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=16 * 1024)
+    args = parser.parse_args()
+
+    data = build_payload(args.workouts)
+    megabytes = len(data) / 1_000_000
+    print(f"payload: {args.workouts} workouts, {megabytes:.2f} MB")
+    print(f"{'coding':<6} {'level':>5} {'ratio':>7} {'cpu ms':>9} {'MB/s':>8} {'stream ms':>10}")
+    for encoding in available_encodings():
+        for level in args.levels:
+            ratio, one_shot, streaming = bench(data, encoding, level, args.repeat, args.chunk_size)
+            throughput = megabytes / one_shot if one_shot else float("inf")
+            print(
+                f"{encoding:<6} {level:>5} {ratio:>7.3f} {one_shot * 1000:>9.2f} {throughput:>8.1f} {streaming * 1000:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
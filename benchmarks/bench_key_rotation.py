@@ -0,0 +1,84 @@
+"""Measure data-key rotation throughput through `run_key_rotation`.
+
+Seeds one user with encrypted workouts and templates in a scratch SQLite database, starts a
+rotation the way `/users/encryption/rotate-key` does, then times the batched re-encryption.
+
+    python benchmarks/bench_key_rotation.py --rows 100000 --batch-size 500
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="workouts to re-encrypt")
+    parser.add_argument("--templates", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="wt-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}"
+    os.environ.setdefault("KDF_ITERATIONS", "10000")
+
+    from sqlalchemy import func, insert, select
+
+    from workout_tracker.database import adapter
+    from workout_tracker.encryption import EncryptionContext, EncryptionService
+    from workout_tracker.key_rotation import run_key_rotation, start_key_rotation
+    from workout_tracker.models import User, Workout, WorkoutTemplate
+
+    adapter.create_schema()
+    service = EncryptionService()
+    token = "bench-token"
+    salt, envelope, kdf_params = service.create_user_envelope(token)
+    with adapter.session() as db:
+        user = User(encryption_salt=salt, encrypted_data_key=envelope, kdf_params=kdf_params)
+        db.add(user)
+        db.flush()
+        user_id = user.id
+
+    data_key = service.unwrap_data_key(EncryptionContext(token, salt, envelope, kdf_params))
+    payload = {
+        "title": "Bench",
+        "start_time": "2024-01-01T08:00:00",
+        "sets": [{"exercise": f"Exercise {index % 4}", "reps": 5, "weight": 100, "unit": "kg"} for index in range(12)],
+    }
+    started = time.perf_counter()
+    with adapter.session() as db:
+        for offset in range(0, args.rows, 5000):
+            count = min(5000, args.rows - offset)
+            db.execute(
+                insert(Workout),
+                [{"user_id": user_id, "encrypted_payload": service.encrypt_payload(data_key, payload)} for _ in range(count)],
+            )
+        db.execute(
+            insert(WorkoutTemplate),
+            [
+                {"user_id": user_id, "encrypted_payload": service.encrypt_payload(data_key, payload)}
+                for _ in range(args.templates)
+            ],
+        )
+    print(f"seeded {args.rows} workouts + {args.templates} templates in {time.perf_counter() - started:.1f} s")
+
+    with adapter.session() as db:
+        user = db.get(User, user_id)
+        job, keyring = start_key_rotation(db, service, user, data_key, token)
+        job_id = job.id
+
+    started = time.perf_counter()
+    run_key_rotation(job_id, keyring, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+
+    with adapter.session() as db:
+        left = db.scalar(select(func.count()).select_from(Workout).where(Workout.key_generation < 2))
+    total = args.rows + args.templates
+    print(f"batch size {args.batch_size}: rotated {total} rows in {elapsed:.1f} s ({total / elapsed:.0f} rows/s)")
+    assert left == 0, f"{left} rows left under the retired key"
+
+
+if __name__ == "__main__":
+    main()
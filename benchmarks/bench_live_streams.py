@@ -0,0 +1,164 @@
+"""Hold thousands of idle live workout streams open and time fan-out of one edit to all of them.
+
+Starts the app under uvicorn against a scratch SQLite database, signs one user up, opens
+`--streams` concurrent `GET /workouts/{id}/live` connections, then reports the server's memory
+per stream, how long a `POST /workouts/{id}/sets` takes to reach every stream and whether every
+stream received its heartbeat.
+
+    python benchmarks/bench_live_streams.py --streams 5000 --heartbeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+WORKOUT = {"title": "Live", "start_time": "2024-01-01T08:00:00", "sets": []}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_mib(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _wait_until_up(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/healthz").status_code == 200:
+                return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise SystemExit("server did not start")
+
+
+class Stream:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    async def until(self, marker: bytes) -> float:
+        """Read until `marker` arrives and return when it did."""
+        await self.reader.readuntil(marker)
+        return time.perf_counter()
+
+
+async def _open(port: int, path: str, cookie: str) -> Stream:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\nCookie: {cookie}\r\n\r\n".encode()
+    )
+    await writer.drain()
+    stream = Stream(reader, writer)
+    head = await reader.readuntil(b"\r\n\r\n")
+    if not head.startswith(b"HTTP/1.1 200"):
+        raise RuntimeError(head.decode(errors="replace").splitlines()[0])
+    await stream.until(b"retry:")
+    return stream
+
+
+async def _run(args: argparse.Namespace, port: int, server: subprocess.Popen, cookie: str, workout_id: str) -> None:
+    base_url = f"http://127.0.0.1:{port}"
+    path = f"/workouts/{workout_id}/live"
+    idle_rss = _rss_mib(server.pid)
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+    async def open_one() -> Stream:
+        async with semaphore:
+            return await _open(port, path, cookie)
+
+    started = time.perf_counter()
+    streams = await asyncio.gather(*(open_one() for _ in range(args.streams)))
+    opened = time.perf_counter() - started
+    rss = _rss_mib(server.pid)
+    print(f"opened {len(streams)} streams in {opened:.1f} s")
+    per_stream = (rss - idle_rss) * 1024 / len(streams)
+    print(f"server RSS {idle_rss:.0f} MiB idle -> {rss:.0f} MiB ({per_stream:.1f} KiB/stream)")
+
+    async with httpx.AsyncClient(base_url=base_url, headers={"Cookie": cookie}) as client:
+        metrics = (await client.get("/metrics")).json()["live"]
+        print(f"/metrics live: {metrics}")
+        arrivals = [asyncio.create_task(stream.until(b"event: set.appended")) for stream in streams]
+        sent = time.perf_counter()
+        resp = await client.post(f"/workouts/{workout_id}/sets", json={"exercise": "Squat", "reps": 5})
+        acked = time.perf_counter()
+        assert resp.status_code == 201, resp.text
+        done = await asyncio.gather(*arrivals)
+    latencies = sorted(arrival - sent for arrival in done)
+    print(
+        f"set acknowledged in {(acked - sent) * 1000:.1f} ms; reached all streams in {latencies[-1] * 1000:.0f} ms "
+        f"(p50 {latencies[len(latencies) // 2] * 1000:.0f} ms)"
+    )
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(stream.until(b": ping") for stream in streams)), args.heartbeat * 2 + 10
+        )
+        print(f"heartbeat received on all {len(streams)} streams")
+    except asyncio.TimeoutError:
+        print("heartbeat missing on some streams")
+    for stream in streams:
+        stream.writer.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=5000)
+    parser.add_argument("--heartbeat", type=float, default=5, help="LIVE_HEARTBEAT_SECONDS for the server")
+    # EventSource clients reconnect after `retry:`, so setup arrives spread out rather than all at once.
+    parser.add_argument("--connect-concurrency", type=int, default=32)
+    parser.add_argument("--loop", default="auto", help="uvicorn event loop implementation")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="wt-bench-")
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}",
+        "KDF_ITERATIONS": "10000",
+        "RATE_LIMIT_ENABLED": "false",
+        "SCHEDULER_ENABLED": "false",
+        "LIVE_HEARTBEAT_SECONDS": str(args.heartbeat),
+        "LIVE_MAX_STREAMS_PER_USER": str(args.streams),
+        "AUTH_ORIGIN": f"http://127.0.0.1:{port}",
+        "FRONTEND_BASE_URL": f"http://127.0.0.1:{port}",
+    }
+    command = [
+        sys.executable, "-m", "uvicorn", "workout_tracker.app:app",
+        "--host", "127.0.0.1", "--port", str(port), "--loop", args.loop,
+        "--backlog", str(max(2048, args.connect_concurrency)), "--log-level", "warning",
+    ]  # fmt: skip
+    server = subprocess.Popen(command, env=env)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        _wait_until_up(base_url)
+        user = {"display_name": "Bench", "email": "bench@example.com", "encryption_token": "bench"}
+        resp = httpx.post(f"{base_url}/users", json=user)
+        assert resp.status_code == 201, resp.text
+        cookie = "; ".join(f"{name}={value}" for name, value in resp.cookies.items())
+        workout = httpx.post(f"{base_url}/workouts", json=WORKOUT, headers={"Cookie": cookie})
+        assert workout.status_code == 201, workout.text
+        asyncio.run(_run(args, port, server, cookie, workout.json()["id"]))
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+if __name__ == "__main__":
+    main()
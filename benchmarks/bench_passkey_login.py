@@ -0,0 +1,132 @@
+"""Measure passkey login throughput through `finish_authentication`.
+
+A software authenticator signs real ES256 assertions for users seeded into a scratch SQLite
+database; each login persists a challenge, then verifies and consumes it the way
+`/auth/passkey/login/complete` does (without the HTTP layer or the session write).
+
+    python benchmarks/bench_passkey_login.py --users 200 --logins 2000 --threads 4
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import secrets
+import tempfile
+import threading
+import time
+
+import cbor2
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def cose_public_key(private_key: ec.EllipticCurvePrivateKey) -> bytes:
+    numbers = private_key.public_key().public_numbers()
+    return cbor2.dumps({1: 2, 3: -7, -1: 1, -2: numbers.x.to_bytes(32, "big"), -3: numbers.y.to_bytes(32, "big")})
+
+
+def signed_assertion(
+    private_key: ec.EllipticCurvePrivateKey, credential_id: bytes, challenge: bytes, rp_id: str, origin: str, count: int
+) -> dict:
+    client_data = json.dumps({"type": "webauthn.get", "challenge": _b64(challenge), "origin": origin}).encode()
+    authenticator_data = hashlib.sha256(rp_id.encode()).digest() + b"\x05" + count.to_bytes(4, "big")
+    signature = private_key.sign(authenticator_data + hashlib.sha256(client_data).digest(), ec.ECDSA(hashes.SHA256()))
+    return {
+        "id": _b64(credential_id),
+        "rawId": _b64(credential_id),
+        "type": "public-key",
+        "response": {
+            "clientDataJSON": _b64(client_data),
+            "authenticatorData": _b64(authenticator_data),
+            "signature": _b64(signature),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--credentials-per-user", type=int, default=3)
+    parser.add_argument("--logins", type=int, default=2000, help="logins per thread")
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="wt-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}"
+
+    from workout_tracker.auth.challenge_store import get_challenge_store
+    from workout_tracker.auth.passkeys import _encode, finish_authentication
+    from workout_tracker.config import settings
+    from workout_tracker.database import adapter
+    from workout_tracker.models import PasskeyCredential, User
+
+    adapter.create_schema()
+    authenticators: list[tuple[ec.EllipticCurvePrivateKey, bytes]] = []
+    with adapter.session() as db:
+        for _ in range(args.users):
+            user = User(encryption_salt=b"salt", encrypted_data_key=b"key")
+            db.add(user)
+            for _ in range(args.credentials_per_user):
+                key = ec.generate_private_key(ec.SECP256R1())
+                credential_id = secrets.token_bytes(16)
+                db.add(PasskeyCredential(user=user, credential_id=credential_id, public_key=cose_public_key(key)))
+                authenticators.append((key, credential_id))
+
+    # Signing happens on the authenticator, not the server, so assertions are prepared up front.
+    # Each thread gets its own credentials so sign counts always increase in the order used.
+    store = get_challenge_store()
+    work: list[list[dict]] = []
+    for index in range(args.threads):
+        mine = authenticators[index :: args.threads]
+        counters = dict.fromkeys((credential_id for _, credential_id in mine), 0)
+        batch = []
+        with adapter.session() as db:
+            for _ in range(args.logins):
+                key, credential_id = random.choice(mine)
+                counters[credential_id] += 1
+                challenge = secrets.token_bytes(32)
+                store.persist(db, _encode(challenge), "authenticate")
+                batch.append(
+                    signed_assertion(
+                        key, credential_id, challenge, settings.auth_rp_id, settings.auth_origin, counters[credential_id]
+                    )
+                )
+        work.append(batch)
+
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def worker(batch: list[dict]) -> None:
+        local = []
+        for payload in batch:
+            started = time.perf_counter()
+            with adapter.session() as db:
+                finish_authentication(db, payload)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(batch,)) for batch in work]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{args.users} users x {args.credentials_per_user} credentials, {args.threads} threads")
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"logins/s {len(latencies) / elapsed:.0f}  p50 {p50:.2f} ms  p99 {p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
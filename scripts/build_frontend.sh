@@ -12,6 +12,15 @@ docker run --rm \
   node:20 \
   bash -lc "set -euo pipefail; npm install; npm run build"
 
+echo "==> Precompressing text assets..."
+# The API serves dist/foo.js.gz (and .br when brotli is installed) to clients that accept them.
+find "$FRONTEND_DIR/dist" -type f \( -name '*.js' -o -name '*.css' -o -name '*.html' -o -name '*.svg' -o -name '*.json' \) \
+  -size +1k -exec gzip -k -9 -f {} +
+if command -v brotli >/dev/null 2>&1; then
+  find "$FRONTEND_DIR/dist" -type f \( -name '*.js' -o -name '*.css' -o -name '*.html' -o -name '*.svg' -o -name '*.json' \) \
+    -size +1k -exec brotli -k -f -q 11 {} +
+fi
+
 echo "==> Syncing built assets into Python package..."
 mkdir -p "$STATIC_DIR"
 rsync -a --delete "$FRONTEND_DIR/dist/" "$STATIC_DIR/"
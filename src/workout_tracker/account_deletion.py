@@ -0,0 +1,113 @@
+"""Account deletion with set-based, batched DELETEs.
+
+Nothing here loads a user's workouts or templates into the session. Small accounts are
+removed inside the request; larger ones become an `AccountDeletion` job that deletes in
+bounded batches, each in its own short transaction, and can resume after a restart.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from .auth.session_store import get_session_store, key_handles
+from .cache import invalidate_user
+from .config import settings
+from .database import adapter
+from .models import AccountDeletion, PasskeyCredential, User, Workout, WorkoutTemplate
+from .user_cache import invalidate_on_commit
+
+logger = logging.getLogger(__name__)
+
+# Credentials go first so the account cannot be signed into while the rest is removed.
+_OWNED = (PasskeyCredential, Workout, WorkoutTemplate)
+STALE_AFTER = timedelta(minutes=5)
+
+
+def count_owned_rows(db: Session, user_id: str) -> int:
+    return sum(
+        db.scalar(select(func.count()).select_from(model).where(model.user_id == user_id)) or 0
+        for model in (Workout, WorkoutTemplate)
+    )
+
+
+def _delete_user_row(db: Session, user_id: str) -> None:
+    get_session_store().revoke_user(db, user_id)
+    key_handles.drop_user(user_id)
+    # Sessions, challenges and anything left over go with the user via ON DELETE CASCADE.
+    db.execute(delete(User).where(User.id == user_id).execution_options(synchronize_session=False))
+    invalidate_on_commit(db, user_id)
+    invalidate_user(user_id)
+
+
+def purge_account(db: Session, user_id: str) -> int:
+    """Delete a user and everything they own in the caller's transaction, one statement per table."""
+    removed = 0
+    for model in _OWNED:
+        stmt = delete(model).where(model.user_id == user_id).execution_options(synchronize_session=False)
+        removed += db.execute(stmt).rowcount or 0
+    _delete_user_row(db, user_id)
+    return removed
+
+
+def _delete_batch(model, user_id: str, batch_size: int) -> int:
+    batch = select(model.id).where(model.user_id == user_id).limit(batch_size).scalar_subquery()
+    with adapter.session() as db:
+        stmt = delete(model).where(model.id.in_(batch)).execution_options(synchronize_session=False)
+        return db.execute(stmt).rowcount or 0
+
+
+def _record(job_id: str, **values) -> None:
+    with adapter.session() as db:
+        db.execute(update(AccountDeletion).where(AccountDeletion.id == job_id).values(**values))
+
+
+def start_account_deletion(db: Session, user: User, total_rows: int) -> AccountDeletion:
+    user.is_active = False
+    job = AccountDeletion(user_id=user.id, total_rows=total_rows)
+    db.add(job)
+    db.flush()
+    return job
+
+
+def run_account_deletion(job_id: str, batch_size: int | None = None) -> None:
+    batch_size = batch_size or settings.account_deletion_batch_size
+    with adapter.session() as db:
+        job = db.get(AccountDeletion, job_id)
+        if job is None or job.status == "done":
+            return
+        user_id, deleted = job.user_id, job.deleted_rows
+    _record(job_id, status="running", error=None)
+    try:
+        for model in _OWNED:
+            while True:
+                removed = _delete_batch(model, user_id, batch_size)
+                if not removed:
+                    break
+                if model is not PasskeyCredential:
+                    deleted += removed
+                # Bumps updated_at too, which tells the resume job this run is alive.
+                _record(job_id, deleted_rows=deleted)
+        with adapter.session() as db:
+            _delete_user_row(db, user_id)
+    except Exception as exc:
+        logger.exception("Account deletion %s failed", job_id)
+        _record(job_id, status="failed", error=f"{type(exc).__name__}: {exc}")
+        return
+    _record(job_id, status="done")
+
+
+def resume_account_deletions() -> int:
+    """Pick up jobs whose worker died or failed; deletion is idempotent, so rerunning is safe."""
+    cutoff = datetime.now(timezone.utc) - STALE_AFTER
+    with adapter.session() as db:
+        job_ids = db.scalars(
+            select(AccountDeletion.id).where(
+                AccountDeletion.status != "done", AccountDeletion.updated_at < cutoff
+            )
+        ).all()
+    for job_id in job_ids:
+        run_account_deletion(job_id)
+    return len(job_ids)
@@ -1,28 +1,28 @@
 from __future__ import annotations
 
 import importlib.resources
+import math
+import secrets
+import sys
 from contextlib import asynccontextmanager
 from pathlib import Path
 
-import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 
+from . import cache
 from .config import settings
 from .database import adapter
-from .routers import templates, users, workouts
+from .routers import batch, templates, users, workouts
 from .auth import router as auth_router
-
-
-class SPAStaticFiles(StaticFiles):
-    async def get_response(self, path: str, scope):
-        try:
-            return await super().get_response(path, scope)
-        except HTTPException as exc:
-            if exc.status_code == 404:
-                return await super().get_response("index.html", scope)
-            raise
+from .compression import CompressionMiddleware
+from .encryption import KdfBusy
+from .live import hub as live_hub
+from .single_flight import single_flight
+from .loop_monitor import LoopLagMonitor
+from .spa import SPAStaticFiles
 
 
 def _static_dir() -> Path | None:
@@ -41,11 +41,49 @@ def _static_dir() -> Path | None:
         return None
 
 
+def require_metrics_token(authorization: str | None = Header(default=None)) -> None:
+    """`/metrics` exposes job errors and per-user-derived counts: bearer token only, outside dev."""
+    token = settings.metrics_token
+    if token is None:
+        if settings.environment == "dev":
+            return
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, supplied = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
 def create_app() -> FastAPI:
     @asynccontextmanager
-    async def lifespan(_: FastAPI):
-        adapter.create_schema()
-        yield
+    async def lifespan(app: FastAPI):
+        await run_in_threadpool(adapter.create_schema)
+        monitor = None
+        if settings.loop_lag_threshold_ms:
+            monitor = LoopLagMonitor(settings.loop_lag_threshold_ms / 1000)
+            monitor.start()
+        app.state.loop_monitor = monitor
+        scheduler = None
+        if settings.scheduler_enabled:
+            from .maintenance import build_scheduler
+
+            scheduler = build_scheduler()
+            scheduler.start()
+        app.state.scheduler = scheduler
+        try:
+            yield
+        finally:
+            if scheduler is not None:
+                await scheduler.stop()
+            # The Apple client is imported on first use; only close its pool if it was opened.
+            apple = sys.modules.get("workout_tracker.auth.apple")
+            if apple is not None:
+                await apple.apple_client.aclose()
+            if monitor is not None:
+                await monitor.stop()
 
     app = FastAPI(title="Workout Tracker", version=settings.environment, lifespan=lifespan)
 
@@ -56,19 +94,52 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    if settings.compression_enabled:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression_minimum_size,
+            level=settings.compression_level,
+        )
 
     app.include_router(auth_router.router)
     app.include_router(users.router)
     app.include_router(workouts.router)
     app.include_router(templates.router)
+    app.include_router(batch.router)
+
+    @app.exception_handler(KdfBusy)
+    async def kdf_busy(_: Request, exc: KdfBusy) -> JSONResponse:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server busy, retry shortly"},
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
 
     @app.get("/healthz")
     def healthcheck():
         return {"status": "ok"}
 
+    @app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+    def metrics(request: Request):
+        scheduler = getattr(request.app.state, "scheduler", None)
+        monitor = getattr(request.app.state, "loop_monitor", None)
+        body = {
+            "jobs": scheduler.stats() if scheduler is not None else {},
+            "live": live_hub.stats(),
+            "reads": single_flight.stats(),
+            "cache": cache.stats(),
+        }
+        if monitor is not None:
+            body["event_loop"] = monitor.stats()
+        return body
+
     static_dir = _static_dir()
     if static_dir and static_dir.exists():
-        app.mount("/", SPAStaticFiles(directory=static_dir, html=True), name="spa")
+        app.mount(
+            "/",
+            SPAStaticFiles(directory=static_dir, html=True, refresh_on_miss=settings.environment == "dev"),
+            name="spa",
+        )
 
     return app
 
@@ -77,4 +148,6 @@ app = create_app()
 
 
 def run() -> None:
+    import uvicorn
+
     uvicorn.run("workout_tracker.app:app", reload=settings.environment == "dev")
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import logging
+import re
 import time
 from typing import Any
 
@@ -9,71 +11,170 @@ import jwt
 
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
 APPLE_KEYS_URL = "https://appleid.apple.com/auth/keys"
 APPLE_TOKEN_URL = "https://appleid.apple.com/auth/token"
-_cached_keys: list[dict[str, Any]] | None = None
-_cache_expiration: float = 0
+APPLE_ISSUER = "https://appleid.apple.com"
+
+KEYS_TTL_SECONDS = 3600
+KEYS_REFRESH_AHEAD_SECONDS = 300
+# An unknown `kid` forces a refetch (Apple rotated keys), but no more often than this.
+KEYS_MIN_REFRESH_SECONDS = 60
+CLIENT_SECRET_TTL_SECONDS = 3600
+CLIENT_SECRET_RENEW_MARGIN_SECONDS = 60
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def _normalize_private_key(raw: str) -> str:
+    return raw.replace("\\n", "\n")
+
+
+def _log_refresh_failure(task: asyncio.Task[None]) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background refresh of Apple public keys failed: %s", task.exception())
+
+
+class AppleClient:
+    """Talks to Apple's token and key endpoints over one pooled connection set.
+
+    Public keys are parsed once and cached by `kid`. Shortly before they expire a single
+    background refresh is started while callers keep using the cached keys; when a refresh is
+    unavoidable, concurrent callers share one in-flight fetch. The signed client secret is
+    reused until it is close to expiry.
+    """
+
+    def __init__(
+        self,
+        keys_url: str = APPLE_KEYS_URL,
+        token_url: str = APPLE_TOKEN_URL,
+        *,
+        timeout: float = 10,
+        keys_ttl: float = KEYS_TTL_SECONDS,
+        refresh_ahead: float = KEYS_REFRESH_AHEAD_SECONDS,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.keys_url = keys_url
+        self.token_url = token_url
+        self.timeout = timeout
+        self.keys_ttl = keys_ttl
+        self.refresh_ahead = refresh_ahead
+        self._transport = transport
+        self._http: httpx.AsyncClient | None = None
+        self._keys: dict[str, Any] = {}
+        self._keys_fetched_at = 0.0
+        self._keys_expires_at = 0.0
+        self._refresh: asyncio.Task[None] | None = None
+        self._secret: tuple[tuple[Any, ...], str, float] | None = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+                transport=self._transport,
+            )
+        return self._http
 
+    async def aclose(self) -> None:
+        if self._refresh is not None and not self._refresh.done():
+            self._refresh.cancel()
+        self._refresh = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
 
-async def _fetch_keys() -> list[dict[str, Any]]:
-    global _cached_keys, _cache_expiration
-    if _cached_keys and _cache_expiration > time.time():
-        return _cached_keys
-    async with httpx.AsyncClient(timeout=10) as client:
-        resp = await client.get(APPLE_KEYS_URL)
+    async def _load_keys(self) -> None:
+        resp = await self.http.get(self.keys_url)
         resp.raise_for_status()
-        _cached_keys = resp.json().get("keys", [])
-        _cache_expiration = time.time() + 3600
-        return _cached_keys
+        parsed = {}
+        for jwk in resp.json().get("keys", []):
+            kid = jwk.get("kid")
+            if kid:
+                parsed[kid] = jwt.PyJWK(jwk).key
+        match = _MAX_AGE.search(resp.headers.get("cache-control", ""))
+        ttl = min(float(match.group(1)), self.keys_ttl) if match else self.keys_ttl
+        now = time.monotonic()
+        self._keys = parsed
+        self._keys_fetched_at = now
+        self._keys_expires_at = now + ttl
 
+    def _start_refresh(self) -> asyncio.Task[None]:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._load_keys())
+            self._refresh.add_done_callback(_log_refresh_failure)
+        return self._refresh
 
-async def verify_identity_token(identity_token: str, audience: str) -> dict[str, Any]:
-    header = jwt.get_unverified_header(identity_token)
-    keys = await _fetch_keys()
-    key = next((k for k in keys if k.get("kid") == header.get("kid")), None)
-    if not key:
-        raise ValueError("Apple public key not found")
-    public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key))
-    data = jwt.decode(
-        identity_token,
-        key=public_key,
-        algorithms=[header.get("alg", "RS256")],
-        audience=audience,
-        issuer="https://appleid.apple.com",
-        options={"verify_at_hash": False},
-    )
-    return data
+    async def _refresh_keys(self) -> None:
+        # Shielded so one cancelled caller does not abort the fetch the others are waiting on.
+        await asyncio.shield(self._start_refresh())
 
+    async def public_key(self, kid: str | None) -> Any:
+        now = time.monotonic()
+        if now >= self._keys_expires_at:
+            await self._refresh_keys()
+        elif kid not in self._keys and now - self._keys_fetched_at >= KEYS_MIN_REFRESH_SECONDS:
+            await self._refresh_keys()
+        elif now >= self._keys_expires_at - self.refresh_ahead:
+            self._start_refresh()
+        key = self._keys.get(kid) if kid else None
+        if key is None:
+            raise ValueError("Apple public key not found")
+        return key
 
-def _normalize_private_key(raw: str) -> str:
-    return raw.replace("\\n", "\n")
+    async def verify_identity_token(self, identity_token: str, audience: str) -> dict[str, Any]:
+        header = jwt.get_unverified_header(identity_token)
+        public_key = await self.public_key(header.get("kid"))
+        return jwt.decode(
+            identity_token,
+            key=public_key,
+            algorithms=[header.get("alg", "RS256")],
+            audience=audience,
+            issuer=APPLE_ISSUER,
+            options={"verify_at_hash": False},
+        )
+
+    def client_secret(self) -> str:
+        config = (settings.apple_team_id, settings.apple_client_id, settings.apple_key_id, settings.apple_private_key)
+        if not all(config):
+            raise ValueError("Apple Sign In is not fully configured")
+        now = int(time.time())
+        if self._secret is not None:
+            cached_for, secret, expires_at = self._secret
+            if cached_for == config and expires_at - CLIENT_SECRET_RENEW_MARGIN_SECONDS > now:
+                return secret
+        team_id, client_id, key_id, private_key = config
+        expires_at = now + CLIENT_SECRET_TTL_SECONDS
+        payload = {"iss": team_id, "iat": now, "exp": expires_at, "aud": APPLE_ISSUER, "sub": client_id}
+        headers = {"kid": key_id, "alg": "ES256"}
+        secret = jwt.encode(payload, _normalize_private_key(private_key), algorithm="ES256", headers=headers)
+        self._secret = (config, secret, expires_at)
+        return secret
+
+    async def exchange_authorization_code(self, code: str) -> dict[str, Any]:
+        data = {
+            "client_id": settings.apple_client_id,
+            "client_secret": self.client_secret(),
+            "code": code,
+            "grant_type": "authorization_code",
+        }
+        resp = await self.http.post(self.token_url, data=data)
+        resp.raise_for_status()
+        return resp.json()
+
+
+apple_client = AppleClient()
+
+
+async def verify_identity_token(identity_token: str, audience: str) -> dict[str, Any]:
+    return await apple_client.verify_identity_token(identity_token, audience)
 
 
 def generate_client_secret() -> str:
-    required = [settings.apple_team_id, settings.apple_client_id, settings.apple_key_id, settings.apple_private_key]
-    if not all(required):
-        raise ValueError("Apple Sign In is not fully configured")
-    now = int(time.time())
-    payload = {
-        "iss": settings.apple_team_id,
-        "iat": now,
-        "exp": now + 300,
-        "aud": "https://appleid.apple.com",
-        "sub": settings.apple_client_id,
-    }
-    headers = {"kid": settings.apple_key_id, "alg": "ES256"}
-    return jwt.encode(payload, _normalize_private_key(settings.apple_private_key), algorithm="ES256", headers=headers)
+    return apple_client.client_secret()
 
 
 async def exchange_authorization_code(code: str) -> dict[str, Any]:
-    client_secret = generate_client_secret()
-    data = {
-        "client_id": settings.apple_client_id,
-        "client_secret": client_secret,
-        "code": code,
-        "grant_type": "authorization_code",
-    }
-    async with httpx.AsyncClient(timeout=10) as client:
-        resp = await client.post(APPLE_TOKEN_URL, data=data)
-        resp.raise_for_status()
-        return resp.json()
+    return await apple_client.exchange_authorization_code(code)
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
+import heapq
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 
 from fastapi import HTTPException, status
 from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
 
 from ..config import settings
+from ..database import adapter
 from ..models import AuthChallenge, User
 
 
@@ -20,8 +27,12 @@ def _normalize(ts: datetime) -> datetime:
     return ts.astimezone(timezone.utc)
 
 
-def _as_naive(ts: datetime) -> datetime:
-    return ts.replace(tzinfo=None) if ts.tzinfo else ts
+def _missing() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Challenge not found or expired")
+
+
+def _expired() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Challenge expired")
 
 
 def purge_expired_challenges(db: Session) -> int:
@@ -33,7 +44,7 @@ def purge_expired_challenges(db: Session) -> int:
 
 
 def persist_challenge(db: Session, encoded: str, purpose: str, user: User | None = None) -> AuthChallenge:
-    purge_expired_challenges(db)
+    # Expired rows are purged by the background sweeper, not on the request path.
     record = AuthChallenge(user=user, challenge=encoded, purpose=purpose)
     db.add(record)
     db.flush()
@@ -46,12 +57,112 @@ def consume_challenge(db: Session, encoded: str, purpose: str, user: User | None
         stmt = stmt.where(AuthChallenge.user_id == user.id)
     record = db.scalar(stmt)
     if not record:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Challenge not found or expired")
+        raise _missing()
     age = _now() - _normalize(record.created_at)
     if age.total_seconds() > settings.challenge_ttl_seconds:
         db.delete(record)
         db.flush()
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Challenge expired")
+        raise _expired()
     db.delete(record)
     db.flush()
     return record
+
+
+@dataclass(slots=True)
+class StoredChallenge:
+    challenge: str
+    purpose: str
+    user_id: str | None
+    created_at: datetime
+
+
+class ChallengeStore(ABC):
+    """Single-use WebAuthn challenges. `db` is the request's session; the SQL backend uses it."""
+
+    @abstractmethod
+    def persist(self, db: Session, encoded: str, purpose: str, user: User | None = None) -> StoredChallenge:
+        ...
+
+    @abstractmethod
+    def consume(self, db: Session, encoded: str, purpose: str, user: User | None = None) -> StoredChallenge:
+        ...
+
+    @abstractmethod
+    def purge_expired(self, db: Session) -> int:
+        ...
+
+
+class SqlChallengeStore(ChallengeStore):
+    """Challenges in `auth_challenges`, shared by every worker and replica."""
+
+    def persist(self, db: Session, encoded: str, purpose: str, user: User | None = None) -> StoredChallenge:
+        record = persist_challenge(db, encoded, purpose, user)
+        return StoredChallenge(record.challenge, record.purpose, record.user_id, record.created_at)
+
+    def consume(self, db: Session, encoded: str, purpose: str, user: User | None = None) -> StoredChallenge:
+        record = consume_challenge(db, encoded, purpose, user)
+        return StoredChallenge(record.challenge, record.purpose, record.user_id, record.created_at)
+
+    def purge_expired(self, db: Session) -> int:
+        return purge_expired_challenges(db)
+
+
+class MemoryChallengeStore(ChallengeStore):
+    """Process-local challenges with heap-ordered expiry, for single-node deployments."""
+
+    def __init__(self) -> None:
+        self._records: dict[str, tuple[StoredChallenge, float]] = {}
+        self._expiry: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def persist(self, db: Session, encoded: str, purpose: str, user: User | None = None) -> StoredChallenge:
+        record = StoredChallenge(encoded, purpose, user.id if user else None, _now())
+        expires_at = time.monotonic() + settings.challenge_ttl_seconds
+        with self._lock:
+            self._records[encoded] = (record, expires_at)
+            heapq.heappush(self._expiry, (expires_at, encoded))
+        return record
+
+    def consume(self, db: Session, encoded: str, purpose: str, user: User | None = None) -> StoredChallenge:
+        with self._lock:
+            entry = self._records.get(encoded)
+            if entry is None or entry[0].purpose != purpose or (user and entry[0].user_id != user.id):
+                raise _missing()
+            del self._records[encoded]
+        record, expires_at = entry
+        if expires_at < time.monotonic():
+            raise _expired()
+        return record
+
+    def purge_expired(self, db: Session) -> int:
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, encoded = heapq.heappop(self._expiry)
+                entry = self._records.get(encoded)
+                # Consumed or re-issued challenges leave stale heap entries behind; skip them.
+                if entry is not None and entry[1] == expires_at:
+                    del self._records[encoded]
+                    removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+@lru_cache
+def _build_store(backend: str) -> ChallengeStore:
+    if backend == "memory":
+        return MemoryChallengeStore()
+    return SqlChallengeStore()
+
+
+def get_challenge_store() -> ChallengeStore:
+    return _build_store(settings.challenge_backend)
+
+
+def sweep_expired_challenges() -> int:
+    with adapter.session() as db:
+        return get_challenge_store().purge_expired(db)
+
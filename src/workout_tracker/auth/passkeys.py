@@ -6,7 +6,7 @@ from datetime import datetime, timezone
 
 from fastapi import HTTPException, status
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from webauthn import (
     generate_authentication_options,
     generate_registration_options,
@@ -14,7 +14,6 @@ from webauthn import (
     verify_registration_response,
 )
 from webauthn.helpers import options_to_json
-from webauthn.helpers.exceptions import InvalidAuthenticationResponse, InvalidRegistrationResponse
 from webauthn.helpers.structs import (
     AuthenticationCredential,
     AuthenticatorAssertionResponse,
@@ -29,7 +28,7 @@ from webauthn.helpers.structs import (
 from ..config import settings
 from ..encryption import EncryptionService
 from ..models import PasskeyCredential, User
-from .challenge_store import consume_challenge, persist_challenge
+from .challenge_store import get_challenge_store
 
 RP_NAME = "Workout Tracker"
 
@@ -64,9 +63,12 @@ def _normalize_keys(data: dict, mapping: dict[str, str], decode_keys: set[str])
     return normalized
 
 
-def _extract_client_challenge(client_data_json: bytes) -> bytes:
-    payload = json.loads(client_data_json.decode("utf-8"))
-    value = payload.get("challenge", "")
+def _parse_client_data(client_data_json: bytes) -> dict:
+    return json.loads(client_data_json.decode("utf-8"))
+
+
+def _extract_client_challenge(client_data: dict) -> bytes:
+    value = client_data.get("challenge", "")
     padding = "=" * (-len(value) % 4)
     return base64.urlsafe_b64decode(value + padding)
 
@@ -79,17 +81,26 @@ def _allowed_origins() -> list[str]:
     return origins
 
 
+def _expected_origin(client_data: dict) -> str | list[str]:
+    # Use the origin the client reports when we accept it, so the signature is checked once.
+    # Otherwise pass every allowed origin and let webauthn reject the response before verifying.
+    allowed = _allowed_origins()
+    origin = client_data.get("origin")
+    return origin if origin in allowed else allowed
+
+
 def _persist_challenge(db: Session, challenge: bytes, purpose: str, user: User | None = None) -> None:
-    persist_challenge(db, _encode(challenge), purpose, user)
+    get_challenge_store().persist(db, _encode(challenge), purpose, user)
 
 
 def _pull_challenge(
     db: Session, challenge_bytes: bytes, purpose: str, user: User | None = None
 ) -> tuple[bytes, User | None]:
     target = _encode(challenge_bytes)
-    record = consume_challenge(db, target, purpose, user)
+    record = get_challenge_store().consume(db, target, purpose, user)
     decoded = base64.urlsafe_b64decode(record.challenge.encode("ascii"))
-    return decoded, record.user
+    challenge_user = db.get(User, record.user_id) if record.user_id else None
+    return decoded, challenge_user
 
 
 def _derive_encryption_token(raw_id: bytes) -> str:
@@ -141,7 +152,8 @@ def finish_registration(
     user_handle = response_payload.get("user_handle")
     response_obj = AuthenticatorAttestationResponse(**response_payload)
     credential = RegistrationCredential(response=response_obj, **normalized)
-    client_challenge = _extract_client_challenge(credential.response.client_data_json)
+    client_data = _parse_client_data(credential.response.client_data_json)
+    client_challenge = _extract_client_challenge(client_data)
     challenge_bytes, challenge_user = _pull_challenge(
         db, client_challenge, purpose="register", user=current_user
     )
@@ -149,21 +161,13 @@ def finish_registration(
     if not target_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Registration context missing user")
 
-    last_error: InvalidRegistrationResponse | None = None
-    for origin in _allowed_origins():
-        try:
-            verification = verify_registration_response(
-                credential=credential,
-                expected_challenge=challenge_bytes,
-                expected_rp_id=settings.auth_rp_id,
-                expected_origin=origin,
-                require_user_verification=True,
-            )
-            break
-        except InvalidRegistrationResponse as exc:
-            last_error = exc
-    else:
-        raise last_error or HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Registration failed")
+    verification = verify_registration_response(
+        credential=credential,
+        expected_challenge=challenge_bytes,
+        expected_rp_id=settings.auth_rp_id,
+        expected_origin=_expected_origin(client_data),
+        require_user_verification=True,
+    )
     record = PasskeyCredential(
         user=target_user,
         credential_id=verification.credential_id,
@@ -174,9 +178,10 @@ def finish_registration(
     if user_handle:
         target_user.passkey_user_handle = user_handle
     encryption_token = _derive_encryption_token(credential.raw_id)
-    salt, envelope = encryption_service.create_user_envelope(encryption_token)
+    salt, envelope, kdf_params = encryption_service.create_user_envelope(encryption_token)
     target_user.encryption_salt = salt
     target_user.encrypted_data_key = envelope
+    target_user.kdf_params = kdf_params
     db.add(record)
     return target_user, encryption_token
 
@@ -211,36 +216,27 @@ def finish_authentication(db: Session, payload: dict) -> tuple[User, str]:
     response_payload = _normalize_keys(payload.get("response", {}) or {}, response_map, decode_fields)
     response_obj = AuthenticatorAssertionResponse(**response_payload)
     credential = AuthenticationCredential(response=response_obj, **normalized)
-    client_challenge = _extract_client_challenge(credential.response.client_data_json)
+    client_data = _parse_client_data(credential.response.client_data_json)
+    client_challenge = _extract_client_challenge(client_data)
     challenge, _ = _pull_challenge(db, client_challenge, purpose="authenticate")
-    user = db.scalar(
-        select(User).join(PasskeyCredential).where(PasskeyCredential.credential_id == credential.raw_id)
+    stored_cred = db.scalar(
+        select(PasskeyCredential)
+        .options(joinedload(PasskeyCredential.user))
+        .where(PasskeyCredential.credential_id == credential.raw_id)
     )
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Credential not registered")
-
-    stored_cred = next((c for c in user.credentials if c.credential_id == credential.raw_id), None)
     if not stored_cred:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Credential mismatch")
-
-    last_error: InvalidAuthenticationResponse | None = None
-    verification = None
-    for origin in _allowed_origins():
-        try:
-            verification = verify_authentication_response(
-                credential=credential,
-                expected_challenge=challenge,
-                expected_rp_id=settings.auth_rp_id,
-                expected_origin=origin,
-                credential_public_key=stored_cred.public_key,
-                credential_current_sign_count=stored_cred.sign_count,
-                require_user_verification=True,
-            )
-            break
-        except InvalidAuthenticationResponse as exc:
-            last_error = exc
-    if not verification:
-        raise last_error or HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Authentication failed")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Credential not registered")
+    user = stored_cred.user
+
+    verification = verify_authentication_response(
+        credential=credential,
+        expected_challenge=challenge,
+        expected_rp_id=settings.auth_rp_id,
+        expected_origin=_expected_origin(client_data),
+        credential_public_key=stored_cred.public_key,
+        credential_current_sign_count=stored_cred.sign_count,
+        require_user_verification=True,
+    )
     stored_cred.sign_count = verification.new_sign_count
     stored_cred.last_used_at = datetime.now(timezone.utc)
     encryption_token = _derive_encryption_token(credential.raw_id)
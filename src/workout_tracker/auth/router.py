@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-from typing import cast
+from typing import Any, cast
 import secrets
 
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 from sqlalchemy import select
 from sqlalchemy.orm import Session
@@ -12,18 +13,27 @@ from ..config import settings
 from ..deps import get_current_user, get_db, get_encryption_service, maybe_current_user
 from ..encryption import EncryptionService
 from ..models import User
+from ..rate_limit import rate_limit
 from ..schemas import UserRead
-from .apple import exchange_authorization_code, verify_identity_token
-from .passkeys import (
-    begin_authentication,
-    begin_registration,
-    finish_authentication,
-    finish_registration,
-)
 from .sessions import attach_session_cookie, clear_session_cookie
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# The Apple (httpx + jwt) and passkey (webauthn) stacks are imported on first use so that
+# importing the app, or running the CLI, does not pay for them.
+
+
+async def exchange_authorization_code(code: str) -> dict[str, Any]:
+    from . import apple
+
+    return await apple.exchange_authorization_code(code)
+
+
+async def verify_identity_token(identity_token: str, audience: str) -> dict[str, Any]:
+    from . import apple
+
+    return await apple.verify_identity_token(identity_token, audience)
+
 
 def _serialize(user: User | None) -> UserRead | None:
     if not user:
@@ -43,8 +53,12 @@ def get_session(user: User | None = Depends(maybe_current_user)) -> UserRead | N
 
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
-def logout(response: Response) -> None:
-    clear_session_cookie(response)
+def logout(
+    response: Response,
+    db: Session = Depends(get_db),
+    session_token: str | None = Cookie(default=None, alias="session"),
+) -> None:
+    clear_session_cookie(db, response, session_token)
 
 
 class PasskeyLoginBegin(BaseModel):
@@ -53,6 +67,8 @@ class PasskeyLoginBegin(BaseModel):
 
 @router.post("/passkey/login/begin")
 def passkey_login_begin(payload: PasskeyLoginBegin, db: Session = Depends(get_db)):
+    from .passkeys import begin_authentication
+
     user = None
     if payload.email:
         user = db.scalar(select(User).where(User.email == payload.email.lower()))
@@ -65,8 +81,10 @@ def passkey_login_complete(
     response: Response,
     db: Session = Depends(get_db),
 ) -> UserRead:
+    from .passkeys import finish_authentication
+
     user, encryption_token = finish_authentication(db, payload)
-    attach_session_cookie(response, user.id, encryption_token=encryption_token)
+    attach_session_cookie(db, response, user.id, encryption_token=encryption_token)
     return cast(UserRead, _serialize(user))
 
 
@@ -75,12 +93,18 @@ class PasskeyRegisterBeginResponse(BaseModel):
     encryption_token: str | None = None
 
 
-@router.post("/passkey/register/begin", response_model=PasskeyRegisterBeginResponse)
+@router.post(
+    "/passkey/register/begin",
+    response_model=PasskeyRegisterBeginResponse,
+    dependencies=[Depends(rate_limit("passkey.register_begin"))],
+)
 def passkey_register_begin(
     db: Session = Depends(get_db),
     encryption_service: EncryptionService = Depends(get_encryption_service),
     user: User | None = Depends(maybe_current_user),
 ) -> PasskeyRegisterBeginResponse:
+    from .passkeys import begin_registration
+
     if user:
         options = begin_registration(db, user)
         return PasskeyRegisterBeginResponse(options=options, encryption_token=None)
@@ -96,7 +120,11 @@ def passkey_register_begin(
     return PasskeyRegisterBeginResponse(options=options, encryption_token=secrets.token_urlsafe(32))
 
 
-@router.post("/passkey/register/complete", response_model=UserRead)
+@router.post(
+    "/passkey/register/complete",
+    response_model=UserRead,
+    dependencies=[Depends(rate_limit("passkey.register_complete"))],
+)
 def passkey_register_complete(
     payload: dict,
     response: Response,
@@ -104,8 +132,10 @@ def passkey_register_complete(
     user: User | None = Depends(maybe_current_user),
     encryption_service: EncryptionService = Depends(get_encryption_service),
 ) -> UserRead:
+    from .passkeys import finish_registration
+
     registered_user, encryption_token = finish_registration(db, payload, user, encryption_service=encryption_service)
-    attach_session_cookie(response, registered_user.id, encryption_token=encryption_token)
+    attach_session_cookie(db, response, registered_user.id, encryption_token=encryption_token)
     return cast(UserRead, _serialize(registered_user))
 
 
@@ -115,7 +145,7 @@ class AppleAuthPayload(BaseModel):
     encryption_token: str | None = None
 
 
-@router.post("/apple/complete", response_model=UserRead)
+@router.post("/apple/complete", response_model=UserRead, dependencies=[Depends(rate_limit("apple.complete"))])
 async def apple_complete(
     payload: AppleAuthPayload,
     response: Response,
@@ -133,21 +163,42 @@ async def apple_complete(
     email = email_raw.lower() if isinstance(email_raw, str) else None
     if not email:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Apple token missing email")
+    # Lookup, KDF and session writes are blocking; keep them off the event loop.
+    return await run_in_threadpool(
+        _provision_apple_user,
+        db,
+        response,
+        encryption_service,
+        email,
+        payload.display_name or claims.get("name"),
+        payload.encryption_token,
+    )
+
+
+def _provision_apple_user(
+    db: Session,
+    response: Response,
+    encryption_service: EncryptionService,
+    email: str,
+    display_name: str | None,
+    encryption_token: str | None,
+) -> UserRead:
     user = db.scalar(select(User).where(User.email == email))
     if not user:
-        if not payload.encryption_token:
+        if not encryption_token:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="encryption_token required when provisioning with Apple",
             )
-        salt, envelope = encryption_service.create_user_envelope(payload.encryption_token)
+        salt, envelope, kdf_params = encryption_service.create_user_envelope(encryption_token)
         user = User(
             email=email,
-            display_name=payload.display_name or claims.get("name"),
+            display_name=display_name,
             encryption_salt=salt,
             encrypted_data_key=envelope,
+            kdf_params=kdf_params,
         )
         db.add(user)
         db.flush()
-    attach_session_cookie(response, user.id, encryption_token=payload.encryption_token)
+    attach_session_cookie(db, response, user.id, encryption_token=encryption_token)
     return cast(UserRead, _serialize(user))
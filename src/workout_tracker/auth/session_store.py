@@ -0,0 +1,278 @@
+"""Server-side session storage backends."""
+from __future__ import annotations
+
+import base64
+import json
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import AuthSession
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _normalize(ts: datetime) -> datetime:
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+@dataclass(slots=True)
+class SessionRecord:
+    key: str
+    user_id: str
+    expires_at: datetime
+    sealed_token: bytes | None = None
+
+    @property
+    def expired(self) -> bool:
+        return _normalize(self.expires_at) <= _now()
+
+
+class SessionStore(ABC):
+    """Keyed session storage. `db` is the request's session; only the SQL backend uses it."""
+
+    @abstractmethod
+    def create(self, db: Session, record: SessionRecord) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, db: Session, key: str) -> SessionRecord | None:
+        ...
+
+    @abstractmethod
+    def revoke(self, db: Session, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def revoke_user(self, db: Session, user_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def purge_expired(self, db: Session) -> int:
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; sessions do not survive restarts or span workers."""
+
+    def __init__(self) -> None:
+        self._records: dict[str, SessionRecord] = {}
+        self._lock = threading.Lock()
+
+    def create(self, db: Session, record: SessionRecord) -> None:
+        with self._lock:
+            self._records[record.key] = record
+
+    def get(self, db: Session, key: str) -> SessionRecord | None:
+        record = self._records.get(key)
+        if record is not None and record.expired:
+            self.revoke(db, key)
+            return None
+        return record
+
+    def revoke(self, db: Session, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
+
+    def revoke_user(self, db: Session, user_id: str) -> None:
+        with self._lock:
+            for key in [key for key, record in self._records.items() if record.user_id == user_id]:
+                del self._records[key]
+
+    def purge_expired(self, db: Session) -> int:
+        with self._lock:
+            stale = [key for key, record in self._records.items() if record.expired]
+            for key in stale:
+                del self._records[key]
+        return len(stale)
+
+
+class SqlSessionStore(SessionStore):
+    """Stores sessions in `auth_sessions`; lookups are primary-key fetches in the request transaction."""
+
+    def create(self, db: Session, record: SessionRecord) -> None:
+        db.add(
+            AuthSession(
+                id=record.key,
+                user_id=record.user_id,
+                sealed_token=record.sealed_token,
+                expires_at=record.expires_at,
+            )
+        )
+        db.flush()
+
+    def get(self, db: Session, key: str) -> SessionRecord | None:
+        row = db.get(AuthSession, key)
+        if row is None:
+            return None
+        record = SessionRecord(key=row.id, user_id=row.user_id, expires_at=row.expires_at, sealed_token=row.sealed_token)
+        if record.expired:
+            db.delete(row)
+            db.flush()
+            return None
+        return record
+
+    def revoke(self, db: Session, key: str) -> None:
+        db.execute(delete(AuthSession).where(AuthSession.id == key).execution_options(synchronize_session=False))
+
+    def revoke_user(self, db: Session, user_id: str) -> None:
+        db.execute(
+            delete(AuthSession).where(AuthSession.user_id == user_id).execution_options(synchronize_session=False)
+        )
+
+    def purge_expired(self, db: Session) -> int:
+        result = db.execute(
+            delete(AuthSession).where(AuthSession.expires_at < _now()).execution_options(synchronize_session=False)
+        )
+        return result.rowcount or 0
+
+
+class FileSessionStore(SessionStore):
+    """One JSON file per session under a local directory, shared by workers on the same host."""
+
+    def __init__(self, directory: str | os.PathLike[str]) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        # Keys are hex digests, so they are always safe file names.
+        return self.directory / f"{key}.json"
+
+    def create(self, db: Session, record: SessionRecord) -> None:
+        payload = {
+            "user_id": record.user_id,
+            "expires_at": _normalize(record.expires_at).isoformat(),
+            "sealed_token": base64.b64encode(record.sealed_token).decode("ascii") if record.sealed_token else None,
+        }
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(payload, handle)
+        os.replace(tmp, self._path(record.key))
+
+    def _read(self, path: Path) -> SessionRecord | None:
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        sealed = payload.get("sealed_token")
+        return SessionRecord(
+            key=path.stem,
+            user_id=payload["user_id"],
+            expires_at=datetime.fromisoformat(payload["expires_at"]),
+            sealed_token=base64.b64decode(sealed) if sealed else None,
+        )
+
+    def get(self, db: Session, key: str) -> SessionRecord | None:
+        record = self._read(self._path(key))
+        if record is not None and record.expired:
+            self.revoke(db, key)
+            return None
+        return record
+
+    def revoke(self, db: Session, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def revoke_user(self, db: Session, user_id: str) -> None:
+        for path in self.directory.glob("*.json"):
+            record = self._read(path)
+            if record is not None and record.user_id == user_id:
+                path.unlink(missing_ok=True)
+
+    def purge_expired(self, db: Session) -> int:
+        removed = 0
+        for path in self.directory.glob("*.json"):
+            record = self._read(path)
+            if record is not None and record.expired:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+@lru_cache
+def _build_store(backend: str, file_dir: str) -> SessionStore:
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "file":
+        return FileSessionStore(file_dir)
+    return SqlSessionStore()
+
+
+def get_session_store() -> SessionStore:
+    return _build_store(settings.session_backend, settings.session_file_dir)
+
+
+@dataclass(slots=True)
+class _KeyHandle:
+    user_id: str
+    encryption_version: int
+    data_key: bytes
+    idle_deadline: float
+
+
+class KeyHandleCache:
+    """Unwrapped data keys per session, held only in process memory with a sliding idle timeout.
+
+    A warm session skips the KDF entirely; a cold one (new worker, restart, idle expiry) pays it
+    once and repopulates the handle.
+    """
+
+    def __init__(self) -> None:
+        self._handles: dict[str, _KeyHandle] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_key: str, user_id: str, encryption_version: int) -> bytes | None:
+        idle = settings.session_key_idle_seconds
+        handle = self._handles.get(session_key)
+        if handle is None or idle <= 0:
+            return None
+        now = time.monotonic()
+        if (
+            handle.idle_deadline <= now
+            or handle.user_id != user_id
+            or handle.encryption_version != encryption_version
+        ):
+            self.drop(session_key)
+            return None
+        handle.idle_deadline = now + idle
+        return handle.data_key
+
+    def put(self, session_key: str, user_id: str, encryption_version: int, data_key: bytes) -> None:
+        idle = settings.session_key_idle_seconds
+        if idle <= 0:
+            return
+        with self._lock:
+            self._handles[session_key] = _KeyHandle(user_id, encryption_version, data_key, time.monotonic() + idle)
+
+    def drop(self, session_key: str) -> None:
+        with self._lock:
+            self._handles.pop(session_key, None)
+
+    def drop_user(self, user_id: str) -> None:
+        with self._lock:
+            for key in [key for key, handle in self._handles.items() if handle.user_id == user_id]:
+                del self._handles[key]
+
+    def purge_idle(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            stale = [key for key, handle in self._handles.items() if handle.idle_deadline <= now]
+            for key in stale:
+                del self._handles[key]
+        return len(stale)
+
+
+key_handles = KeyHandleCache()
@@ -1,48 +1,113 @@
 from __future__ import annotations
 
+import base64
+import hashlib
+import secrets
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from fastapi import Response
-from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy.orm import Session
 
 from ..config import settings
+from ..live import close_after_commit
+from .session_store import SessionRecord, get_session_store, key_handles
+from .tickets import clear_ticket
 
 SESSION_MAX_AGE = 60 * 60 * 24 * 7  # 7 days
+SESSION_COOKIE = "session"
+
 
+def _session_key(session_id: str) -> str:
+    # Only the digest is stored, so a leaked store cannot be replayed as cookies.
+    return hashlib.sha256(session_id.encode("ascii")).hexdigest()
 
-def _serializer() -> URLSafeTimedSerializer:
-    return URLSafeTimedSerializer(settings.session_secret, salt="workout-tracker-session")
 
+def _sealing_key(session_id: str) -> Fernet:
+    # The encryption token is sealed under a key only the cookie holder (plus the server secret)
+    # can derive. HKDF is cheap, unlike the PBKDF2 that protects the data key itself.
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=settings.session_secret.encode("utf-8"),
+        info=b"workout-tracker-session-token",
+    )
+    return Fernet(base64.urlsafe_b64encode(hkdf.derive(session_id.encode("ascii"))))
 
-def create_session_token(user_id: str, encryption_token: str | None = None) -> str:
-    payload: dict[str, str] = {"user_id": user_id}
-    if encryption_token:
-        payload["encryption_token"] = encryption_token
-    return _serializer().dumps(payload)
 
+@dataclass(slots=True)
+class SessionState:
+    session_id: str
+    key: str
+    user_id: str
+    sealed_token: bytes | None
 
-def resolve_session(token: str | None) -> dict[str, str] | None:
-    if not token:
-        return None
-    try:
-        payload = _serializer().loads(token, max_age=SESSION_MAX_AGE)
-        if not isinstance(payload, dict):
+    @property
+    def encryption_token(self) -> str | None:
+        if not self.sealed_token:
             return None
-        if "user_id" not in payload:
+        try:
+            return _sealing_key(self.session_id).decrypt(self.sealed_token).decode("utf-8")
+        except InvalidToken:
             return None
-        return payload
-    except BadSignature:
+
+
+def create_session(db: Session, user_id: str, encryption_token: str | None = None) -> str:
+    session_id = secrets.token_urlsafe(32)
+    sealed = _sealing_key(session_id).encrypt(encryption_token.encode("utf-8")) if encryption_token else None
+    record = SessionRecord(
+        key=_session_key(session_id),
+        user_id=user_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=SESSION_MAX_AGE),
+        sealed_token=sealed,
+    )
+    get_session_store().create(db, record)
+    return session_id
+
+
+def resolve_session(db: Session, session_id: str | None) -> SessionState | None:
+    if not session_id:
         return None
+    record = get_session_store().get(db, _session_key(session_id))
+    if record is None:
+        return None
+    return SessionState(session_id=session_id, key=record.key, user_id=record.user_id, sealed_token=record.sealed_token)
+
+
+def revoke_session(db: Session, session_id: str | None) -> None:
+    if not session_id:
+        return
+    key = _session_key(session_id)
+    get_session_store().revoke(db, key)
+    key_handles.drop(key)
+    close_after_commit(db, session_key=key)
+
+
+def revoke_user_sessions(db: Session, user_id: str) -> None:
+    get_session_store().revoke_user(db, user_id)
+    key_handles.drop_user(user_id)
+    close_after_commit(db, user_id=user_id)
 
 
-def attach_session_cookie(response: Response, user_id: str, encryption_token: str | None = None) -> None:
+def attach_session_cookie(
+    db: Session, response: Response, user_id: str, encryption_token: str | None = None
+) -> str:
+    session_id = create_session(db, user_id, encryption_token)
     response.set_cookie(
-        key="session",
-        value=create_session_token(user_id, encryption_token),
+        key=SESSION_COOKIE,
+        value=session_id,
         max_age=SESSION_MAX_AGE,
         httponly=True,
         secure=settings.environment == "prod",
         samesite="lax",
     )
+    return session_id
 
 
-def clear_session_cookie(response: Response) -> None:
-    response.delete_cookie("session")
+def clear_session_cookie(db: Session, response: Response, session_id: str | None = None) -> None:
+    revoke_session(db, session_id)
+    response.delete_cookie(SESSION_COOKIE)
+    clear_ticket(response)
@@ -0,0 +1,111 @@
+"""Short-lived data-key tickets that let any replica skip PBKDF2.
+
+After a successful unwrap the server seals the data key under a rotating secret it shares with
+every replica and hands the result back as a cookie (and `X-Data-Key-Ticket` header). Opening a
+ticket is one AES-GCM decrypt. Tickets are bound to the user id and `encryption_version`, so they
+die with an envelope rotation, and the sealing key rotates every
+`DATA_KEY_TICKET_ROTATION_SECONDS` with the previous epoch still accepted as an overlap window.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import os
+import struct
+import time
+from functools import lru_cache
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from fastapi import Response
+
+from ..config import settings
+
+TICKET_COOKIE = "dk_ticket"
+TICKET_HEADER = "X-Data-Key-Ticket"
+TICKET_VERSION = 1
+_HEADER = struct.Struct(">BQ")  # version, epoch
+_EXPIRY = struct.Struct(">Q")
+_NONCE_BYTES = 12
+
+
+def _secrets() -> list[str]:
+    current = settings.data_key_ticket_secret or settings.session_secret
+    previous = settings.data_key_ticket_previous_secret
+    return [current, previous] if previous else [current]
+
+
+@lru_cache(maxsize=16)
+def _epoch_key(secret: str, epoch: int) -> AESGCM:
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=b"workout-tracker-data-key-ticket",
+        info=f"epoch:{epoch}".encode("ascii"),
+    )
+    return AESGCM(hkdf.derive(secret.encode("utf-8")))
+
+
+def _current_epoch(now: float) -> int:
+    return int(now // settings.data_key_ticket_rotation_seconds)
+
+
+def _aad(user_id: str, encryption_version: int, epoch: int) -> bytes:
+    return f"{user_id}:{encryption_version}:{epoch}".encode("utf-8")
+
+
+def seal_ticket(data_key: bytes, user_id: str, encryption_version: int, now: float | None = None) -> str:
+    now = time.time() if now is None else now
+    epoch = _current_epoch(now)
+    nonce = os.urandom(_NONCE_BYTES)
+    plaintext = _EXPIRY.pack(int(now) + settings.data_key_ticket_ttl_seconds) + data_key
+    sealed = _epoch_key(_secrets()[0], epoch).encrypt(nonce, plaintext, _aad(user_id, encryption_version, epoch))
+    raw = _HEADER.pack(TICKET_VERSION, epoch) + nonce + sealed
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def open_ticket(ticket: str, user_id: str, encryption_version: int, now: float | None = None) -> bytes | None:
+    """Return the sealed data key, or None if the ticket is malformed, foreign, stale or expired."""
+    now = time.time() if now is None else now
+    try:
+        raw = base64.urlsafe_b64decode(ticket + "=" * (-len(ticket) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if len(raw) <= _HEADER.size + _NONCE_BYTES:
+        return None
+    version, epoch = _HEADER.unpack_from(raw)
+    current = _current_epoch(now)
+    if version != TICKET_VERSION or not current - 1 <= epoch <= current:
+        return None
+    nonce = raw[_HEADER.size : _HEADER.size + _NONCE_BYTES]
+    sealed = raw[_HEADER.size + _NONCE_BYTES :]
+    aad = _aad(user_id, encryption_version, epoch)
+    for secret in _secrets():
+        try:
+            plaintext = _epoch_key(secret, epoch).decrypt(nonce, sealed, aad)
+        except InvalidTag:
+            continue
+        (expires_at,) = _EXPIRY.unpack_from(plaintext)
+        if expires_at < now:
+            return None
+        return plaintext[_EXPIRY.size :]
+    return None
+
+
+def attach_ticket(response: Response, data_key: bytes, user_id: str, encryption_version: int) -> None:
+    ticket = seal_ticket(data_key, user_id, encryption_version)
+    response.headers[TICKET_HEADER] = ticket
+    response.set_cookie(
+        key=TICKET_COOKIE,
+        value=ticket,
+        max_age=settings.data_key_ticket_ttl_seconds,
+        httponly=True,
+        secure=settings.environment == "prod",
+        samesite="lax",
+    )
+
+
+def clear_ticket(response: Response) -> None:
+    response.delete_cookie(TICKET_COOKIE)
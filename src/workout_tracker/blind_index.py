@@ -0,0 +1,186 @@
+"""Blind index over encrypted workouts.
+
+Exercise names and template ids only exist inside `encrypted_payload`. Each workout also gets
+keyed HMAC tokens of those values, under a key derived from the user's data key, so filters can
+find candidate rows without the server learning the values or decrypting unrelated history.
+Tokens are deterministic per user: the index reveals how often a value repeats, not what it is.
+
+Rebuilding an index decrypts the user's whole history, so it never runs inside a read. Until a
+stale index is rebuilt, after the response to the user's first filtered query or through
+`POST /workouts/index/rebuild`, filters fall back to scanning every workout.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import logging
+import threading
+from typing import Any, Iterable
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import Select, delete, insert, select
+from sqlalchemy.orm import Session
+
+from .database import adapter
+from .encryption import KEYRING_SEPARATOR, EncryptionService, keyring_primary
+from .models import BLIND_INDEX_VERSION, User, Workout, WorkoutIndexToken
+from .set_log import assemble, load_ops
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BYTES = 16
+REBUILD_BATCH_SIZE = 500
+
+_rebuilding: set[str] = set()
+_rebuilding_lock = threading.Lock()
+
+
+def _index_key(data_key: bytes) -> bytes:
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"workout-tracker-blind-index")
+    return hkdf.derive(data_key)
+
+
+def _normalize_exercise(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+def _token(index_key: bytes, kind: str, value: str) -> bytes:
+    return hmac.new(index_key, f"{kind}:{value}".encode("utf-8"), hashlib.sha256).digest()[:TOKEN_BYTES]
+
+
+class _Tokenizer:
+    """Tokens under one index key, memoized: a user's history repeats the same few exercises."""
+
+    def __init__(self, data_key: bytes) -> None:
+        self._index_key = _index_key(data_key)
+        self._memo: dict[tuple[str, str], bytes] = {}
+
+    def __call__(self, kind: str, value: str) -> bytes:
+        token = self._memo.get((kind, value))
+        if token is None:
+            normalized = _normalize_exercise(value) if kind == "exercise" else value
+            token = self._memo[kind, value] = _token(self._index_key, kind, normalized)
+        return token
+
+    def payload_tokens(self, payload: dict[str, Any]) -> set[bytes]:
+        tokens = {self("exercise", item["exercise"]) for item in payload.get("sets") or () if item.get("exercise")}
+        if payload.get("template_id"):
+            tokens.add(self("template", payload["template_id"]))
+        return tokens
+
+
+def _query_tokens(data_key: bytes, kind: str, value: str) -> list[bytes]:
+    # Mid-rotation, rows not yet re-encrypted still carry tokens under the retired key.
+    return [_token(_index_key(key), kind, value) for key in data_key.split(KEYRING_SEPARATOR)]
+
+
+def index_workouts(db: Session, user_id: str, data_key: bytes, rows: Iterable[tuple[str, dict[str, Any]]]) -> None:
+    """Replace the tokens of each `(workout_id, payload)` in `rows`."""
+    rows = list(rows)
+    if not rows:
+        return
+    db.execute(
+        delete(WorkoutIndexToken)
+        .where(WorkoutIndexToken.workout_id.in_([workout_id for workout_id, _ in rows]))
+        .execution_options(synchronize_session=False)
+    )
+    # New tokens always use the keyring's primary key.
+    tokenizer = _Tokenizer(keyring_primary(data_key))
+    values = [
+        {"workout_id": workout_id, "token": token, "user_id": user_id}
+        for workout_id, payload in rows
+        for token in tokenizer.payload_tokens(payload)
+    ]
+    if values:
+        # Core insert: plain executemany, none of the ORM's per-row bookkeeping.
+        db.execute(insert(WorkoutIndexToken.__table__), values)
+
+
+def add_workout_tokens(db: Session, user_id: str, data_key: bytes, workout_id: str, fragment: dict[str, Any]) -> None:
+    """Add tokens for part of a workout (e.g. one appended set) without touching the rest."""
+    tokens = _Tokenizer(keyring_primary(data_key)).payload_tokens(fragment)
+    existing = set(
+        db.scalars(
+            select(WorkoutIndexToken.token).where(
+                WorkoutIndexToken.workout_id == workout_id, WorkoutIndexToken.token.in_(tokens)
+            )
+        )
+    )
+    values = [{"workout_id": workout_id, "token": token, "user_id": user_id} for token in tokens - existing]
+    if values:
+        db.execute(insert(WorkoutIndexToken.__table__), values)
+
+
+def rebuild_user_index(db: Session, user: User, data_key: bytes, encryption_service: EncryptionService) -> int:
+    """Re-derive every token for `user`, decrypting their workouts in bounded batches."""
+    db.execute(
+        delete(WorkoutIndexToken)
+        .where(WorkoutIndexToken.user_id == user.id)
+        .execution_options(synchronize_session=False)
+    )
+    stmt = select(Workout.id, Workout.encrypted_payload, Workout.set_log_length).where(Workout.user_id == user.id)
+    indexed = 0
+    for batch in db.execute(stmt.execution_options(yield_per=REBUILD_BATCH_SIZE)).partitions():
+        ops = load_ops(db, [workout_id for workout_id, _, log_length in batch if log_length])
+        index_workouts(
+            db,
+            user.id,
+            data_key,
+            (
+                (workout_id, assemble(encryption_service, data_key, blob, ops.get(workout_id, ())))
+                for workout_id, blob, _ in batch
+            ),
+        )
+        indexed += len(batch)
+    user.blind_index_version = BLIND_INDEX_VERSION
+    return indexed
+
+
+def rebuild_stale_index(user_id: str, data_key: bytes) -> None:
+    """Rebuild `user_id`'s index on its own session if it is still stale; for background tasks."""
+    with _rebuilding_lock:
+        if user_id in _rebuilding:
+            return
+        _rebuilding.add(user_id)
+    try:
+        with adapter.session() as db:
+            user = db.get(User, user_id)
+            if user is not None and user.blind_index_version < BLIND_INDEX_VERSION:
+                rebuild_user_index(db, user, data_key, EncryptionService())
+    except Exception:
+        logger.exception("Rebuilding the blind index for user %s failed", user_id)
+    finally:
+        with _rebuilding_lock:
+            _rebuilding.discard(user_id)
+
+
+def candidate_ids(
+    user_id: str, data_key: bytes, *, exercise: str | None = None, template_id: str | None = None
+) -> Select:
+    """Ids of the user's workouts whose tokens match every given filter."""
+    filters = []
+    if exercise is not None:
+        filters.append(_query_tokens(data_key, "exercise", _normalize_exercise(exercise)))
+    if template_id is not None:
+        filters.append(_query_tokens(data_key, "template", template_id))
+    queries = [
+        select(WorkoutIndexToken.workout_id).where(
+            WorkoutIndexToken.user_id == user_id, WorkoutIndexToken.token.in_(tokens)
+        )
+        for tokens in filters
+    ]
+    query = queries[0]
+    for other in queries[1:]:
+        query = query.where(WorkoutIndexToken.workout_id.in_(other))
+    return query
+
+
+def matches(payload: dict[str, Any], *, exercise: str | None = None, template_id: str | None = None) -> bool:
+    """Exact check on a decrypted candidate; truncated tokens can, very rarely, collide."""
+    if template_id is not None and payload.get("template_id") != template_id:
+        return False
+    if exercise is not None:
+        wanted = _normalize_exercise(exercise)
+        return any(_normalize_exercise(item["exercise"]) == wanted for item in payload.get("sets") or ())
+    return True
@@ -0,0 +1,178 @@
+"""Caching of expensive reads, with per-user invalidation on writes.
+
+Entries are bytes stored under `<namespace>:<user id>:<generation>:<key>`. Each user has a
+generation counter, bumped after any commit that wrote one of their workouts, set-log rows or
+templates. Bumping it makes everything cached for that user unreachable in O(1), and the
+orphaned entries age out through the LRU and their TTL.
+
+`CACHE_BACKEND=memory` keeps all of this in the worker. With `CACHE_BACKEND=socket`, the
+generation counters, and the entries of namespaces that are not `sensitive`, live in a
+`workout-tracker cache-server` shared by the host's workers, so a write in one worker
+invalidates the others immediately. A `sensitive` namespace, meaning any namespace holding
+decrypted data, stores its entries in the worker's memory whatever the backend. Only its
+generation lookups go to the shared server. If the server cannot be reached, reads are
+computed without caching rather than risk serving stale entries.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from functools import lru_cache
+from typing import Callable
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import Workout, WorkoutSetLog, WorkoutTemplate
+from .backends import CacheBackend, MemoryCacheBackend
+from .server import SocketCacheBackend
+
+logger = logging.getLogger(__name__)
+
+_WRITTEN = "cache_written_users"
+_namespaces: dict[str, Namespace] = {}
+
+
+@lru_cache
+def local_backend() -> MemoryCacheBackend:
+    return MemoryCacheBackend(settings.cache_max_bytes)
+
+
+@lru_cache
+def _build_backend(backend: str, socket_path: str, timeout: float) -> CacheBackend:
+    if backend == "socket":
+        return SocketCacheBackend(socket_path, timeout)
+    return local_backend()
+
+
+def get_cache_backend() -> CacheBackend:
+    return _build_backend(settings.cache_backend, settings.cache_socket_path, settings.cache_socket_timeout_seconds)
+
+
+def _generation_key(user_id: str) -> str:
+    return f"generation:{user_id}"
+
+
+def generation(user_id: str) -> int | None:
+    """The user's current generation, or None when the shared backend cannot say."""
+    try:
+        return get_cache_backend().counter(_generation_key(user_id))
+    except OSError:
+        logger.warning("Cache backend unavailable; reading without cache", exc_info=True)
+        return None
+
+
+def invalidate_user(user_id: str) -> None:
+    try:
+        get_cache_backend().incr(_generation_key(user_id))
+    except OSError:
+        logger.exception("Could not invalidate cached reads for user %s", user_id)
+
+
+def make_key(route: str, **params: str | None) -> str:
+    return f"{route}?{urlencode(sorted((name, value) for name, value in params.items() if value is not None))}"
+
+
+class Namespace:
+    """A named family of per-user entries with one TTL, e.g. the results of one kind of read."""
+
+    def __init__(self, name: str, ttl: Callable[[], float], *, sensitive: bool) -> None:
+        self.name = name
+        self._ttl = ttl
+        self.sensitive = sensitive
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "stores": 0}
+        _namespaces[name] = self
+
+    @property
+    def ttl(self) -> float:
+        return self._ttl()
+
+    def _backend(self) -> CacheBackend:
+        return local_backend() if self.sensitive else get_cache_backend()
+
+    def _key(self, user_id: str, generation: int, key: str) -> str:
+        return f"{self.name}:{user_id}:{generation}:{key}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def get(self, user_id: str, generation: int, key: str) -> bytes | None:
+        if self.ttl <= 0:
+            return None
+        try:
+            value = self._backend().get(self._key(user_id, generation, key))
+        except OSError:
+            value = None
+        self._count("misses" if value is None else "hits")
+        return value
+
+    def set(self, user_id: str, generation: int, key: str, value: bytes) -> None:
+        ttl = self.ttl
+        if ttl <= 0:
+            return
+        try:
+            self._backend().set(self._key(user_id, generation, key), value, ttl)
+        except OSError:
+            return
+        self._count("stores")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+def purge_expired() -> int:
+    # The cache server sweeps its own entries.
+    return local_backend().purge_expired()
+
+
+def stats() -> dict[str, object]:
+    body: dict[str, object] = {
+        "backend": settings.cache_backend,
+        "local": local_backend().stats(),
+        "namespaces": {name: namespace.stats() for name, namespace in _namespaces.items()},
+    }
+    if settings.cache_backend == "socket":
+        try:
+            body["shared"] = get_cache_backend().stats()
+        except OSError:
+            body["shared"] = None
+    return body
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_written_users(session: Session, _flush_context) -> None:
+    written = session.info.setdefault(_WRITTEN, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Workout, WorkoutSetLog, WorkoutTemplate)) and obj.user_id is not None:
+            written.add(obj.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_written_users(session: Session) -> None:
+    for user_id in session.info.pop(_WRITTEN, ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_written_users(session: Session, previous_transaction) -> None:
+    session.info.pop(_WRITTEN, None)
+
+
+__all__ = [
+    "CacheBackend",
+    "MemoryCacheBackend",
+    "Namespace",
+    "SocketCacheBackend",
+    "generation",
+    "get_cache_backend",
+    "invalidate_user",
+    "local_backend",
+    "make_key",
+    "purge_expired",
+    "stats",
+]
@@ -0,0 +1,130 @@
+"""Cache backends: byte values under string keys, plus counters that are never evicted."""
+from __future__ import annotations
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def counter(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        ...
+
+    def purge_expired(self) -> int:
+        return 0
+
+    def stats(self) -> dict[str, int]:
+        return {}
+
+
+@dataclass(slots=True)
+class _Entry:
+    value: bytes
+    size: int
+    expires_at: float
+
+
+class MemoryCacheBackend(CacheBackend):
+    """An LRU in process memory, bounded by the bytes its keys and values take up.
+
+    Entries also expire after their TTL. Counters live outside the LRU, since evicting one would
+    reset it. They start from the time the backend was created, in nanoseconds, so a restarted
+    cache never hands out a value an earlier one already used.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._counters: dict[str, int] = {}
+        self._epoch = time.time_ns()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self._counts["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._counts["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counts["hits"] += 1
+            return entry.value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        size = len(key.encode("utf-8")) + len(value)
+        with self._lock:
+            self._remove(key)
+            if ttl <= 0 or size > self.max_bytes:
+                return
+            self._entries[key] = _Entry(value, size, time.monotonic() + ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counts["evictions"] += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, self._epoch)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, self._epoch) + 1
+            return value
+
+    def purge_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+            for key in stale:
+                self._remove(key)
+            self._counts["expirations"] += len(stale)
+        return len(stale)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "counters": len(self._counters),
+                **self._counts,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+            self._bytes = 0
@@ -0,0 +1,187 @@
+"""A cache shared by a host's workers: `workout-tracker cache-server` on a Unix socket.
+
+The server is a `MemoryCacheBackend` behind a small binary protocol. Each request is a header
+`(op, key length, ttl, value length)` followed by the key and value, and each reply is
+`(status, body length)` followed by the body. The socket is created owner-only, and nothing
+that holds decrypted data is ever sent to it (see `Namespace`).
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+
+from .backends import CacheBackend, MemoryCacheBackend
+
+logger = logging.getLogger(__name__)
+
+_REQUEST = struct.Struct("!cHdI")
+_REPLY = struct.Struct("!BI")
+_COUNTER = struct.Struct("!Q")
+
+GET, SET, DELETE, COUNTER, INCR, STATS = b"g", b"s", b"d", b"c", b"i", b"t"
+_MISS, _OK = 0, 1
+
+
+class CacheServerError(OSError):
+    pass
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise CacheServerError("cache server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class SocketCacheBackend(CacheBackend):
+    """Client for `workout-tracker cache-server`; each thread keeps its own connection.
+
+    Calls raise `OSError` when the server is unreachable or slower than `timeout`.
+    """
+
+    def __init__(self, path: str, timeout: float) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _disconnect(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _exchange(self, frame: bytes) -> tuple[int, bytes]:
+        sock = self._connection()
+        try:
+            sock.sendall(frame)
+            status, length = _REPLY.unpack(_recv_exact(sock, _REPLY.size))
+            return status, _recv_exact(sock, length)
+        except OSError:
+            self._disconnect()
+            raise
+
+    def _call(self, op: bytes, key: str = "", value: bytes = b"", ttl: float = 0.0) -> tuple[int, bytes]:
+        encoded = key.encode("utf-8")
+        frame = _REQUEST.pack(op, len(encoded), ttl, len(value)) + encoded + value
+        try:
+            return self._exchange(frame)
+        except OSError:
+            # A kept-alive connection may predate a server restart; reconnect once.
+            return self._exchange(frame)
+
+    def get(self, key: str) -> bytes | None:
+        status, body = self._call(GET, key)
+        return body if status == _OK else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._call(SET, key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self._call(DELETE, key)
+
+    def counter(self, key: str) -> int:
+        return _COUNTER.unpack(self._call(COUNTER, key)[1])[0]
+
+    def incr(self, key: str) -> int:
+        return _COUNTER.unpack(self._call(INCR, key)[1])[0]
+
+    def stats(self) -> dict[str, int]:
+        return json.loads(self._call(STATS)[1])
+
+
+def _dispatch(backend: MemoryCacheBackend, op: bytes, key: str, value: bytes, ttl: float) -> tuple[int, bytes]:
+    if op == GET:
+        found = backend.get(key)
+        return (_MISS, b"") if found is None else (_OK, found)
+    if op == SET:
+        backend.set(key, value, ttl)
+    elif op == DELETE:
+        backend.delete(key)
+    elif op == COUNTER:
+        return _OK, _COUNTER.pack(backend.counter(key))
+    elif op == INCR:
+        return _OK, _COUNTER.pack(backend.incr(key))
+    elif op == STATS:
+        return _OK, json.dumps(backend.stats()).encode("utf-8")
+    else:
+        raise ValueError(f"unknown cache op {op!r}")
+    return _OK, b""
+
+
+async def _handle(backend: MemoryCacheBackend, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            op, key_length, ttl, value_length = _REQUEST.unpack(await reader.readexactly(_REQUEST.size))
+            key = (await reader.readexactly(key_length)).decode("utf-8")
+            value = await reader.readexactly(value_length)
+            status, body = _dispatch(backend, op, key, value, ttl)
+            writer.write(_REPLY.pack(status, len(body)) + body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except ValueError:
+        logger.warning("Dropping cache client after a malformed request")
+    finally:
+        writer.close()
+
+
+async def _purge(backend: MemoryCacheBackend, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        backend.purge_expired()
+
+
+async def serve(path: str, max_bytes: int, purge_interval: float = 60) -> None:
+    backend = MemoryCacheBackend(max_bytes)
+    clients: set[asyncio.Task] = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        clients.add(task)
+        try:
+            await _handle(backend, reader, writer)
+        finally:
+            clients.discard(task)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # A socket file left by a previous run would make bind fail.
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    previous = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(handle, path=path)
+    finally:
+        os.umask(previous)
+    logger.info("Cache server listening on %s (%d bytes)", path, max_bytes)
+    purger = asyncio.create_task(_purge(backend, purge_interval))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        purger.cancel()
+        for client in list(clients):
+            client.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
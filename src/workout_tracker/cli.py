@@ -2,13 +2,17 @@ from __future__ import annotations
 
 import argparse
 import os
-from typing import Sequence
+import sys
+from typing import TYPE_CHECKING, Any, Sequence
 
-import uvicorn
+if TYPE_CHECKING:
+    from workout_tracker.config import Settings
 
 
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 8000
+DEFAULT_SESSION_SECRET = "dev-change-me"
+MIN_SESSION_SECRET_LENGTH = 32
 
 
 def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
@@ -23,12 +27,205 @@ def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
         type=int,
         help="Passkey challenge validity window (seconds)",
     )
+    parser.add_argument(
+        "--environment",
+        choices=["dev", "prod", "test"],
+        help="Runtime environment; 'prod' enables the multi-worker serving mode",
+    )
     parser.add_argument("--host", help="Host/IP to bind the server")
     parser.add_argument("--port", type=int, help="Port to bind the server")
+
+    serving = parser.add_argument_group("production serving")
+    serving.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes (default: CPU count in prod, 1 otherwise)",
+    )
+    serving.add_argument(
+        "--loop",
+        choices=["auto", "asyncio", "uvloop"],
+        default="auto",
+        help="Event loop implementation (auto prefers uvloop when installed)",
+    )
+    serving.add_argument(
+        "--http",
+        choices=["auto", "h11", "httptools"],
+        default="auto",
+        help="HTTP protocol implementation (auto prefers httptools when installed)",
+    )
+    serving.add_argument(
+        "--timeout-keep-alive",
+        type=int,
+        default=5,
+        help="Seconds to hold idle keep-alive connections open",
+    )
+    serving.add_argument(
+        "--backlog",
+        type=int,
+        default=2048,
+        help="Maximum number of pending connections in the listen queue",
+    )
+    serving.add_argument(
+        "--timeout-graceful-shutdown",
+        type=int,
+        help="Seconds to wait for in-flight requests on shutdown (default: 30 in prod)",
+    )
+    serving.add_argument(
+        "--limit-max-requests",
+        type=int,
+        help="Recycle each worker after this many requests to bound memory growth",
+    )
     return parser.parse_args(argv)
 
 
+def validate_settings(settings: Settings, workers: int) -> None:
+    """Fail fast on settings every worker must agree on before any process is forked."""
+    problems: list[str] = []
+    production = settings.environment == "prod"
+    if production or workers > 1:
+        if settings.session_secret == DEFAULT_SESSION_SECRET:
+            problems.append("SESSION_SECRET must be set explicitly when running in prod or with multiple workers")
+        elif len(settings.session_secret) < MIN_SESSION_SECRET_LENGTH:
+            problems.append(f"SESSION_SECRET must be at least {MIN_SESSION_SECRET_LENGTH} characters")
+    if workers > 1 and settings.session_backend == "memory":
+        problems.append("SESSION_BACKEND=memory cannot be shared between workers; use sql or file")
+    if workers > 1 and settings.challenge_backend == "memory":
+        problems.append("CHALLENGE_BACKEND=memory cannot be shared between workers; use sql")
+    if workers > 1 and settings.rate_limit_enabled and settings.rate_limit_backend == "memory":
+        problems.append("RATE_LIMIT_BACKEND=memory gives each worker its own limits; use sql")
+    if workers > 1 and settings.database_url.startswith("sqlite") and ":memory:" in settings.database_url:
+        problems.append("An in-memory SQLite database cannot be shared between workers")
+    from .encryption import PBKDF2_MIN_ITERATIONS, kdf_available
+
+    if not kdf_available(settings.kdf_algorithm):
+        problems.append(f"KDF_ALGORITHM={settings.kdf_algorithm} is not available; argon2id needs cryptography 44+")
+    if settings.kdf_algorithm == "pbkdf2-sha256" and settings.kdf_iterations < PBKDF2_MIN_ITERATIONS:
+        problems.append(f"KDF_ITERATIONS must be at least {PBKDF2_MIN_ITERATIONS} for pbkdf2-sha256")
+    if problems:
+        raise SystemExit("workout-tracker: " + "; ".join(problems))
+
+
+def build_server_options(args: argparse.Namespace, settings: Settings) -> dict[str, Any]:
+    production = settings.environment == "prod"
+    workers = args.workers
+    if workers is None:
+        workers = (os.cpu_count() or 1) if production else 1
+    if workers < 1:
+        raise SystemExit("workout-tracker: --workers must be at least 1")
+    graceful = args.timeout_graceful_shutdown
+    if graceful is None and production:
+        graceful = 30
+    return {
+        "host": args.host or DEFAULT_HOST,
+        "port": args.port or DEFAULT_PORT,
+        # Auto-reload only makes sense for a single dev process.
+        "reload": settings.environment == "dev" and workers == 1,
+        "workers": workers,
+        "loop": args.loop,
+        "http": args.http,
+        "timeout_keep_alive": args.timeout_keep_alive,
+        "backlog": args.backlog,
+        "timeout_graceful_shutdown": graceful,
+        "limit_max_requests": args.limit_max_requests,
+        # Client addresses (and so per-IP rate limits) come from X-Forwarded-For only when the
+        # connection is from one of these proxies.
+        "proxy_headers": True,
+        "forwarded_allow_ips": settings.forwarded_allow_ips,
+    }
+
+
+def kdf_calibrate(argv: Sequence[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog="workout-tracker kdf-calibrate",
+        description="Benchmark this host and recommend KDF parameters for a target unwrap latency",
+    )
+    parser.add_argument("--target-ms", type=float, default=250, help="Desired time for one derivation")
+    parser.add_argument(
+        "--algorithm",
+        choices=["pbkdf2-sha256", "scrypt", "argon2id"],
+        default="pbkdf2-sha256",
+    )
+    parser.add_argument(
+        "--max-memory-mib",
+        type=int,
+        default=64,
+        help="Memory ceiling per derivation for scrypt/argon2id",
+    )
+    args = parser.parse_args(argv)
+
+    from workout_tracker.encryption import EncryptionError, calibrate_kdf
+
+    try:
+        params, seconds = calibrate_kdf(args.algorithm, args.target_ms / 1000, max_memory_kib=args.max_memory_mib * 1024)
+    except EncryptionError as exc:
+        raise SystemExit(f"workout-tracker: {exc}") from exc
+    print(f"{params.encode()}  ({seconds * 1000:.0f} ms per derivation on this host)")
+    print(f"KDF_ALGORITHM={params.algorithm}")
+    if params.algorithm == "pbkdf2-sha256":
+        print(f"KDF_ITERATIONS={params.cost}")
+    elif params.algorithm == "scrypt":
+        print(f"KDF_SCRYPT_N={params.cost}")
+    else:
+        print(f"KDF_ARGON2_ITERATIONS={params.cost}")
+        print(f"KDF_ARGON2_MEMORY_KIB={params.memory_kib}")
+
+
+def blind_index_reset(argv: Sequence[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog="workout-tracker blind-index-reset",
+        description=(
+            "Mark every user's blind index stale. The server cannot read payloads without a user's "
+            "key, so each index is rebuilt on that user's next filtered query (or POST /workouts/index/rebuild)."
+        ),
+    )
+    parser.parse_args(argv)
+
+    from sqlalchemy import update
+
+    from workout_tracker.database import adapter
+    from workout_tracker.models import User
+
+    adapter.create_schema()
+    with adapter.session() as db:
+        # This process cannot reach the servers' user caches. A cached user keeps the old version
+        # for at most USER_CACHE_TTL_SECONDS, which only delays the rebuild; the index stays valid.
+        marked = db.execute(update(User).values(blind_index_version=0)).rowcount or 0
+    print(f"Marked {marked} users for a blind index rebuild")
+
+
+def cache_server(argv: Sequence[str]) -> None:
+    from workout_tracker.config import get_settings
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(
+        prog="workout-tracker cache-server",
+        description="Serve the cache shared by this host's workers (CACHE_BACKEND=socket)",
+    )
+    parser.add_argument("--socket", default=settings.cache_socket_path, help="Unix socket to listen on")
+    parser.add_argument("--max-bytes", type=int, default=settings.cache_max_bytes, help="Memory budget for entries")
+    args = parser.parse_args(argv)
+
+    import asyncio
+    import logging
+
+    from workout_tracker.cache.server import serve
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.socket, args.max_bytes))
+    except KeyboardInterrupt:
+        pass
+
+
+COMMANDS = {"kdf-calibrate": kdf_calibrate, "blind-index-reset": blind_index_reset, "cache-server": cache_server}
+
+
 def main(argv: Sequence[str] | None = None) -> None:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Subcommands are dispatched by name; anything else runs the server as before.
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+        return
     args = parse_args(argv)
 
     env_overrides = {
@@ -38,22 +235,23 @@ def main(argv: Sequence[str] | None = None) -> None:
         "FRONTEND_BASE_URL": args.frontend_base_url,
         "SESSION_SECRET": args.session_secret,
         "CHALLENGE_TTL_SECONDS": args.challenge_ttl_seconds,
+        "ENVIRONMENT": args.environment,
     }
     for key, value in env_overrides.items():
         if value is not None:
             os.environ[key] = str(value)
 
-    # Import after applying env overrides so pydantic settings pick them up.
+    # Import after applying env overrides so pydantic settings pick them up; worker processes
+    # inherit the same environment. uvicorn is deferred as well so `--help` and argument errors
+    # return without loading the server stack.
+    import uvicorn
+
     from workout_tracker.config import get_settings
 
     settings = get_settings()
-    reload = settings.environment == "dev"
-    uvicorn.run(
-        "workout_tracker.app:app",
-        host=args.host or DEFAULT_HOST,
-        port=args.port or DEFAULT_PORT,
-        reload=reload,
-    )
+    options = build_server_options(args, settings)
+    validate_settings(settings, options["workers"])
+    uvicorn.run("workout_tracker.app:app", **options)
 
 
 __all__ = ["main"]
@@ -0,0 +1,233 @@
+"""Content-Encoding negotiation and response compression."""
+from __future__ import annotations
+
+import gzip
+import zlib
+from typing import Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # pragma: no cover - optional dependency
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:  # pragma: no cover - optional dependency
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/manifest+json",
+    "application/x-ndjson",
+    "image/svg+xml",
+)
+# Live streams stay open for hours and flush every event; a compressor per stream would cost
+# memory for each idle connection and save next to nothing.
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+# Server preference order; codings whose library is missing are dropped.
+PREFERRED_ENCODINGS = ("br", "zstd", "gzip")
+
+
+def available_encodings() -> tuple[str, ...]:
+    installed = {"gzip"}
+    if brotli is not None:
+        installed.add("br")
+    if zstandard is not None:
+        installed.add("zstd")
+    return tuple(encoding for encoding in PREFERRED_ENCODINGS if encoding in installed)
+
+
+def negotiate_encoding(accept_encoding: str | None, supported: tuple[str, ...]) -> str | None:
+    """Pick the first server-preferred coding the client accepts with a non-zero q-value."""
+    if not accept_encoding:
+        return None
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for encoding in supported:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def is_compressible(content_type: str | None) -> bool:
+    return (
+        bool(content_type)
+        and content_type.startswith(COMPRESSIBLE_TYPES)
+        and not content_type.startswith(UNCOMPRESSED_TYPES)
+    )
+
+
+def compress(data: bytes, encoding: str, level: int | None = None) -> bytes:
+    if encoding == "br":
+        assert brotli is not None
+        return brotli.compress(data, quality=11 if level is None else min(level, 11))
+    if encoding == "zstd":
+        assert zstandard is not None
+        return zstandard.ZstdCompressor(level=19 if level is None else level).compress(data)
+    return gzip.compress(data, compresslevel=9 if level is None else min(level, 9), mtime=0)
+
+
+class StreamCompressor(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+    def finish(self) -> bytes: ...
+
+
+class _GzipStream:
+    def __init__(self, level: int) -> None:
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, level: int) -> None:
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level: int) -> None:
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def stream_compressor(encoding: str, level: int) -> StreamCompressor:
+    if encoding == "br":
+        return _BrotliStream(min(level, 11))
+    if encoding == "zstd":
+        return _ZstdStream(level)
+    return _GzipStream(min(level, 9))
+
+
+class CompressionMiddleware:
+    """Compresses compressible responses with the best coding the client accepts.
+
+    Responses that already carry a `Content-Encoding` (such as precompressed static assets),
+    non-text media types and bodies under `minimum_size` pass through untouched. Streaming
+    responses are compressed chunk by chunk and flushed so clients see data as it is produced.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        level: int = 5,
+        encodings: tuple[str, ...] | None = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        installed = available_encodings()
+        self.encodings = tuple(e for e in (encodings or installed) if e in installed)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self.app, encoding, self.level, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, level: int, minimum_size: int) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.send: Send
+        self.start_message: Message | None = None
+        self.compressor: StreamCompressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    async def send_with_compression(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or not is_compressible(headers.get("content-type"))
+            if self.passthrough:
+                await self.send(message)
+            else:
+                # Defer the start message until we know whether the body is worth compressing.
+                self.start_message = message
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            headers["Content-Encoding"] = self.encoding
+            if not more_body:
+                compressed = compress(body, self.encoding, self.level)
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            del headers["Content-Length"]
+            self.compressor = stream_compressor(self.encoding, self.level)
+            await self.send(start)
+
+        assert self.compressor is not None
+        if more_body:
+            chunk = self.compressor.compress(body) + self.compressor.flush()
+        else:
+            chunk = self.compressor.compress(body) + self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -16,10 +16,58 @@ class Settings(BaseSettings):
     auth_rp_id: str = Field(default="localhost")
     auth_origin: str = Field(default="http://localhost:5173")
     frontend_base_url: str = Field(default="http://localhost:8000")
-    kdf_iterations: int = Field(default=390_000)
+    kdf_algorithm: Literal["pbkdf2-sha256", "scrypt", "argon2id"] = Field(default="pbkdf2-sha256")
+    kdf_iterations: int = Field(default=600_000, ge=1)
+    kdf_scrypt_n: int = Field(default=2**15, ge=2)
+    kdf_argon2_iterations: int = Field(default=3, ge=1)
+    kdf_argon2_memory_kib: int = Field(default=65_536, ge=8)
+    # Iterations of envelopes written before KDF parameters were stored per user.
+    kdf_legacy_iterations: int = Field(default=390_000, ge=1)
     encryption_algorithm: Literal["fernet"] = Field(default="fernet")
     challenge_ttl_seconds: int = Field(default=300)
+    challenge_backend: Literal["sql", "memory"] = Field(default="sql")
+    challenge_sweep_interval_seconds: int = Field(default=60, ge=1)
+    account_deletion_batch_size: int = Field(default=1000, ge=1)
+    account_deletion_background_threshold: int = Field(default=5000, ge=0)
+    key_rotation_batch_size: int = Field(default=500, ge=1)
+    workout_set_log_max_entries: int = Field(default=32, ge=1)
+    idempotency_key_ttl_seconds: int = Field(default=86_400, ge=60)
+    idempotency_lock_seconds: int = Field(default=60, ge=1)
+    live_heartbeat_seconds: float = Field(default=15, gt=0)
+    live_retry_ms: int = Field(default=3000, ge=0)
+    live_queue_size: int = Field(default=64, ge=1)
+    live_max_streams_per_user: int = Field(default=8, ge=1)
+    live_session_check_seconds: float = Field(default=60, ge=0)
+    scheduler_enabled: bool = Field(default=True)
+    abandoned_user_max_age_seconds: int = Field(default=86_400, ge=0)
+    database_maintenance_cron: str = Field(default="17 4 * * *")
+    cache_refresh_interval_seconds: int = Field(default=60, ge=1)
     session_secret: str = Field(default="dev-change-me")
+    session_backend: Literal["memory", "sql", "file"] = Field(default="sql")
+    session_file_dir: str = Field(default=str(Path.cwd() / "var" / "sessions"))
+    session_key_idle_seconds: int = Field(default=900, ge=0)
+    data_key_tickets_enabled: bool = Field(default=False)
+    data_key_ticket_ttl_seconds: int = Field(default=300, ge=1)
+    data_key_ticket_rotation_seconds: int = Field(default=3600, ge=60)
+    data_key_ticket_secret: str | None = None
+    data_key_ticket_previous_secret: str | None = None
+    user_cache_ttl_seconds: float = Field(default=0, ge=0)
+    read_cache_ttl_seconds: float = Field(default=0, ge=0)
+    cache_backend: Literal["memory", "socket"] = Field(default="memory")
+    cache_max_bytes: int = Field(default=64 * 1024 * 1024, ge=0)
+    cache_socket_path: str = Field(default=str(Path.cwd() / "var" / "cache.sock"))
+    cache_socket_timeout_seconds: float = Field(default=0.5, gt=0)
+    rate_limit_enabled: bool = Field(default=True)
+    rate_limit_backend: Literal["memory", "sql"] = Field(default="sql")
+    forwarded_allow_ips: str = Field(default="127.0.0.1")
+    rate_limits: dict[str, str] = Field(default_factory=dict)
+    kdf_max_concurrency: int = Field(default=4, ge=0)
+    kdf_queue_timeout_seconds: float = Field(default=2.0, ge=0)
+    loop_lag_threshold_ms: int = Field(default=0, ge=0)
+    metrics_token: str | None = None
+    compression_enabled: bool = Field(default=True)
+    compression_level: int = Field(default=5, ge=1, le=22)
+    compression_minimum_size: int = Field(default=1024, ge=0)
 
     apple_team_id: str | None = None
     apple_client_id: str | None = None
@@ -1,33 +1,76 @@
 from __future__ import annotations
 
+import logging
+import threading
 from contextlib import contextmanager
 from typing import Generator
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event, inspect
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
+from sqlalchemy.schema import CreateColumn
 
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class Base(DeclarativeBase):
     pass
 
 
+class SchemaSyncError(RuntimeError):
+    """The database needs a schema change that `create_schema` cannot apply safely."""
+
+
+def _enable_sqlite_foreign_keys(dbapi_connection, _record) -> None:
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are switched on per connection.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
 class DatabaseAdapter:
+    """Engine and session factory are built on first use so importing the app stays cheap."""
+
     def __init__(self, url: str) -> None:
         self.url = url
-        connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
-        self.engine = create_engine(url, future=True, connect_args=connect_args, pool_pre_ping=True)
-        self._session_factory = sessionmaker(
-            bind=self.engine,
-            autoflush=False,
-            autocommit=False,
-            expire_on_commit=False,
-        )
+        self._engine: Engine | None = None
+        self._session_factory: sessionmaker[Session] | None = None
+        self._lock = threading.Lock()
+
+    def _build(self) -> None:
+        with self._lock:
+            if self._engine is not None:
+                return
+            connect_args = {"check_same_thread": False} if self.url.startswith("sqlite") else {}
+            engine = create_engine(self.url, future=True, connect_args=connect_args, pool_pre_ping=True)
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", _enable_sqlite_foreign_keys)
+            self._session_factory = sessionmaker(
+                bind=engine,
+                autoflush=False,
+                autocommit=False,
+                expire_on_commit=False,
+            )
+            self._engine = engine
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._build()
+        assert self._engine is not None
+        return self._engine
+
+    @property
+    def session_factory(self) -> sessionmaker[Session]:
+        if self._session_factory is None:
+            self._build()
+        assert self._session_factory is not None
+        return self._session_factory
 
     @contextmanager
     def session(self) -> Generator[Session, None, None]:
-        db = self._session_factory()
+        db = self.session_factory()
         try:
             yield db
             db.commit()
@@ -38,7 +81,63 @@ class DatabaseAdapter:
             db.close()
 
     def create_schema(self) -> None:
+        from . import search  # noqa: F401  - registers the full-text index DDL with the metadata
+
         Base.metadata.create_all(self.engine)
+        self._sync_additive_schema()
+
+    def _sync_additive_schema(self) -> None:
+        """Add columns and indexes introduced after a table was first created.
+
+        `create_all` skips existing tables, and there are no migrations yet, so the changes that
+        are safe on a populated table are applied here: new nullable columns, new NOT NULL
+        columns with a server default, and new indexes. A new NOT NULL column without a server
+        default raises `SchemaSyncError` instead of being added without its constraint. Type and
+        nullability changes to existing columns are never applied, only logged.
+        """
+        inspector = inspect(self.engine)
+        existing_tables = set(inspector.get_table_names())
+        with self.engine.begin() as conn:
+            preparer = conn.dialect.identifier_preparer
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                present = {column["name"]: column for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    reflected = present.get(column.name)
+                    if reflected is not None:
+                        _log_drift(table.name, column, reflected)
+                        continue
+                    if not column.nullable and column.server_default is None:
+                        raise SchemaSyncError(
+                            f"{table.name}.{column.name} is NOT NULL without a server default and cannot be "
+                            "added to an existing table; add it with a manual migration"
+                        )
+                    spec = CreateColumn(column).compile(dialect=conn.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {spec}")
+                indexed = {index["name"] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in indexed:
+                        index.create(conn, checkfirst=True)
+
+
+def _log_drift(table: str, column, reflected: dict) -> None:
+    if reflected["type"]._type_affinity is not column.type._type_affinity:
+        logger.warning(
+            "Column %s.%s is %s in the database but %s in the model; migrate it manually",
+            table,
+            column.name,
+            reflected["type"],
+            column.type,
+        )
+    if reflected["nullable"] != column.nullable:
+        logger.warning(
+            "Column %s.%s is %s in the database but %s in the model; migrate it manually",
+            table,
+            column.name,
+            "nullable" if reflected["nullable"] else "NOT NULL",
+            "nullable" if column.nullable else "NOT NULL",
+        )
 
 
 adapter = DatabaseAdapter(settings.database_url)
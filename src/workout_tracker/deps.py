@@ -1,17 +1,52 @@
 from __future__ import annotations
 
+from dataclasses import dataclass, replace
 from typing import Generator
 
-from fastapi import Cookie, Depends, Header, HTTPException, status
+from fastapi import Cookie, Depends, Header, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 
-from .auth.sessions import resolve_session
+from .auth.session_store import key_handles
+from .auth.sessions import SessionState, resolve_session
+from .auth.tickets import TICKET_COOKIE, TICKET_HEADER, attach_ticket, open_ticket
+from .config import settings
 from .database import adapter
 from .encryption import EncryptionContext, EncryptionService
+from .key_rotation import rewrap_envelopes
 from .models import User
+from .user_cache import user_cache
 
 
-def get_db() -> Generator[Session, None, None]:
+@dataclass(slots=True)
+class AuthContext:
+    """Everything derived from the session cookie, resolved once per request."""
+
+    session: SessionState | None
+    user: User | None
+    encryption_token: str | None
+
+
+@dataclass(slots=True)
+class BatchScope:
+    """What the sub-requests of one `POST /batch` share; see `routers.batch`."""
+
+    auth: AuthContext
+    data_key: bytes | None
+    # The batch's own session for writes, which run one at a time; None for reads, which run
+    # concurrently and so each need a session of their own.
+    db: Session | None
+
+
+def _batch_scope(request: Request) -> BatchScope | None:
+    return getattr(request.state, "batch", None)
+
+
+def get_db(request: Request) -> Generator[Session, None, None]:
+    batch = _batch_scope(request)
+    if batch is not None and batch.db is not None:
+        # The batch commits or rolls back after each sub-request.
+        yield batch.db
+        return
     with adapter.session() as db:
         yield db
 
@@ -20,13 +55,36 @@ def get_encryption_service() -> EncryptionService:
     return EncryptionService()
 
 
-def maybe_current_user(
+def get_auth_context(
+    request: Request,
     db: Session = Depends(get_db),
     session_token: str | None = Cookie(default=None, alias="session"),
-) -> User | None:
-    session = resolve_session(session_token)
-    user_id = session.get("user_id") if session else None
-    return db.get(User, user_id) if user_id else None
+    token: str | None = Header(default=None, alias="X-Encryption-Token"),
+) -> AuthContext:
+    cached = getattr(request.state, "auth_context", None)
+    if cached is not None:
+        return cached
+    batch = _batch_scope(request)
+    if batch is not None:
+        user = batch.auth.user
+        # The user row belongs to the batch's session; attach a copy to this one without a query.
+        ctx = replace(batch.auth, user=db.merge(user, load=False) if user is not None else None)
+        request.state.auth_context = ctx
+        return ctx
+    session = resolve_session(db, session_token)
+    user = user_cache.get(db, session.user_id) if session else None
+    if user is not None and not user.is_active:
+        # Deactivated while its data is being deleted.
+        user = None
+    if token is None and session is not None:
+        token = session.encryption_token
+    ctx = AuthContext(session=session, user=user, encryption_token=token)
+    request.state.auth_context = ctx
+    return ctx
+
+
+def maybe_current_user(ctx: AuthContext = Depends(get_auth_context)) -> User | None:
+    return ctx.user
 
 
 def get_current_user(user: User | None = Depends(maybe_current_user)) -> User:
@@ -36,20 +94,66 @@ def get_current_user(user: User | None = Depends(maybe_current_user)) -> User:
 
 
 def get_encryption_context(
-    token: str | None = Header(default=None, alias="X-Encryption-Token"),
-    session_token: str | None = Cookie(default=None, alias="session"),
+    ctx: AuthContext = Depends(get_auth_context),
     user: User = Depends(get_current_user),
 ) -> EncryptionContext:
-    session = resolve_session(session_token)
-    derived = session.get("encryption_token") if session else None
-    candidate = token or derived
-    if not candidate:
+    if not ctx.encryption_token:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing encryption token")
-    return EncryptionContext(token=candidate, salt=user.encryption_salt, wrapped_key=user.encrypted_data_key)
+    return EncryptionContext(
+        token=ctx.encryption_token,
+        salt=user.encryption_salt,
+        wrapped_key=user.encrypted_data_key,
+        kdf_params=user.kdf_params,
+    )
 
 
 def get_data_key(
+    request: Request,
+    response: Response,
     encryption_service: EncryptionService = Depends(get_encryption_service),
     ctx: EncryptionContext = Depends(get_encryption_context),
+    auth: AuthContext = Depends(get_auth_context),
+    user: User = Depends(get_current_user),
+    ticket_cookie: str | None = Cookie(default=None, alias=TICKET_COOKIE),
+    ticket_header: str | None = Header(default=None, alias=TICKET_HEADER),
 ) -> bytes:
-    return encryption_service.unwrap_data_key(ctx)
+    batch = _batch_scope(request)
+    if batch is not None and batch.data_key is not None:
+        return batch.data_key
+    # Cheapest first: this worker's key handle, then a data-key ticket, then the full KDF unwrap.
+    session = auth.session
+    if session is not None:
+        cached = key_handles.get(session.key, user.id, user.encryption_version)
+        if cached is not None:
+            return cached
+    data_key = None
+    if settings.data_key_tickets_enabled:
+        ticket = ticket_header or ticket_cookie
+        if ticket:
+            data_key = open_ticket(ticket, user.id, user.encryption_version)
+    if data_key is None:
+        data_key = encryption_service.unwrap_data_key(ctx)
+        if encryption_service.needs_rewrap(ctx):
+            # The token just proved itself; re-wrap under the current KDF parameters. The data
+            # key and encryption_version are unchanged, so tickets and key handles stay valid.
+            rewrap_envelopes(encryption_service, user, data_key, ctx.token)
+        if settings.data_key_tickets_enabled:
+            attach_ticket(response, data_key, user.id, user.encryption_version)
+    if session is not None:
+        key_handles.put(session.key, user.id, user.encryption_version, data_key)
+    return data_key
+
+
+def maybe_data_key(
+    request: Request,
+    response: Response,
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+    auth: AuthContext = Depends(get_auth_context),
+    ticket_cookie: str | None = Cookie(default=None, alias=TICKET_COOKIE),
+    ticket_header: str | None = Header(default=None, alias=TICKET_HEADER),
+) -> bytes | None:
+    """The data key when the caller is signed in with an encryption token, otherwise None."""
+    if auth.user is None or not auth.encryption_token:
+        return None
+    ctx = get_encryption_context(auth, auth.user)
+    return get_data_key(request, response, encryption_service, ctx, auth, auth.user, ticket_cookie, ticket_header)
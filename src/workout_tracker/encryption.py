@@ -3,12 +3,21 @@ from __future__ import annotations
 import base64
 import json
 import os
-from dataclasses import dataclass
-from typing import Any
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Iterator
 
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+try:  # Argon2id needs cryptography 44+.
+    from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+except ImportError:  # pragma: no cover - optional dependency
+    Argon2id = None
 
 from .config import CryptoSettings, settings
 
@@ -17,53 +26,241 @@ class EncryptionError(Exception):
     pass
 
 
+class KdfBusy(EncryptionError):
+    """Every KDF slot stayed taken for the whole queue timeout."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("Key derivation capacity exhausted")
+        self.retry_after = retry_after
+
+
+class KdfGate:
+    """Caps concurrent PBKDF2 derivations in this process so bursts queue instead of
+    oversubscribing the CPU; callers that wait longer than the queue timeout get `KdfBusy`."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._semaphore: threading.BoundedSemaphore | None = None
+        self._size = 0
+
+    def _slots(self) -> threading.BoundedSemaphore | None:
+        size = settings.kdf_max_concurrency
+        if size <= 0:
+            return None
+        with self._lock:
+            if self._semaphore is None or self._size != size:
+                self._semaphore = threading.BoundedSemaphore(size)
+                self._size = size
+            return self._semaphore
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        semaphore = self._slots()
+        if semaphore is None:
+            yield
+            return
+        if not semaphore.acquire(timeout=settings.kdf_queue_timeout_seconds):
+            raise KdfBusy(retry_after=max(1.0, settings.kdf_queue_timeout_seconds))
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+kdf_gate = KdfGate()
+
+KDF_ALGORITHMS = ("pbkdf2-sha256", "scrypt", "argon2id")
+# OWASP's minimum for PBKDF2-HMAC-SHA256; calibration never recommends fewer.
+PBKDF2_MIN_ITERATIONS = 600_000
+
+
+def kdf_available(algorithm: str) -> bool:
+    return algorithm in KDF_ALGORITHMS and (algorithm != "argon2id" or Argon2id is not None)
+
+
+@dataclass(frozen=True, slots=True)
+class KdfParams:
+    """Parameters an envelope was wrapped with, stored per user as e.g. `pbkdf2-sha256$i=600000`.
+
+    `cost` is the PBKDF2 iteration count, the scrypt N or the Argon2id pass count; `memory_kib`
+    applies to Argon2id, `block_size`/`parallelism` to scrypt and Argon2id.
+    """
+
+    algorithm: str
+    cost: int
+    memory_kib: int = 0
+    block_size: int = 8
+    parallelism: int = 1
+
+    def encode(self) -> str:
+        if self.algorithm == "pbkdf2-sha256":
+            return f"{self.algorithm}$i={self.cost}"
+        if self.algorithm == "scrypt":
+            return f"{self.algorithm}$n={self.cost},r={self.block_size},p={self.parallelism}"
+        return f"{self.algorithm}$t={self.cost},m={self.memory_kib},p={self.parallelism}"
+
+    @classmethod
+    def decode(cls, value: str | None) -> KdfParams:
+        if not value:
+            # Envelopes written before parameters were recorded.
+            return cls("pbkdf2-sha256", settings.kdf_legacy_iterations)
+        algorithm, _, encoded = value.partition("$")
+        fields = dict(item.split("=", 1) for item in encoded.split(",") if item)
+        numbers = {key: int(number) for key, number in fields.items()}
+        if algorithm == "pbkdf2-sha256":
+            return cls(algorithm, numbers["i"])
+        if algorithm == "scrypt":
+            return cls(algorithm, numbers["n"], block_size=numbers["r"], parallelism=numbers["p"])
+        if algorithm == "argon2id":
+            return cls(algorithm, numbers["t"], memory_kib=numbers["m"], parallelism=numbers["p"])
+        raise EncryptionError(f"Unknown KDF {algorithm!r}")
+
+    @classmethod
+    def current(cls) -> KdfParams:
+        algorithm = settings.kdf_algorithm
+        if algorithm == "scrypt":
+            return cls(algorithm, settings.kdf_scrypt_n, block_size=8, parallelism=1)
+        if algorithm == "argon2id":
+            return cls(algorithm, settings.kdf_argon2_iterations, memory_kib=settings.kdf_argon2_memory_kib)
+        return cls(algorithm, settings.kdf_iterations)
+
+    def derive(self, secret: bytes, salt: bytes, length: int) -> bytes:
+        if self.algorithm == "pbkdf2-sha256":
+            kdf: Any = PBKDF2HMAC(algorithm=hashes.SHA256(), length=length, salt=salt, iterations=self.cost)
+        elif self.algorithm == "scrypt":
+            kdf = Scrypt(salt=salt, length=length, n=self.cost, r=self.block_size, p=self.parallelism)
+        elif self.algorithm == "argon2id" and Argon2id is not None:
+            kdf = Argon2id(
+                salt=salt,
+                length=length,
+                iterations=self.cost,
+                lanes=self.parallelism,
+                memory_cost=self.memory_kib,
+            )
+        else:
+            raise EncryptionError(f"KDF {self.algorithm!r} is not available")
+        return kdf.derive(secret)
+
+
+def _time_derivation(params: KdfParams, rounds: int) -> float:
+    salt = os.urandom(16)
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        params.derive(b"calibration", salt, 32)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def calibrate_kdf(
+    algorithm: str, target_seconds: float, *, max_memory_kib: int = 65536, rounds: int = 3
+) -> tuple[KdfParams, float]:
+    """Pick parameters whose derivation takes about `target_seconds` here; returns them with the
+    measured time. Memory-hard KDFs keep memory at `max_memory_kib` and scale time instead."""
+    if algorithm == "pbkdf2-sha256":
+        probe = KdfParams(algorithm, 100_000)
+        per_iteration = _time_derivation(probe, rounds) / probe.cost
+        # Round to a tidy multiple of 10k, never below the OWASP floor.
+        iterations = max(PBKDF2_MIN_ITERATIONS, int(target_seconds / per_iteration) // 10_000 * 10_000)
+        params = KdfParams(algorithm, iterations)
+    elif algorithm == "scrypt":
+        # scrypt's cost and memory both scale with N (128 * N * r bytes), so step N in powers of two.
+        params = KdfParams(algorithm, 2**12)
+        while params.cost * 2 * 128 * params.block_size <= max_memory_kib * 1024:
+            candidate = replace(params, cost=params.cost * 2)
+            if _time_derivation(candidate, 1) > target_seconds:
+                break
+            params = candidate
+    elif algorithm == "argon2id":
+        if Argon2id is None:
+            raise EncryptionError("Argon2id needs cryptography 44 or newer")
+        probe = KdfParams(algorithm, 1, memory_kib=max_memory_kib)
+        per_pass = _time_derivation(probe, rounds)
+        params = replace(probe, cost=max(1, round(target_seconds / per_pass)))
+    else:
+        raise EncryptionError(f"Unknown KDF {algorithm!r}")
+    return params, _time_derivation(params, rounds)
+
+
+# While a data-key rotation is in flight the unwrapped "data key" is a keyring: the new key
+# first, then the one being retired. Fernet keys are urlsafe base64, so a comma never occurs.
+KEYRING_SEPARATOR = b","
+
+
+def keyring_primary(data_key: bytes) -> bytes:
+    return data_key.split(KEYRING_SEPARATOR, 1)[0]
+
+
+def _cipher(data_key: bytes) -> Fernet | MultiFernet:
+    if KEYRING_SEPARATOR not in data_key:
+        return Fernet(data_key)
+    return MultiFernet([Fernet(key) for key in data_key.split(KEYRING_SEPARATOR)])
+
+
 @dataclass(slots=True)
 class EncryptionContext:
     token: str
     salt: bytes
     wrapped_key: bytes
+    kdf_params: str | None = None
 
 
 class EncryptionService:
     def __init__(self, crypto_settings: CryptoSettings | None = None) -> None:
         self._crypto_settings = crypto_settings or CryptoSettings()
 
-    def _derive_wrapping_key(self, token: str, salt: bytes) -> bytes:
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=self._crypto_settings.derived_key_bytes,
-            salt=salt,
-            iterations=settings.kdf_iterations,
-        )
-        return base64.urlsafe_b64encode(kdf.derive(token.encode("utf-8")))
+    def _derive_wrapping_key(self, token: str, salt: bytes, params: KdfParams) -> bytes:
+        with kdf_gate.slot():
+            derived = params.derive(token.encode("utf-8"), salt, self._crypto_settings.derived_key_bytes)
+        return base64.urlsafe_b64encode(derived)
 
-    def create_user_envelope(self, token: str) -> tuple[bytes, bytes]:
-        salt = os.urandom(self._crypto_settings.salt_bytes)
-        data_key = Fernet.generate_key()
-        wrapping_key = self._derive_wrapping_key(token, salt)
-        envelope = Fernet(wrapping_key).encrypt(data_key)
-        return salt, envelope
+    def create_user_envelope(self, token: str) -> tuple[bytes, bytes, str]:
+        """Return `(salt, envelope, kdf_params)` for a fresh data key wrapped under `token`."""
+        return self.rotate_envelope(Fernet.generate_key(), token)
+
+    def needs_rewrap(self, ctx: EncryptionContext) -> bool:
+        return KdfParams.decode(ctx.kdf_params) != KdfParams.current()
 
     def unwrap_data_key(self, ctx: EncryptionContext) -> bytes:
         try:
-            wrapping_key = self._derive_wrapping_key(ctx.token, ctx.salt)
+            wrapping_key = self._derive_wrapping_key(ctx.token, ctx.salt, KdfParams.decode(ctx.kdf_params))
             return Fernet(wrapping_key).decrypt(ctx.wrapped_key)
         except InvalidToken as exc:  # pragma: no cover - runtime protection
             raise EncryptionError("Unable to unlock user data") from exc
 
     def encrypt_payload(self, data_key: bytes, payload: dict[str, Any]) -> bytes:
         serialized = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
-        return Fernet(data_key).encrypt(serialized)
+        return _cipher(data_key).encrypt(serialized)
 
     def decrypt_payload(self, data_key: bytes, blob: bytes) -> dict[str, Any]:
         try:
-            raw = Fernet(data_key).decrypt(blob)
+            raw = _cipher(data_key).decrypt(blob)
             return json.loads(raw.decode("utf-8"))
         except InvalidToken as exc:  # pragma: no cover - runtime protection
             raise EncryptionError("Payload decryption failed") from exc
 
-    def rotate_envelope(self, data_key: bytes, new_token: str) -> tuple[bytes, bytes]:
+    def payload_rotator(self, data_key: bytes) -> Callable[[bytes], bytes]:
+        """Return a function re-encrypting blobs under the keyring's primary key without parsing
+        them. Retired keys are tried first, since rows awaiting rotation use those."""
+        keys = data_key.split(KEYRING_SEPARATOR)
+        writer = Fernet(keys[0])
+        reader = MultiFernet([Fernet(key) for key in reversed(keys)])
+
+        def rotate(blob: bytes) -> bytes:
+            try:
+                return writer.encrypt(reader.decrypt(blob))
+            except InvalidToken as exc:
+                raise EncryptionError("Payload decryption failed") from exc
+
+        return rotate
+
+    def rotate_envelope(self, data_key: bytes, new_token: str) -> tuple[bytes, bytes, str]:
+        salt, (envelope,), params = self.wrap_envelopes([data_key], new_token)
+        return salt, envelope, params
+
+    def wrap_envelopes(self, keys: list[bytes], token: str) -> tuple[bytes, list[bytes], str]:
+        """Wrap several keys under one salt and derivation, so they unlock with the same token."""
+        params = KdfParams.current()
         salt = os.urandom(self._crypto_settings.salt_bytes)
-        wrapping_key = self._derive_wrapping_key(new_token, salt)
-        envelope = Fernet(wrapping_key).encrypt(data_key)
-        return salt, envelope
+        wrapping = Fernet(self._derive_wrapping_key(token, salt, params))
+        return salt, [wrapping.encrypt(key) for key in keys], params.encode()
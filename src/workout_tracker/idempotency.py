@@ -0,0 +1,153 @@
+"""`Idempotency-Key` support for create endpoints.
+
+Clients on flaky connections retry `POST /workouts` and `POST /templates`. A request carrying an
+`Idempotency-Key` first claims the key in its own short transaction. The claim then records
+the created row's id in the request's transaction, so the two commit together. A retry of a
+completed request is answered from that row, and nothing is encrypted or inserted again. A
+retry that arrives while the first attempt is still running gets a 409. Keys expire after
+`IDEMPOTENCY_KEY_TTL_SECONDS` and are swept by the scheduler.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import adapter
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _normalize(ts: datetime) -> datetime:
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def _key_hash(scope: str, key: str) -> bytes:
+    return hashlib.sha256(f"{scope}\0{key}".encode("utf-8")).digest()
+
+
+def fingerprint(request: BaseModel) -> bytes:
+    return hashlib.sha256(request.model_dump_json().encode("utf-8")).digest()
+
+
+@dataclass(slots=True)
+class Claim:
+    user_id: str
+    key_hash: bytes
+    # Set when an earlier request with this key already created the resource.
+    replay_id: str | None = None
+
+    def complete(self, db: Session, resource_id: str) -> None:
+        """Record the created row in the request's transaction, so both commit or neither does."""
+        db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == self.user_id, IdempotencyKey.key_hash == self.key_hash)
+            .values(resource_id=resource_id)
+        )
+
+
+def _claim(user_id: str, key_hash: bytes, request_hash: bytes) -> Claim:
+    with adapter.session() as db:
+        record = db.get(IdempotencyKey, (user_id, key_hash))
+        if record is not None:
+            age = (_now() - _normalize(record.created_at)).total_seconds()
+            # An unfinished claim this old belongs to a worker that died mid-request.
+            abandoned = record.resource_id is None and age > settings.idempotency_lock_seconds
+            if age <= settings.idempotency_key_ttl_seconds and not abandoned:
+                if record.request_hash != request_hash:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                        detail="Idempotency-Key was already used with a different request",
+                    )
+                if record.resource_id is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="A request with this Idempotency-Key is still in progress",
+                        headers={"Retry-After": "1"},
+                    )
+                return Claim(user_id, key_hash, record.resource_id)
+            db.delete(record)
+            db.flush()
+        db.add(IdempotencyKey(user_id=user_id, key_hash=key_hash, request_hash=request_hash))
+        db.flush()
+    return Claim(user_id, key_hash)
+
+
+def claim(user_id: str, scope: str, key: str, request_hash: bytes) -> Claim:
+    key_hash = _key_hash(scope, key)
+    try:
+        return _claim(user_id, key_hash, request_hash)
+    except IntegrityError:
+        # A concurrent duplicate inserted the key between our read and insert.
+        return _claim(user_id, key_hash, request_hash)
+
+
+def release(claimed: Claim) -> None:
+    """Drop an unfinished claim so the client can retry a request that failed."""
+    with adapter.session() as db:
+        db.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == claimed.user_id,
+                IdempotencyKey.key_hash == claimed.key_hash,
+                IdempotencyKey.resource_id.is_(None),
+            )
+        )
+
+
+@contextmanager
+def idempotent(
+    db: Session, user_id: str, scope: str, key: str | None, request: BaseModel, response: Response
+) -> Iterator[Claim | None]:
+    """Claim `key` for the body of the block; yields None when the client sent no key.
+
+    `db` is the request's session. If the block fails it is rolled back before the claim is
+    released, since on SQLite its pending insert would otherwise hold the write lock.
+    """
+    if key is None:
+        yield None
+        return
+    claimed = claim(user_id, scope, key, fingerprint(request))
+    if claimed.replay_id is not None:
+        response.headers[REPLAYED_HEADER] = "true"
+        yield claimed
+        return
+    try:
+        yield claimed
+    except BaseException:
+        db.rollback()
+        release(claimed)
+        raise
+
+
+def expire_idempotency_keys() -> int:
+    cutoff = _now() - timedelta(seconds=settings.idempotency_key_ttl_seconds)
+    with adapter.session() as db:
+        result = db.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.created_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+    removed = result.rowcount or 0
+    if removed:
+        logger.info("Expired %d idempotency keys", removed)
+    return removed
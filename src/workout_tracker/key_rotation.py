@@ -0,0 +1,247 @@
+"""Data-key rotation: replace a user's data key and re-encrypt everything it protects.
+
+Starting a rotation needs the user's token. It wraps a keyring (new key, retired key) as the
+user's envelope, so reads keep working while rows are re-encrypted in bounded batches, and a
+second envelope holding only the new key. Every row records the key generation it is encrypted
+under and a batch only rewrites rows still below the target, so the job can stop and resume
+anywhere and never overwrites a row the user saved under the new key in the meantime. Once no
+row is left behind, the single-key envelope replaces the keyring.
+
+Two things keep a request that loaded the user before the rotation from writing under the
+retired key after it: every encrypting write first takes the user's row and checks its key
+generation (`lock_key_generation`), and each re-encrypted row has its `version` bumped, so a
+writer holding the row from before the batch gets a 412.
+
+The keyring is never stored outside the user's own envelope, so the job only runs while the
+worker that started it holds the keyring in memory. A job that dies with its worker, or fails,
+waits for the user: their next `POST /users/encryption/rotate-key` unwraps the keyring with their
+token and resumes it where it stopped.
+"""
+from __future__ import annotations
+
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from cryptography.fernet import Fernet
+from fastapi import HTTPException, status
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from .auth.session_store import key_handles
+from .blind_index import index_workouts
+from .config import settings
+from .database import adapter
+from .encryption import KEYRING_SEPARATOR, EncryptionService, keyring_primary
+from .models import KeyRotation, User, Workout, WorkoutSetLog, WorkoutTemplate
+from .set_log import assemble, load_ops
+from .user_cache import invalidate_on_commit
+
+logger = logging.getLogger(__name__)
+
+_ENCRYPTED = (Workout, WorkoutTemplate, WorkoutSetLog)
+STALE_AFTER = timedelta(minutes=5)
+_encryption_service = EncryptionService()
+
+
+def _pending_rows(db: Session, user_id: str, generation: int) -> int:
+    return sum(
+        db.scalar(
+            select(func.count())
+            .select_from(model)
+            .where(model.user_id == user_id, model.key_generation < generation)
+        )
+        or 0
+        for model in _ENCRYPTED
+    )
+
+
+def rewrap_envelopes(encryption_service: EncryptionService, user: User, data_key: bytes, token: str) -> None:
+    """Wrap `data_key` (and the pending new key, mid-rotation) under `token` for `user`."""
+    keys = [data_key]
+    if user.pending_data_key is not None:
+        keys.append(keyring_primary(data_key))
+    salt, envelopes, kdf_params = encryption_service.wrap_envelopes(keys, token)
+    user.encryption_salt = salt
+    user.encrypted_data_key = envelopes[0]
+    user.pending_data_key = envelopes[1] if len(envelopes) > 1 else None
+    user.kdf_params = kdf_params
+
+
+def lock_key_generation(db: Session, user: User) -> None:
+    """Take `user`'s row for the rest of this transaction and check `user` still has its current key.
+
+    Call before encrypting anything with the request's data key. A rotation cannot start until
+    the write commits, so the row is either rotated with the rest or refused here (409).
+    """
+    # A no-op UPDATE rather than SELECT ... FOR UPDATE, which SQLite ignores. It changes
+    # nothing, so cached copies of the user stay valid.
+    locked = db.execute(
+        update(User)
+        .where(User.id == user.id, User.key_generation == user.key_generation)
+        .values(key_generation=User.key_generation, updated_at=User.updated_at)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not locked:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="The data key was rotated during this request; retry it"
+        )
+
+
+def start_key_rotation(
+    db: Session, encryption_service: EncryptionService, user: User, data_key: bytes, token: str
+) -> tuple[KeyRotation, bytes]:
+    """Wrap a new keyring for `user` and record the job; returns it with the keyring to run it with."""
+    new_key = Fernet.generate_key()
+    keyring = new_key + KEYRING_SEPARATOR + data_key
+    salt, (envelope, pending), kdf_params = encryption_service.wrap_envelopes([keyring, new_key], token)
+    user.encryption_salt = salt
+    user.encrypted_data_key = envelope
+    user.pending_data_key = pending
+    user.kdf_params = kdf_params
+    user.key_generation += 1
+    # Tickets and key handles still hold the single old key; force them to unwrap the keyring.
+    user.encryption_version += 1
+    job = KeyRotation(
+        id=str(uuid.uuid4()),
+        user_id=user.id,
+        generation=user.key_generation,
+        total_rows=_pending_rows(db, user.id, user.key_generation),
+    )
+    db.add(job)
+    db.flush()
+    return job, keyring
+
+
+def unfinished_rotation(db: Session, user: User) -> KeyRotation | None:
+    return db.scalars(
+        select(KeyRotation).where(
+            KeyRotation.user_id == user.id,
+            KeyRotation.generation == user.key_generation,
+            KeyRotation.status != "done",
+        )
+    ).first()
+
+
+def is_stalled(job: KeyRotation) -> bool:
+    """Whether no worker is running `job`: it failed, or its worker stopped reporting progress."""
+    if job.status == "failed":
+        return True
+    updated_at = job.updated_at
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return updated_at < datetime.now(timezone.utc) - STALE_AFTER
+
+
+def _rotate_batch(
+    model, user_id: str, generation: int, keyring: bytes, rotate: Callable[[bytes], bytes], batch_size: int
+) -> int:
+    table = model.__table__
+    with adapter.session() as db:
+        rows = db.execute(
+            select(model.id, model.encrypted_payload)
+            .where(model.user_id == user_id, model.key_generation < generation)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return 0
+        # Keep updated_at: re-encryption is not an edit. The generation guard skips rows the
+        # user rewrote under the new key after we read them, and the version bump makes a write
+        # that read the row before this batch fail its version check.
+        values = {"encrypted_payload": bindparam("payload"), "key_generation": generation}
+        if "updated_at" in table.c:
+            values["updated_at"] = table.c.updated_at
+        if "version" in table.c:
+            values["version"] = table.c.version + 1
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"), table.c.key_generation < generation)
+            .values(**values)
+        )
+        rotated = [(row_id, rotate(blob)) for row_id, blob in rows]
+        db.execute(stmt, [{"row_id": row_id, "payload": blob} for row_id, blob in rotated])
+        if model is Workout:
+            # Blind-index tokens follow the key; re-derive them under the new one, but only for
+            # rows this batch actually wrote (the user's own save already re-indexed the rest).
+            written = select(table.c.id, table.c.encrypted_payload).where(
+                table.c.id.in_([row_id for row_id, _ in rotated])
+            )
+            current = dict(db.execute(written).all())
+            reindex = [(row_id, blob) for row_id, blob in rotated if current.get(row_id) == blob]
+            # Set-log entries appended since the log was rotated may still be under either key.
+            ops = load_ops(db, [row_id for row_id, _ in reindex])
+            index_workouts(
+                db,
+                user_id,
+                keyring_primary(keyring),
+                (
+                    (row_id, assemble(_encryption_service, keyring, blob, ops.get(row_id, ())))
+                    for row_id, blob in reindex
+                ),
+            )
+    return len(rows)
+
+
+def _record(job_id: str, **values) -> None:
+    with adapter.session() as db:
+        db.execute(update(KeyRotation).where(KeyRotation.id == job_id).values(**values))
+
+
+def _finish(job_id: str, user_id: str, generation: int) -> bool:
+    with adapter.session() as db:
+        # Writes that took the user row before the rotation started may have landed since.
+        if _pending_rows(db, user_id, generation):
+            return False
+        db.execute(
+            update(User)
+            .where(User.id == user_id, User.pending_data_key.is_not(None))
+            .values(
+                encrypted_data_key=User.pending_data_key,
+                pending_data_key=None,
+                encryption_version=User.encryption_version + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            update(KeyRotation).where(KeyRotation.id == job_id).values(status="done", error=None)
+        )
+        invalidate_on_commit(db, user_id)
+    key_handles.drop_user(user_id)
+    return True
+
+
+def run_key_rotation(job_id: str, keyring: bytes, batch_size: int | None = None) -> None:
+    """Run or resume `job_id`; `keyring` is the user's data key while the rotation is pending."""
+    batch_size = batch_size or settings.key_rotation_batch_size
+    with adapter.session() as db:
+        job = db.get(KeyRotation, job_id)
+        if job is None or job.status == "done":
+            return
+        user_id, generation, rotated = job.user_id, job.generation, job.rotated_rows
+    rotate = _encryption_service.payload_rotator(keyring)
+    _record(job_id, status="running", error=None)
+    try:
+        while True:
+            for model in _ENCRYPTED:
+                while count := _rotate_batch(model, user_id, generation, keyring, rotate, batch_size):
+                    rotated += count
+                    # Bumps updated_at too, which tells a resuming request this run is alive.
+                    _record(job_id, rotated_rows=rotated)
+            if _finish(job_id, user_id, generation):
+                return
+    except Exception as exc:
+        logger.exception("Key rotation %s failed", job_id)
+        _record(job_id, status="failed", error=f"{type(exc).__name__}: {exc}")
+
+
+def mark_stalled_key_rotations() -> int:
+    """Report rotations whose worker died as failed, so their status tells the user to resume."""
+    cutoff = datetime.now(timezone.utc) - STALE_AFTER
+    with adapter.session() as db:
+        stalled = db.execute(
+            update(KeyRotation)
+            .where(KeyRotation.status.in_(("pending", "running")), KeyRotation.updated_at < cutoff)
+            .values(status="failed", error="Interrupted; resume with POST /users/encryption/rotate-key")
+        )
+    return stalled.rowcount
@@ -0,0 +1,209 @@
+"""Live updates for workouts in progress, pushed to a user's other devices over Server-Sent Events.
+
+Devices watching a workout hold `GET /workouts/{id}/live` open. Edits still go through the
+regular endpoints, so the response to `POST /workouts/{id}/sets` is the acknowledgement and the
+set is persisted as it is logged. Each edit queues an event on the request's session, and the
+event is fanned out to every stream on that workout once the transaction commits. A stream holds
+no database connection, only a small queue on the event loop. A stream whose queue fills
+(a stalled client, or a socket that stopped draining) has its backlog replaced by a single
+`resync` event, which tells the client to refetch the workout, so one slow device never buffers
+without bound. Streams are per process: devices connected to different workers do not see each
+other's events.
+
+A stream lasts only as long as the session that opened it. Revoking sessions (signing out,
+changing the encryption token, deleting the account) ends the worker's matching streams once
+the revocation commits, and every `LIVE_SESSION_CHECK_SECONDS` each stream also looks its
+session up again, which catches revocations made by other workers.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, AsyncIterator
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .auth.session_store import get_session_store
+from .config import settings
+from .database import adapter
+
+HEARTBEAT = ": ping\n\n"
+_PENDING = "live_actions"
+
+
+def format_event(event_id: int, name: str, data: dict[str, Any]) -> str:
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+@dataclass(eq=False)
+class Subscription:
+    user_id: str
+    workout_id: str
+    session_key: str | None
+    loop: asyncio.AbstractEventLoop
+    # None marks the end of the stream.
+    queue: asyncio.Queue[str | None] = field(default_factory=lambda: asyncio.Queue(settings.live_queue_size))
+    resyncs: int = 0
+    closed: bool = False
+
+    def offer(self, message: str, resync: str) -> None:
+        """Queue `message`; runs on the subscriber's event loop."""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(resync)
+            self.resyncs += 1
+
+    def close(self) -> None:
+        """End the stream, dropping anything still queued; runs on the subscriber's event loop."""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class LiveHub:
+    """In-process fan-out from committed edits to the streams watching each workout."""
+
+    def __init__(self) -> None:
+        self._subscriptions: dict[str, set[Subscription]] = defaultdict(set)
+        self._per_user: dict[str, int] = defaultdict(int)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._published = 0
+        self._resyncs = 0
+
+    def subscribe(self, user_id: str, workout_id: str, session_key: str | None = None) -> Subscription | None:
+        """Register a stream on the running loop; None once the user is at their stream limit."""
+        with self._lock:
+            if self._per_user[user_id] >= settings.live_max_streams_per_user:
+                return None
+            subscription = Subscription(user_id, workout_id, session_key, asyncio.get_running_loop())
+            self._subscriptions[workout_id].add(subscription)
+            self._per_user[user_id] += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            watchers = self._subscriptions.get(subscription.workout_id)
+            if watchers is None or subscription not in watchers:
+                return
+            watchers.discard(subscription)
+            if not watchers:
+                del self._subscriptions[subscription.workout_id]
+            self._per_user[subscription.user_id] -= 1
+            if not self._per_user[subscription.user_id]:
+                del self._per_user[subscription.user_id]
+            self._resyncs += subscription.resyncs
+
+    def publish(self, workout_id: str, name: str, data: dict[str, Any]) -> int:
+        """Send an event to every stream on `workout_id`; callable from any thread."""
+        with self._lock:
+            watchers = list(self._subscriptions.get(workout_id, ()))
+            event_id = next(self._ids)
+            self._published += 1
+        if not watchers:
+            return 0
+        message = format_event(event_id, name, data)
+        resync = format_event(event_id, "resync", {"workout_id": workout_id})
+        for subscription in watchers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message, resync)
+            except RuntimeError:
+                # The stream's loop has shut down; its generator's cleanup will unsubscribe it.
+                pass
+        return len(watchers)
+
+    def close(self, *, user_id: str | None = None, session_key: str | None = None) -> int:
+        """End every stream opened by `session_key`, or by any of `user_id`'s sessions."""
+        with self._lock:
+            targets = [
+                subscription
+                for watchers in self._subscriptions.values()
+                for subscription in watchers
+                if (subscription.session_key == session_key if session_key else subscription.user_id == user_id)
+            ]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.close)
+            except RuntimeError:
+                pass
+        return len(targets)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "streams": sum(len(watchers) for watchers in self._subscriptions.values()),
+                "workouts": len(self._subscriptions),
+                "events_published": self._published,
+                "resyncs": self._resyncs + sum(
+                    subscription.resyncs for watchers in self._subscriptions.values() for subscription in watchers
+                ),
+            }
+
+
+hub = LiveHub()
+
+
+def _session_alive(session_key: str) -> bool:
+    with adapter.session() as db:
+        return get_session_store().get(db, session_key) is not None
+
+
+async def stream(subscription: Subscription) -> AsyncIterator[str]:
+    """The SSE body for one subscription; a comment line keeps idle connections alive."""
+    try:
+        yield f"retry: {settings.live_retry_ms}\n\n"
+        checked = time.monotonic()
+        while True:
+            try:
+                async with asyncio.timeout(settings.live_heartbeat_seconds):
+                    message = await subscription.queue.get()
+            except TimeoutError:
+                message = HEARTBEAT
+            if message is None:
+                return
+            interval = settings.live_session_check_seconds
+            if subscription.session_key and interval and time.monotonic() - checked >= interval:
+                if not await run_in_threadpool(_session_alive, subscription.session_key):
+                    return
+                checked = time.monotonic()
+            yield message
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def publish_after_commit(db: Session, workout_id: str, name: str, data: dict[str, Any]) -> None:
+    """Publish once `db` commits, so no device hears about an edit that was rolled back."""
+    db.info.setdefault(_PENDING, []).append(partial(hub.publish, workout_id, name, data))
+
+
+def close_after_commit(db: Session, *, user_id: str | None = None, session_key: str | None = None) -> None:
+    """End the matching streams once `db` commits the revocation of their sessions.
+
+    Closing any earlier would let a device reconnect on a session that is still valid.
+    """
+    db.info.setdefault(_PENDING, []).append(partial(hub.close, user_id=user_id, session_key=session_key))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    for action in session.info.pop(_PENDING, ()):
+        action()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_pending(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING, None)
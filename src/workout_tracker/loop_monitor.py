@@ -0,0 +1,82 @@
+"""Event-loop lag monitoring.
+
+A heartbeat coroutine records when the loop last got to run; a watchdog thread notices when
+it has not run for longer than the threshold and captures the loop thread's stack, which
+points at the blocking call (sync DB work or a KDF inside an `async def` handler, say).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class LoopStall:
+    lag_seconds: float
+    stack: str
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_seconds: float, max_recorded: int = 50) -> None:
+        self.threshold = threshold_seconds
+        self.stalls: list[LoopStall] = []
+        self.max_lag = 0.0
+        self._max_recorded = max_recorded
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._heartbeat: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat = asyncio.create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    def stats(self) -> dict[str, float | int]:
+        return {"stalls": len(self.stalls), "max_lag_ms": round(self.max_lag * 1000, 1)}
+
+    async def _beat(self) -> None:
+        interval = self.threshold / 4
+        while True:
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(interval)
+
+    def _watch(self) -> None:
+        interval = self.threshold / 4
+        stalled_since: float | None = None
+        while not self._stopped.wait(interval):
+            last_tick = self._last_tick
+            lag = time.monotonic() - last_tick - interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag <= self.threshold:
+                stalled_since = None
+                continue
+            if stalled_since == last_tick:
+                continue  # Already reported this stall.
+            stalled_since = last_tick
+            frame = sys._current_frames().get(self._loop_thread_id or 0)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            logger.warning("Event loop blocked for %.0f ms:\n%s", lag * 1000, stack)
+            if len(self.stalls) < self._max_recorded:
+                self.stalls.append(LoopStall(lag, stack))
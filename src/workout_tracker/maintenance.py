@@ -0,0 +1,98 @@
+"""Periodic maintenance jobs run by the in-process scheduler."""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, exists, select
+
+from . import cache
+from .account_deletion import resume_account_deletions
+from .auth.challenge_store import sweep_expired_challenges
+from .auth.session_store import get_session_store, key_handles
+from .config import settings
+from .database import adapter
+from .idempotency import expire_idempotency_keys
+from .key_rotation import mark_stalled_key_rotations
+from .models import PasskeyCredential, User
+from .rate_limit import get_rate_limit_backend
+from .scheduler import Scheduler
+from .user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+
+def expire_sessions() -> int:
+    with adapter.session() as db:
+        return get_session_store().purge_expired(db)
+
+
+def prune_abandoned_users() -> int:
+    """Delete users left behind by `passkey/register/begin` that never completed registration."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.abandoned_user_max_age_seconds)
+    has_credentials = exists(select(PasskeyCredential.id).where(PasskeyCredential.user_id == User.id))
+    # No user cache invalidation: these users never finished registering, so no session ever
+    # loaded them into it.
+    stmt = delete(User).where(User.encryption_salt == b"", User.created_at < cutoff, ~has_credentials)
+    with adapter.session() as db:
+        removed = db.execute(stmt.execution_options(synchronize_session=False)).rowcount or 0
+    if removed:
+        logger.info("Pruned %d abandoned registrations", removed)
+    return removed
+
+
+def optimize_database() -> None:
+    engine = adapter.engine
+    # VACUUM cannot run inside a transaction.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("ANALYZE")
+        if engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("VACUUM")
+
+
+def refresh_caches() -> int:
+    removed = key_handles.purge_idle() + user_cache.purge_expired() + cache.purge_expired()
+    if settings.rate_limit_backend == "memory":
+        removed += get_rate_limit_backend().purge_idle()
+    return removed
+
+
+def expire_rate_limits() -> int:
+    return get_rate_limit_backend().purge_idle()
+
+
+def build_scheduler() -> Scheduler:
+    scheduler = Scheduler()
+    # A memory challenge/session store lives in each worker, so every worker sweeps its own.
+    scheduler.every(
+        settings.challenge_sweep_interval_seconds,
+        "expire-challenges",
+        sweep_expired_challenges,
+        timeout=30,
+        jitter=5,
+        leader_only=settings.challenge_backend == "sql",
+    )
+    scheduler.every(
+        settings.challenge_sweep_interval_seconds * 5,
+        "expire-sessions",
+        expire_sessions,
+        timeout=60,
+        jitter=15,
+        leader_only=settings.session_backend != "memory",
+    )
+    if settings.rate_limit_backend == "sql":
+        scheduler.every(3600, "expire-rate-limits", expire_rate_limits, timeout=120, jitter=60)
+    scheduler.every(300, "resume-account-deletions", resume_account_deletions, timeout=3600, jitter=30)
+    scheduler.every(300, "mark-stalled-key-rotations", mark_stalled_key_rotations, timeout=60, jitter=30)
+    scheduler.every(3600, "expire-idempotency-keys", expire_idempotency_keys, timeout=120, jitter=60)
+    scheduler.every(3600, "prune-abandoned-users", prune_abandoned_users, timeout=120, jitter=60)
+    scheduler.cron(settings.database_maintenance_cron, "optimize-database", optimize_database, timeout=1800)
+    scheduler.every(
+        settings.cache_refresh_interval_seconds,
+        "refresh-caches",
+        refresh_caches,
+        timeout=10,
+        jitter=5,
+        leader_only=False,
+    )
+    return scheduler
@@ -0,0 +1,75 @@
+"""JSON merge patch (RFC 7396) and `If-Match` preconditions for encrypted resources.
+
+The server cannot patch ciphertext, so a patch is applied to the decrypted payload and the
+result re-validated and re-encrypted. What it saves is the upload: a client that only changed
+`end_time` sends only `end_time`. Each row carries a `version` that SQLAlchemy bumps and checks
+on every UPDATE; it doubles as the ETag, so two devices editing the same workout get a 412
+instead of silently overwriting each other.
+"""
+from __future__ import annotations
+
+import copy
+from typing import Any, TypeVar
+
+from fastapi import HTTPException, Response, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+MERGE_PATCH_MEDIA_TYPE = "application/merge-patch+json"
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """Apply `patch` to `target` as RFC 7396 describes; `target` is not modified."""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def apply_patch(model: type[ModelT], current: dict[str, Any], patch: dict[str, Any]) -> ModelT:
+    """Merge `patch` into `current` and validate the result as `model` (422 if it is invalid)."""
+    try:
+        return model.model_validate(merge_patch(current, patch))
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False, include_context=False)) from exc
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def set_etag(response: Response, version: int) -> None:
+    response.headers["ETag"] = etag(version)
+
+
+def _precondition_failed(headers: dict[str, str] | None = None) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Resource has changed", headers=headers
+    )
+
+
+def check_if_match(if_match: str | None, version: int) -> None:
+    """Raise 412 unless `If-Match` is absent, `*`, or lists the current version's ETag."""
+    if if_match is None:
+        return
+    candidates = {candidate.strip() for candidate in if_match.split(",")}
+    if "*" in candidates or etag(version) in candidates:
+        return
+    raise _precondition_failed({"ETag": etag(version)})
+
+
+def flush_versioned(db: Session) -> None:
+    """Flush an edit to a versioned row; 412 if another request updated it since it was read."""
+    try:
+        db.flush()
+    except StaleDataError as exc:
+        raise _precondition_failed() from exc
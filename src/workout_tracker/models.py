@@ -4,12 +4,16 @@ import uuid
 from datetime import datetime, timezone
 from typing import Optional
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, LargeBinary, String, Text
+from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Index, LargeBinary, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
 
 
+# Bump to make every user's blind index rebuild on their next filtered query.
+BLIND_INDEX_VERSION = 1
+
+
 def _uuid() -> str:
     return str(uuid.uuid4())
 
@@ -33,13 +37,25 @@ class User(Base):
     encryption_version: Mapped[int] = mapped_column(default=1)
     encryption_salt: Mapped[bytes] = mapped_column(LargeBinary)
     encrypted_data_key: Mapped[bytes] = mapped_column(LargeBinary)
+    kdf_params: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # Generation of the newest data key. During a rotation `encrypted_data_key` wraps the
+    # keyring (new key, retired key) and `pending_data_key` the new key alone, under the same salt.
+    key_generation: Mapped[int] = mapped_column(default=1, server_default="1")
+    pending_data_key: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    # New users start with an (empty) index; rows that predate the index get 0 and rebuild.
+    blind_index_version: Mapped[int] = mapped_column(default=BLIND_INDEX_VERSION, server_default="0")
 
     passkey_user_handle: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
 
-    workouts: Mapped[list["Workout"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    templates: Mapped[list["WorkoutTemplate"]] = relationship(back_populates="user", cascade="all, delete-orphan")
+    # passive_deletes: deleting a user never loads its children; the database cascades.
+    workouts: Mapped[list["Workout"]] = relationship(
+        back_populates="user", cascade="all, delete-orphan", passive_deletes=True
+    )
+    templates: Mapped[list["WorkoutTemplate"]] = relationship(
+        back_populates="user", cascade="all, delete-orphan", passive_deletes=True
+    )
     credentials: Mapped[list["PasskeyCredential"]] = relationship(
-        back_populates="user", cascade="all, delete-orphan"
+        back_populates="user", cascade="all, delete-orphan", passive_deletes=True
     )
 
 
@@ -47,9 +63,14 @@ class Workout(Base):
     __tablename__ = "workouts"
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=_uuid)
-    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     encrypted_payload: Mapped[bytes] = mapped_column(LargeBinary)
+    key_generation: Mapped[int] = mapped_column(default=1, server_default="1")
     notes_search: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Entries in `workout_set_log` not yet folded into `encrypted_payload`.
+    set_log_length: Mapped[int] = mapped_column(default=0, server_default="0")
+    # Bumped and checked by every ORM UPDATE; served as the ETag (see `merge_patch`).
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=_utcnow, onupdate=_utcnow
@@ -57,26 +78,57 @@ class Workout(Base):
 
     user: Mapped["User"] = relationship(back_populates="workouts")
 
+    __mapper_args__ = {"version_id_col": version}
+
+
+class WorkoutSetLog(Base):
+    """One encrypted set-level edit (append, amend or remove) to a workout; see `set_log`."""
+
+    __tablename__ = "workout_set_log"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=_uuid)
+    workout_id: Mapped[str] = mapped_column(ForeignKey("workouts.id", ondelete="CASCADE"), index=True)
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    seq: Mapped[int]
+    encrypted_payload: Mapped[bytes] = mapped_column(LargeBinary)
+    key_generation: Mapped[int] = mapped_column(default=1, server_default="1")
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+
+
+class WorkoutIndexToken(Base):
+    """Keyed HMAC of a value inside a workout's payload; see `blind_index`."""
+
+    __tablename__ = "workout_index_tokens"
+    __table_args__ = (Index("ix_workout_index_tokens_user_token", "user_id", "token"),)
+
+    workout_id: Mapped[str] = mapped_column(ForeignKey("workouts.id", ondelete="CASCADE"), primary_key=True)
+    token: Mapped[bytes] = mapped_column(LargeBinary(16), primary_key=True)
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+
 
 class WorkoutTemplate(Base):
     __tablename__ = "workout_templates"
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=_uuid)
-    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     encrypted_payload: Mapped[bytes] = mapped_column(LargeBinary)
+    key_generation: Mapped[int] = mapped_column(default=1, server_default="1")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=_utcnow, onupdate=_utcnow
     )
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
 
     user: Mapped["User"] = relationship(back_populates="templates")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class PasskeyCredential(Base):
     __tablename__ = "passkey_credentials"
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=_uuid)
-    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     credential_id: Mapped[bytes] = mapped_column(LargeBinary, unique=True)
     public_key: Mapped[bytes] = mapped_column(LargeBinary)
     sign_count: Mapped[int] = mapped_column(default=0)
@@ -94,6 +146,74 @@ class AuthChallenge(Base):
     user_id: Mapped[str | None] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
     challenge: Mapped[str] = mapped_column(String(255), unique=True)
     purpose: Mapped[str] = mapped_column(String(32))
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow, index=True)
 
     user: Mapped[Optional["User"]] = relationship()
+
+
+class AuthSession(Base):
+    __tablename__ = "auth_sessions"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    sealed_token: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
+class SchedulerLock(Base):
+    __tablename__ = "scheduler_locks"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(128))
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float)
+    updated_at: Mapped[float] = mapped_column(Float, index=True)
+
+
+class IdempotencyKey(Base):
+    """A create request seen under an `Idempotency-Key`; see `idempotency`."""
+
+    __tablename__ = "idempotency_keys"
+
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # SHA-256 of the route and the client's key, so arbitrary client strings stay fixed-size.
+    key_hash: Mapped[bytes] = mapped_column(LargeBinary(32), primary_key=True)
+    request_hash: Mapped[bytes] = mapped_column(LargeBinary(32))
+    # Null while the first request is still in flight.
+    resource_id: Mapped[str | None] = mapped_column(String(36), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow, index=True)
+
+
+class AccountDeletion(Base):
+    __tablename__ = "account_deletions"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=_uuid)
+    # Deliberately not a foreign key: the job outlives the user it deletes.
+    user_id: Mapped[str] = mapped_column(String(36), index=True)
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+    total_rows: Mapped[int] = mapped_column(default=0)
+    deleted_rows: Mapped[int] = mapped_column(default=0)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
+
+
+class KeyRotation(Base):
+    __tablename__ = "key_rotations"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=_uuid)
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    generation: Mapped[int]
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+    total_rows: Mapped[int] = mapped_column(default=0)
+    rotated_rows: Mapped[int] = mapped_column(default=0)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
@@ -0,0 +1,211 @@
+"""Token-bucket rate limiting for expensive endpoints.
+
+Each limited route has a policy per client IP and, when the caller is signed in, per user.
+Policies are written as `"<count>/<second|minute|hour|day>"`: a bucket holds `count` tokens
+and refills at that rate. Routes name their policies (`users.create.ip`, ...) so deployments
+can override them through `RATE_LIMITS`; an empty string or `"0"` disables one.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import case, update
+from sqlalchemy.exc import IntegrityError
+
+from .config import settings
+from .database import adapter
+from .deps import AuthContext, get_auth_context
+from .models import RateLimitBucket
+
+DEFAULT_POLICIES: dict[str, str] = {
+    # Anonymous registration inserts a user row before any credential exists.
+    "passkey.register_begin.ip": "20/hour",
+    "passkey.register_complete.ip": "20/hour",
+    "passkey.register_complete.user": "10/hour",
+    "users.create.ip": "10/hour",
+    "apple.complete.ip": "30/hour",
+    "encryption.rotate.ip": "10/hour",
+    "encryption.rotate.user": "5/hour",
+    "encryption.rotate_key.ip": "10/hour",
+    "encryption.rotate_key.user": "3/day",
+}
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True, slots=True)
+class BucketPolicy:
+    capacity: float
+    refill_per_second: float
+
+    @classmethod
+    def parse(cls, spec: str) -> BucketPolicy | None:
+        spec = spec.strip()
+        if not spec or spec == "0":
+            return None
+        count_text, _, unit = spec.partition("/")
+        count = float(count_text)
+        seconds = _UNITS.get(unit.strip().rstrip("s") or "second")
+        if seconds is None or count <= 0:
+            raise ValueError(f"invalid rate limit {spec!r}")
+        return cls(capacity=count, refill_per_second=count / seconds)
+
+
+def _refill(tokens: float, elapsed: float, policy: BucketPolicy) -> float:
+    return min(policy.capacity, tokens + max(0.0, elapsed) * policy.refill_per_second)
+
+
+def _take(tokens: float, policy: BucketPolicy, cost: float) -> tuple[float, float]:
+    """Return (tokens left, seconds to wait); a zero wait means the request may proceed."""
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / policy.refill_per_second
+
+
+class RateLimitBackend(ABC):
+    @abstractmethod
+    def take(self, key: str, policy: BucketPolicy, cost: float = 1.0) -> float:
+        ...
+
+    def purge_idle(self) -> int:
+        return 0
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Buckets in process memory; each worker enforces its own share of the limit."""
+
+    def __init__(self) -> None:
+        self._buckets: dict[str, tuple[float, float, BucketPolicy]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, policy: BucketPolicy, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (policy.capacity, now, policy))
+            tokens, wait = _take(_refill(tokens, now - updated_at, policy), policy, cost)
+            self._buckets[key] = (tokens, now, policy)
+        return wait
+
+    def purge_idle(self) -> int:
+        # A bucket that has refilled completely is indistinguishable from a missing one.
+        now = time.monotonic()
+        with self._lock:
+            full = [
+                key
+                for key, (tokens, updated_at, policy) in self._buckets.items()
+                if _refill(tokens, now - updated_at, policy) >= policy.capacity
+            ]
+            for key in full:
+                del self._buckets[key]
+        return len(full)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class SqlRateLimitBackend(RateLimitBackend):
+    """Buckets in `rate_limit_buckets`, shared by every worker and replica.
+
+    Each take is its own short transaction, so a request that later fails still spends its
+    token. The refill and the spend are one conditional `UPDATE`, so two workers taking from the
+    same bucket at once cannot both spend its last token (SQLite ignores `FOR UPDATE`, so a
+    read-then-write would let them).
+    """
+
+    def take(self, key: str, policy: BucketPolicy, cost: float = 1.0) -> float:
+        try:
+            return self._take(key, policy, cost)
+        except IntegrityError:
+            # Another worker created the bucket between our update and insert.
+            return self._take(key, policy, cost)
+
+    def _take(self, key: str, policy: BucketPolicy, cost: float) -> float:
+        table = RateLimitBucket.__table__
+        now = time.time()
+        elapsed = case((table.c.updated_at < now, now - table.c.updated_at), else_=0.0)
+        available = table.c.tokens + elapsed * policy.refill_per_second
+        refilled = case((available > policy.capacity, policy.capacity), else_=available)
+        with adapter.session() as db:
+            spent = db.execute(
+                update(table).where(table.c.key == key, refilled >= cost).values(tokens=refilled - cost, updated_at=now)
+            ).rowcount
+            if spent:
+                return 0.0
+            bucket = db.get(RateLimitBucket, key)
+            if bucket is None:
+                tokens, wait = _take(policy.capacity, policy, cost)
+                db.add(RateLimitBucket(key=key, tokens=tokens, updated_at=now))
+                db.flush()
+                return wait
+            wait = _take(_refill(bucket.tokens, now - bucket.updated_at, policy), policy, cost)[1]
+            # The UPDATE already refused; never let float rounding here turn that into a pass.
+            return max(wait, 1e-3)
+
+    def purge_idle(self) -> int:
+        # Rows idle for a day have refilled under every supported policy shorter than a day.
+        cutoff = time.time() - _UNITS["day"]
+        with adapter.session() as db:
+            result = db.query(RateLimitBucket).filter(RateLimitBucket.updated_at < cutoff).delete(
+                synchronize_session=False
+            )
+        return result or 0
+
+
+@lru_cache
+def _build_backend(backend: str) -> RateLimitBackend:
+    if backend == "sql":
+        return SqlRateLimitBackend()
+    return MemoryRateLimitBackend()
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    return _build_backend(settings.rate_limit_backend)
+
+
+@lru_cache(maxsize=128)
+def _parse_policy(spec: str) -> BucketPolicy | None:
+    return BucketPolicy.parse(spec)
+
+
+def policy_for(name: str) -> BucketPolicy | None:
+    spec = settings.rate_limits.get(name, DEFAULT_POLICIES.get(name, ""))
+    return _parse_policy(spec)
+
+
+def _client_ip(request: Request) -> str:
+    # Behind a proxy this is the proxy's address unless uvicorn trusts it (`FORWARDED_ALLOW_IPS`)
+    # and rewrites it from X-Forwarded-For.
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit(route: str) -> Callable[..., None]:
+    """Dependency enforcing the `<route>.ip` and `<route>.user` policies."""
+
+    def dependency(request: Request, auth: AuthContext = Depends(get_auth_context)) -> None:
+        if not settings.rate_limit_enabled:
+            return
+        backend = get_rate_limit_backend()
+        checks = [(f"{route}.ip", _client_ip(request))]
+        if auth.user is not None:
+            checks.append((f"{route}.user", auth.user.id))
+        for name, subject in checks:
+            policy = policy_for(name)
+            if policy is None:
+                continue
+            wait = backend.take(f"{name}:{subject}", policy)
+            if wait > 0:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests",
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))},
+                )
+
+    return dependency
@@ -0,0 +1,174 @@
+"""`POST /batch`: several API calls under one session lookup and one data-key unwrap.
+
+The home screen needs the session, templates, workouts and trends at once. Sent separately,
+each of those requests resolves the session, loads the user and unwraps the data key. A batch
+does that once, then dispatches every operation to the regular routes in-process, sharing the
+result through `deps.BatchScope`. Consecutive `GET`s run concurrently, each on its own
+database session, because a session cannot be shared between threads. Writes run one at a
+time, in order, on the batch's session. It is committed after each write that succeeds and
+rolled back after each one that fails, so every operation stands on its own.
+
+Only data routes can be batched, plus reads of who is signed in. The shared session, user and
+data key are resolved once, up front, so a sub-request that signs in or out, rotates a key or
+deletes the account would leave later sub-requests running on credentials it had just replaced.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any
+from urllib.parse import unquote
+
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match, Mount
+from starlette.types import Message
+
+from ..deps import AuthContext, BatchScope, get_auth_context, get_db, maybe_data_key
+from ..schemas import BatchOperation, BatchRequest, BatchResponse, BatchResult
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["batch"])
+
+_REQUEST_HEADERS_DROPPED = {"content-length", "content-type", "transfer-encoding"}
+_RESPONSE_HEADERS_DROPPED = {"content-length", "content-type"}
+
+_BATCHABLE_PREFIXES = ("/workouts", "/templates")
+_BATCHABLE_READS = {"/auth/session", "/users/me"}
+
+
+def _sub_scope(request: Request, op: BatchOperation, body: bytes, batch: BatchScope) -> dict[str, Any]:
+    path, _, query = op.path.partition("?")
+    # Cookies, the encryption token and tickets come from the batch request itself.
+    headers = {name: value for name, value in request.headers.items() if name not in _REQUEST_HEADERS_DROPPED}
+    headers.update({name.lower(): value for name, value in op.headers.items()})
+    if body:
+        headers.setdefault("content-type", "application/json")
+        headers["content-length"] = str(len(body))
+    state = {key: value for key, value in request.scope.get("state", {}).items() if key != "auth_context"}
+    state["batch"] = batch
+    return {
+        **request.scope,
+        "method": op.method,
+        "path": unquote(path),
+        "raw_path": path.encode("utf-8"),
+        "query_string": query.encode("utf-8"),
+        "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        "state": state,
+    }
+
+
+def _is_batchable(method: str, path: str) -> bool:
+    if method == "GET" and path in _BATCHABLE_READS:
+        return True
+    return any(path == prefix or path.startswith(f"{prefix}/") for prefix in _BATCHABLE_PREFIXES)
+
+
+def _is_api_route(request: Request, scope: dict[str, Any]) -> bool:
+    # Only the SPA is mounted; a path no route matches would fall through to it.
+    return any(
+        not isinstance(route, Mount) and route.matches(scope)[0] != Match.NONE for route in request.app.router.routes
+    )
+
+
+async def _dispatch(
+    request: Request, op: BatchOperation, batch: BatchScope, cookies: list[tuple[bytes, bytes]]
+) -> BatchResult:
+    body = b"" if op.body is None else json.dumps(op.body).encode("utf-8")
+    scope = _sub_scope(request, op, body, batch)
+    if scope["path"] == request.scope["path"]:
+        return BatchResult(status=400, body={"detail": "Batches cannot be nested"})
+    if not _is_api_route(request, scope):
+        return BatchResult(status=404, body={"detail": "Not Found"})
+    if not _is_batchable(op.method, scope["path"]):
+        return BatchResult(status=400, body={"detail": f"{op.method} {scope['path']} cannot be batched"})
+
+    received = False
+
+    async def receive() -> Message:
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    start: Message = {}
+    chunks: list[bytes] = []
+
+    async def send(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await request.app.router(scope, receive, send)
+    except Exception:
+        logger.exception("Batch operation %s %s failed", op.method, op.path)
+        return BatchResult(status=500, body={"detail": "Internal Server Error"})
+
+    headers = {}
+    for name, value in start.get("headers", []):
+        if name.lower() == b"set-cookie":
+            # Cookies are HttpOnly; they go on the batch's own response, never into its JSON body.
+            cookies.append((b"set-cookie", value))
+        else:
+            headers[name.decode("latin-1")] = value.decode("latin-1")
+    content = b"".join(chunks)
+    parsed: Any = None
+    if content:
+        is_json = "json" in headers.get("content-type", "")
+        parsed = json.loads(content) if is_json else content.decode("utf-8", "replace")
+    return BatchResult(
+        status=start.get("status", 500),
+        headers={name: value for name, value in headers.items() if name not in _RESPONSE_HEADERS_DROPPED},
+        body=parsed,
+    )
+
+
+def _settle(db: Session, succeeded: bool) -> bool:
+    if succeeded:
+        try:
+            db.commit()
+            return True
+        except Exception:
+            logger.exception("Committing a batch operation failed")
+    db.rollback()
+    return False
+
+
+@router.post("/batch", response_model=BatchResponse)
+async def run_batch(
+    payload: BatchRequest,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    auth: AuthContext = Depends(get_auth_context),
+    data_key: bytes | None = Depends(maybe_data_key),
+) -> BatchResponse:
+    # Unwrapping may have re-wrapped the user's envelope; sub-requests need a clean user row.
+    await run_in_threadpool(db.commit)
+    reads = BatchScope(auth=auth, data_key=data_key, db=None)
+    writes = BatchScope(auth=auth, data_key=data_key, db=db)
+    results: list[BatchResult] = []
+    cookies: list[tuple[bytes, bytes]] = []
+    operations = payload.requests
+    index = 0
+    while index < len(operations):
+        end = index
+        while end < len(operations) and operations[end].method == "GET":
+            end += 1
+        if end > index:
+            results += await asyncio.gather(*(_dispatch(request, op, reads, cookies) for op in operations[index:end]))
+            index = end
+            continue
+        result = await _dispatch(request, operations[index], writes, cookies)
+        if not await run_in_threadpool(_settle, db, result.status < 400) and result.status < 400:
+            result = BatchResult(status=500, body={"detail": "Internal Server Error"})
+        results.append(result)
+        index += 1
+    response.raw_headers.extend(cookies)
+    return BatchResponse(responses=results)
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Response, status
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from ..deps import get_current_user, get_data_key, get_db, get_encryption_service
 from ..encryption import EncryptionService
+from ..idempotency import IDEMPOTENCY_HEADER, idempotent
+from ..key_rotation import lock_key_generation
+from ..merge_patch import MERGE_PATCH_MEDIA_TYPE, apply_patch, check_if_match, flush_versioned, set_etag
 from ..models import User, WorkoutTemplate
 from ..schemas import TemplateCreate, TemplatePayload, TemplateRead
 
@@ -22,6 +25,7 @@ def _serialize(record: WorkoutTemplate, payload: TemplatePayload) -> TemplateRea
         id=record.id,
         created_at=record.created_at,
         updated_at=record.updated_at,
+        version=record.version,
         **payload.model_dump(),
     )
 
@@ -48,37 +52,86 @@ def list_templates(
 @router.post("", response_model=TemplateRead, status_code=status.HTTP_201_CREATED)
 def create_template(
     payload: TemplateCreate,
+    response: Response,
+    idempotency_key: str | None = Header(default=None, alias=IDEMPOTENCY_HEADER, max_length=255),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     data_key: bytes = Depends(get_data_key),
     encryption_service: EncryptionService = Depends(get_encryption_service),
 ) -> TemplateRead:
-    blob = encryption_service.encrypt_payload(data_key, payload.model_dump())
-    record = WorkoutTemplate(user=user, encrypted_payload=blob)
-    db.add(record)
-    db.flush()
-    return _serialize(record, payload)
+    with idempotent(db, user.id, "templates.create", idempotency_key, payload, response) as claim:
+        if claim is not None and claim.replay_id is not None:
+            record = _get_template_or_404(db, user, claim.replay_id)
+            return _serialize(record, _deserialize(record, data_key, encryption_service))
+        lock_key_generation(db, user)
+        blob = encryption_service.encrypt_payload(data_key, payload.model_dump())
+        record = WorkoutTemplate(user=user, encrypted_payload=blob, key_generation=user.key_generation)
+        db.add(record)
+        db.flush()
+        if claim is not None:
+            claim.complete(db, record.id)
+        return _serialize(record, payload)
 
 
 @router.delete("/{template_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_template(
     template_id: str,
+    if_match: str | None = Header(default=None),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ) -> None:
     record = _get_template_or_404(db, user, template_id)
+    check_if_match(if_match, record.version)
     db.delete(record)
+    flush_versioned(db)
+
+
+def _replace_template(
+    db: Session,
+    record: WorkoutTemplate,
+    user: User,
+    payload: TemplatePayload,
+    response: Response,
+    data_key: bytes,
+    encryption_service: EncryptionService,
+) -> TemplateRead:
+    lock_key_generation(db, user)
+    record.encrypted_payload = encryption_service.encrypt_payload(data_key, payload.model_dump())
+    record.key_generation = user.key_generation
+    flush_versioned(db)
+    set_etag(response, record.version)
+    return _serialize(record, payload)
 
 
 @router.put("/{template_id}", response_model=TemplateRead)
 def update_template(
     template_id: str,
     payload: TemplateCreate,
+    response: Response,
+    if_match: str | None = Header(default=None),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     data_key: bytes = Depends(get_data_key),
     encryption_service: EncryptionService = Depends(get_encryption_service),
 ) -> TemplateRead:
     record = _get_template_or_404(db, user, template_id)
-    record.encrypted_payload = encryption_service.encrypt_payload(data_key, payload.model_dump())
-    return _serialize(record, payload)
+    check_if_match(if_match, record.version)
+    return _replace_template(db, record, user, payload, response, data_key, encryption_service)
+
+
+@router.patch("/{template_id}", response_model=TemplateRead)
+def patch_template(
+    template_id: str,
+    response: Response,
+    patch: dict = Body(media_type=MERGE_PATCH_MEDIA_TYPE),
+    if_match: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    data_key: bytes = Depends(get_data_key),
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+) -> TemplateRead:
+    record = _get_template_or_404(db, user, template_id)
+    check_if_match(if_match, record.version)
+    current = encryption_service.decrypt_payload(data_key, record.encrypted_payload)
+    payload = apply_patch(TemplateCreate, current, patch)
+    return _replace_template(db, record, user, payload, response, data_key, encryption_service)
@@ -1,19 +1,30 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi import APIRouter, BackgroundTasks, Cookie, Depends, HTTPException, Response, status
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from ..auth.sessions import attach_session_cookie, clear_session_cookie
+from ..account_deletion import count_owned_rows, purge_account, run_account_deletion, start_account_deletion
+from ..auth.sessions import attach_session_cookie, clear_session_cookie, revoke_user_sessions
 from ..deps import (
     get_current_user,
     get_data_key,
     get_db,
+    get_encryption_context,
     get_encryption_service,
 )
-from ..encryption import EncryptionService
-from ..models import User
+from ..encryption import EncryptionContext, EncryptionService
+from ..config import settings
+from ..key_rotation import (
+    is_stalled,
+    rewrap_envelopes,
+    run_key_rotation,
+    start_key_rotation,
+    unfinished_rotation,
+)
+from ..models import AccountDeletion, KeyRotation, User
+from ..rate_limit import rate_limit
 from ..schemas import UserCreate, UserRead
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -29,7 +40,12 @@ def _serialize(user: User) -> UserRead:
     )
 
 
-@router.post("", response_model=UserRead, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "",
+    response_model=UserRead,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("users.create"))],
+)
 def create_user(
     payload: UserCreate,
     response: Response,
@@ -41,16 +57,17 @@ def create_user(
         existing = db.scalar(select(User).where(User.email == email))
         if existing:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-    salt, envelope = encryption_service.create_user_envelope(payload.encryption_token)
+    salt, envelope, kdf_params = encryption_service.create_user_envelope(payload.encryption_token)
     user = User(
         display_name=payload.display_name,
         email=email,
         encryption_salt=salt,
         encrypted_data_key=envelope,
+        kdf_params=kdf_params,
     )
     db.add(user)
     db.flush()
-    attach_session_cookie(response, user.id, encryption_token=payload.encryption_token)
+    attach_session_cookie(db, response, user.id, encryption_token=payload.encryption_token)
     return _serialize(user)
 
 
@@ -59,29 +76,132 @@ def read_me(user: User = Depends(get_current_user)) -> UserRead:
     return _serialize(user)
 
 
-@router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
+class AccountDeletionRead(BaseModel):
+    id: str
+    status: str
+    total_rows: int
+    deleted_rows: int
+
+
+def _deletion_status(job: AccountDeletion) -> AccountDeletionRead:
+    return AccountDeletionRead(
+        id=job.id, status=job.status, total_rows=job.total_rows, deleted_rows=job.deleted_rows
+    )
+
+
+@router.delete(
+    "/me",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={status.HTTP_202_ACCEPTED: {"model": AccountDeletionRead}},
+)
 def delete_me(
     response: Response,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
-) -> None:
-    db.delete(user)
-    clear_session_cookie(response)
+    session_token: str | None = Cookie(default=None, alias="session"),
+):
+    clear_session_cookie(db, response, session_token)
+    revoke_user_sessions(db, user.id)
+    total_rows = count_owned_rows(db, user.id)
+    if total_rows <= settings.account_deletion_background_threshold:
+        purge_account(db, user.id)
+        return None
+    # Large accounts are deleted in batches after the response; poll the status endpoint.
+    job = start_account_deletion(db, user, total_rows)
+    db.commit()
+    background_tasks.add_task(run_account_deletion, job.id)
+    response.status_code = status.HTTP_202_ACCEPTED
+    response.headers["Location"] = f"/users/deletions/{job.id}"
+    return _deletion_status(job)
+
+
+@router.get("/deletions/{job_id}", response_model=AccountDeletionRead)
+def account_deletion_status(job_id: str, db: Session = Depends(get_db)) -> AccountDeletionRead:
+    # The id is an unguessable capability: the caller's session is gone by the time they poll.
+    job = db.get(AccountDeletion, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Deletion not found")
+    return _deletion_status(job)
 
 
 class EncryptionRotatePayload(BaseModel):
     encryption_token: str
 
 
-@router.post("/encryption/rotate", response_model=UserRead)
+@router.post(
+    "/encryption/rotate", response_model=UserRead, dependencies=[Depends(rate_limit("encryption.rotate"))]
+)
 def rotate_encryption(
     payload: EncryptionRotatePayload,
+    response: Response,
+    db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     data_key: bytes = Depends(get_data_key),
     encryption_service: EncryptionService = Depends(get_encryption_service),
 ) -> UserRead:
-    salt, envelope = encryption_service.rotate_envelope(data_key, payload.encryption_token)
-    user.encryption_salt = salt
-    user.encrypted_data_key = envelope
+    rewrap_envelopes(encryption_service, user, data_key, payload.encryption_token)
     user.encryption_version += 1
+    # Re-issue the session so it carries the new token; other sessions must sign in again.
+    revoke_user_sessions(db, user.id)
+    attach_session_cookie(db, response, user.id, encryption_token=payload.encryption_token)
     return _serialize(user)
+
+
+class KeyRotationRead(BaseModel):
+    id: str
+    status: str
+    generation: int
+    total_rows: int
+    rotated_rows: int
+
+
+def _rotation_status(job: KeyRotation) -> KeyRotationRead:
+    return KeyRotationRead(
+        id=job.id,
+        status=job.status,
+        generation=job.generation,
+        total_rows=job.total_rows,
+        rotated_rows=job.rotated_rows,
+    )
+
+
+@router.post(
+    "/encryption/rotate-key",
+    response_model=KeyRotationRead,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(rate_limit("encryption.rotate_key"))],
+)
+def rotate_data_key(
+    response: Response,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    ctx: EncryptionContext = Depends(get_encryption_context),
+    data_key: bytes = Depends(get_data_key),
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+) -> KeyRotationRead:
+    if user.pending_data_key is not None:
+        # Mid-rotation the user's data key is the keyring, which is all a stalled job needs to resume.
+        job = unfinished_rotation(db, user)
+        if job is None or not is_stalled(job):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A key rotation is already in progress")
+        keyring = data_key
+    else:
+        job, keyring = start_key_rotation(db, encryption_service, user, data_key, ctx.token)
+    db.commit()
+    background_tasks.add_task(run_key_rotation, job.id, keyring)
+    response.headers["Location"] = f"/users/encryption/rotations/{job.id}"
+    return _rotation_status(job)
+
+
+@router.get("/encryption/rotations/{job_id}", response_model=KeyRotationRead)
+def key_rotation_status(
+    job_id: str,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+) -> KeyRotationRead:
+    job = db.get(KeyRotation, job_id)
+    if job is None or job.user_id != user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Key rotation not found")
+    return _rotation_status(job)
@@ -2,15 +2,33 @@ from __future__ import annotations
 
 from collections import defaultdict
 from datetime import datetime
-from typing import Dict, Tuple
+from typing import Dict, Sequence, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from ..deps import get_current_user, get_data_key, get_db, get_encryption_service
+from ..blind_index import (
+    add_workout_tokens,
+    candidate_ids,
+    index_workouts,
+    matches,
+    rebuild_stale_index,
+    rebuild_user_index,
+)
+from ..cache import Namespace, make_key
+from ..config import settings
+from ..deps import AuthContext, get_auth_context, get_current_user, get_data_key, get_db, get_encryption_service
 from ..encryption import EncryptionService
-from ..models import User, Workout
+from ..idempotency import IDEMPOTENCY_HEADER, idempotent
+from ..key_rotation import lock_key_generation
+from ..live import hub, publish_after_commit, stream
+from ..merge_patch import MERGE_PATCH_MEDIA_TYPE, apply_patch, check_if_match, flush_versioned, set_etag
+from ..models import BLIND_INDEX_VERSION, User, Workout
+from ..search import search_workout_ids
 from ..schemas import (
     TrendBodyWeightPoint,
     TrendDurationPoint,
@@ -20,14 +38,24 @@ from ..schemas import (
     WorkoutCreate,
     WorkoutPayload,
     WorkoutRead,
+    WorkoutSearchPage,
+    WorkoutSet,
 )
+from ..set_log import append_op, apply_ops, assign_set_ids, load_payloads, new_set_id, write_header
+from ..single_flight import single_flight
 
 router = APIRouter(prefix="/workouts", tags=["workouts"])
 
+# Decrypted results, so they never leave this process's memory.
+_reads = Namespace("workouts.reads", lambda: settings.read_cache_ttl_seconds, sensitive=True)
+_WORKOUT_LIST = TypeAdapter(list[WorkoutRead])
+_TRENDS = TypeAdapter(TrendResponse)
+
 
-def _deserialize(record: Workout, data_key: bytes, encryption_service: EncryptionService) -> WorkoutPayload:
-    payload = encryption_service.decrypt_payload(data_key, record.encrypted_payload)
-    return WorkoutPayload(**payload)
+def _deserialize(
+    db: Session, records: Sequence[Workout], data_key: bytes, encryption_service: EncryptionService
+) -> list[WorkoutPayload]:
+    return [WorkoutPayload(**payload) for payload in load_payloads(db, records, data_key, encryption_service)]
 
 
 def _serialize(record: Workout, payload: WorkoutPayload) -> WorkoutRead:
@@ -35,10 +63,19 @@ def _serialize(record: Workout, payload: WorkoutPayload) -> WorkoutRead:
         id=record.id,
         created_at=record.created_at,
         updated_at=record.updated_at,
+        version=record.version,
         **payload.model_dump(),
     )
 
 
+def _json_response(body: bytes, response: Response, background: BackgroundTasks | None = None) -> Response:
+    # FastAPI only applies headers set by dependencies (such as data-key tickets), and
+    # background tasks, to the response when the endpoint returns data, not a Response of its own.
+    prepared = Response(body, media_type="application/json", background=background)
+    prepared.raw_headers.extend(response.raw_headers)
+    return prepared
+
+
 def _get_workout_or_404(db: Session, user: User, workout_id: str) -> Workout:
     workout = db.get(Workout, workout_id)
     if not workout or workout.user_id != user.id:
@@ -57,40 +94,136 @@ def _weight_to_kg(weight: float | None, unit: str) -> float:
     return float(weight)
 
 
+def _list_workouts(
+    db: Session,
+    user: User,
+    exercise: str | None,
+    template_id: str | None,
+    data_key: bytes,
+    encryption_service: EncryptionService,
+) -> list[WorkoutRead]:
+    stmt = select(Workout).where(Workout.user_id == user.id).order_by(Workout.created_at.desc())
+    if exercise is None and template_id is None:
+        workouts = db.scalars(stmt).all()
+        payloads = _deserialize(db, workouts, data_key, encryption_service)
+        return [_serialize(record, payload) for record, payload in zip(workouts, payloads)]
+    if user.blind_index_version >= BLIND_INDEX_VERSION:
+        # Only rows the blind index points at are fetched and decrypted; a stale index means
+        # scanning everything until it is rebuilt.
+        stmt = stmt.where(Workout.id.in_(candidate_ids(user.id, data_key, exercise=exercise, template_id=template_id)))
+    workouts = db.scalars(stmt).all()
+    return [
+        _serialize(record, WorkoutPayload(**payload))
+        for record, payload in zip(workouts, load_payloads(db, workouts, data_key, encryption_service))
+        if matches(payload, exercise=exercise, template_id=template_id)
+    ]
+
+
 @router.get("", response_model=list[WorkoutRead])
 def list_workouts(
+    response: Response,
+    background_tasks: BackgroundTasks,
+    exercise: str | None = Query(default=None, min_length=1),
+    template_id: str | None = Query(default=None, min_length=1),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     data_key: bytes = Depends(get_data_key),
     encryption_service: EncryptionService = Depends(get_encryption_service),
-) -> list[WorkoutRead]:
-    stmt = select(Workout).where(Workout.user_id == user.id).order_by(Workout.created_at.desc())
-    workouts = db.scalars(stmt).all()
-    return [_serialize(record, _deserialize(record, data_key, encryption_service)) for record in workouts]
+) -> Response:
+    body = single_flight.do(
+        user.id,
+        make_key("workouts.list", exercise=exercise, template_id=template_id),
+        lambda: _WORKOUT_LIST.dump_json(_list_workouts(db, user, exercise, template_id, data_key, encryption_service)),
+        _reads,
+    )
+    if (exercise is not None or template_id is not None) and user.blind_index_version < BLIND_INDEX_VERSION:
+        background_tasks.add_task(rebuild_stale_index, user.id, data_key)
+    return _json_response(body, response, background_tasks)
 
 
 @router.post("", response_model=WorkoutRead, status_code=status.HTTP_201_CREATED)
 def create_workout(
     payload: WorkoutCreate,
+    response: Response,
+    idempotency_key: str | None = Header(default=None, alias=IDEMPOTENCY_HEADER, max_length=255),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     data_key: bytes = Depends(get_data_key),
     encryption_service: EncryptionService = Depends(get_encryption_service),
 ) -> WorkoutRead:
-    blob = encryption_service.encrypt_payload(data_key, payload.model_dump())
-    record = Workout(user=user, encrypted_payload=blob, notes_search=payload.notes)
-    db.add(record)
-    db.flush()
-    return _serialize(record, payload)
+    with idempotent(db, user.id, "workouts.create", idempotency_key, payload, response) as claim:
+        if claim is not None and claim.replay_id is not None:
+            record = _get_workout_or_404(db, user, claim.replay_id)
+            (replayed,) = _deserialize(db, [record], data_key, encryption_service)
+            return _serialize(record, replayed)
+        data = assign_set_ids(payload.model_dump())
+        lock_key_generation(db, user)
+        blob = encryption_service.encrypt_payload(data_key, data)
+        record = Workout(
+            user=user, encrypted_payload=blob, notes_search=payload.notes, key_generation=user.key_generation
+        )
+        db.add(record)
+        db.flush()
+        index_workouts(db, user.id, data_key, [(record.id, data)])
+        if claim is not None:
+            claim.complete(db, record.id)
+        return _serialize(record, WorkoutPayload(**data))
+
+
+class IndexRebuildRead(BaseModel):
+    indexed: int
+
+
+@router.post("/index/rebuild", response_model=IndexRebuildRead)
+def rebuild_index(
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    data_key: bytes = Depends(get_data_key),
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+) -> IndexRebuildRead:
+    return IndexRebuildRead(indexed=rebuild_user_index(db, user, data_key, encryption_service))
+
+
+@router.get("/search", response_model=WorkoutSearchPage)
+def search_workouts(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    data_key: bytes = Depends(get_data_key),
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+) -> WorkoutSearchPage:
+    # One extra id tells us whether another page exists; only the page itself is decrypted.
+    ids = search_workout_ids(db, user.id, q, limit=limit + 1, offset=offset)
+    page = ids[:limit]
+    records = {record.id: record for record in db.scalars(select(Workout).where(Workout.id.in_(page)))}
+    ordered = [records[workout_id] for workout_id in page if workout_id in records]
+    items = [
+        _serialize(record, payload)
+        for record, payload in zip(ordered, _deserialize(db, ordered, data_key, encryption_service))
+    ]
+    return WorkoutSearchPage(items=items, next_offset=offset + limit if len(ids) > limit else None)
 
 
 @router.get("/trends", response_model=TrendResponse)
 def workout_trends(
+    response: Response,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     data_key: bytes = Depends(get_data_key),
     encryption_service: EncryptionService = Depends(get_encryption_service),
-) -> TrendResponse:
+) -> Response:
+    body = single_flight.do(
+        user.id,
+        make_key("workouts.trends"),
+        lambda: _TRENDS.dump_json(_compute_trends(db, user, data_key, encryption_service)),
+        _reads,
+    )
+    return _json_response(body, response)
+
+
+def _compute_trends(db: Session, user: User, data_key: bytes, encryption_service: EncryptionService) -> TrendResponse:
     stmt = select(Workout).where(Workout.user_id == user.id)
     workouts = db.scalars(stmt).all()
     overview_bucket: dict[str, dict[str, float | int | None]] = defaultdict(
@@ -105,8 +238,7 @@ def workout_trends(
     exercise_bucket: Dict[Tuple[str, str], dict[str, float | int]] = defaultdict(
         lambda: {"tonnage_kg": 0.0, "total_sets": 0, "total_reps": 0}
     )
-    for record in workouts:
-        payload = _deserialize(record, data_key, encryption_service)
+    for payload in _deserialize(db, workouts, data_key, encryption_service):
         date_key = payload.start_time.date().isoformat()
         entry = overview_bucket[date_key]
         entry["total_sets"] += len(payload.sets)
@@ -179,36 +311,206 @@ def workout_trends(
 @router.get("/{workout_id}", response_model=WorkoutRead)
 def read_workout(
     workout_id: str,
+    response: Response,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     data_key: bytes = Depends(get_data_key),
     encryption_service: EncryptionService = Depends(get_encryption_service),
 ) -> WorkoutRead:
     record = _get_workout_or_404(db, user, workout_id)
-    payload = _deserialize(record, data_key, encryption_service)
+    (payload,) = _deserialize(db, [record], data_key, encryption_service)
+    set_etag(response, record.version)
     return _serialize(record, payload)
 
 
+def _release_for_stream(db: Session, user: User, workout_id: str) -> str:
+    _get_workout_or_404(db, user, workout_id)
+    user_id = user.id
+    # Hand the connection back to the pool for the life of the stream. Nothing loaded by `db`
+    # may be touched after this: the commit expires it, and a refresh would check one out again.
+    db.commit()
+    return user_id
+
+
+@router.get("/{workout_id}/live", dependencies=[Depends(get_data_key)])
+async def watch_workout(
+    workout_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    auth: AuthContext = Depends(get_auth_context),
+    user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    if getattr(request.state, "batch", None) is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Live streams cannot be batched")
+    user_id = await run_in_threadpool(_release_for_stream, db, user, workout_id)
+    subscription = hub.subscribe(user_id, workout_id, auth.session.key if auth.session else None)
+    if subscription is None:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many live streams open")
+    return StreamingResponse(
+        stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+def _replace_workout(
+    db: Session,
+    record: Workout,
+    user: User,
+    payload: WorkoutPayload,
+    response: Response,
+    data_key: bytes,
+    encryption_service: EncryptionService,
+) -> WorkoutRead:
+    data = assign_set_ids(payload.model_dump())
+    lock_key_generation(db, user)
+    write_header(db, record, user, data, data_key, encryption_service)
+    record.notes_search = payload.notes
+    index_workouts(db, user.id, data_key, [(record.id, data)])
+    flush_versioned(db)
+    set_etag(response, record.version)
+    publish_after_commit(db, record.id, "workout.updated", {"workout_id": record.id, "version": record.version})
+    return _serialize(record, WorkoutPayload(**data))
+
+
 @router.put("/{workout_id}", response_model=WorkoutRead)
 def update_workout(
     workout_id: str,
     payload: WorkoutCreate,
+    response: Response,
+    if_match: str | None = Header(default=None),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     data_key: bytes = Depends(get_data_key),
     encryption_service: EncryptionService = Depends(get_encryption_service),
 ) -> WorkoutRead:
     record = _get_workout_or_404(db, user, workout_id)
-    record.encrypted_payload = encryption_service.encrypt_payload(data_key, payload.model_dump())
-    record.notes_search = payload.notes
-    return _serialize(record, payload)
+    check_if_match(if_match, record.version)
+    return _replace_workout(db, record, user, payload, response, data_key, encryption_service)
+
+
+@router.patch("/{workout_id}", response_model=WorkoutRead)
+def patch_workout(
+    workout_id: str,
+    response: Response,
+    patch: dict = Body(media_type=MERGE_PATCH_MEDIA_TYPE),
+    if_match: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    data_key: bytes = Depends(get_data_key),
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+) -> WorkoutRead:
+    record = _get_workout_or_404(db, user, workout_id)
+    check_if_match(if_match, record.version)
+    (current,) = load_payloads(db, [record], data_key, encryption_service)
+    payload = apply_patch(WorkoutCreate, current, patch)
+    return _replace_workout(db, record, user, payload, response, data_key, encryption_service)
+
+
+@router.post("/{workout_id}/sets", response_model=WorkoutSet, status_code=status.HTTP_201_CREATED)
+def append_set(
+    workout_id: str,
+    payload: WorkoutSet,
+    response: Response,
+    if_match: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    data_key: bytes = Depends(get_data_key),
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+) -> WorkoutSet:
+    # Encrypts and stores only the new set; earlier sets are not decrypted or rewritten.
+    record = _get_workout_or_404(db, user, workout_id)
+    check_if_match(if_match, record.version)
+    item = {**payload.model_dump(), "id": new_set_id()}
+    lock_key_generation(db, user)
+    compacted = append_op(db, record, user, {"op": "append", "set": item}, data_key, encryption_service)
+    # Appends take the next log position from the workout row, so two at once cannot both win.
+    # Flushing before the index upkeep gives the loser a 412 to retry, not a 201 for a set that
+    # would be rolled back at commit.
+    flush_versioned(db)
+    if compacted is not None:
+        index_workouts(db, user.id, data_key, [(record.id, compacted)])
+    else:
+        add_workout_tokens(db, user.id, data_key, record.id, {"sets": [item]})
+    set_etag(response, record.version)
+    created = WorkoutSet(**item)
+    publish_after_commit(
+        db, record.id, "set.appended", {"workout_id": record.id, "set": created.model_dump(mode="json")}
+    )
+    return created
+
+
+def _edit_set(
+    db: Session,
+    user: User,
+    workout_id: str,
+    op: dict,
+    set_id: str,
+    if_match: str | None,
+    response: Response,
+    data_key: bytes,
+    encryption_service: EncryptionService,
+) -> None:
+    record = _get_workout_or_404(db, user, workout_id)
+    check_if_match(if_match, record.version)
+    (current,) = load_payloads(db, [record], data_key, encryption_service)
+    if not any(item.get("id") == set_id for item in current["sets"]):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Set not found")
+    updated = apply_ops(current, [op])
+    lock_key_generation(db, user)
+    append_op(db, record, user, op, data_key, encryption_service, current=updated)
+    flush_versioned(db)
+    index_workouts(db, user.id, data_key, [(record.id, updated)])
+    set_etag(response, record.version)
+
+
+@router.put("/{workout_id}/sets/{set_id}", response_model=WorkoutSet)
+def amend_set(
+    workout_id: str,
+    set_id: str,
+    payload: WorkoutSet,
+    response: Response,
+    if_match: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    data_key: bytes = Depends(get_data_key),
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+) -> WorkoutSet:
+    item = {**payload.model_dump(), "id": set_id}
+    op = {"op": "amend", "set": item}
+    _edit_set(db, user, workout_id, op, set_id, if_match, response, data_key, encryption_service)
+    amended = WorkoutSet(**item)
+    publish_after_commit(
+        db, workout_id, "set.amended", {"workout_id": workout_id, "set": amended.model_dump(mode="json")}
+    )
+    return amended
+
+
+@router.delete("/{workout_id}/sets/{set_id}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_set(
+    workout_id: str,
+    set_id: str,
+    response: Response,
+    if_match: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    data_key: bytes = Depends(get_data_key),
+    encryption_service: EncryptionService = Depends(get_encryption_service),
+) -> None:
+    op = {"op": "remove", "id": set_id}
+    _edit_set(db, user, workout_id, op, set_id, if_match, response, data_key, encryption_service)
+    publish_after_commit(db, workout_id, "set.removed", {"workout_id": workout_id, "set_id": set_id})
 
 
 @router.delete("/{workout_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_workout(
     workout_id: str,
+    if_match: str | None = Header(default=None),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ) -> None:
     record = _get_workout_or_404(db, user, workout_id)
+    check_if_match(if_match, record.version)
     db.delete(record)
+    flush_versioned(db)
+    publish_after_commit(db, workout_id, "workout.deleted", {"workout_id": workout_id})
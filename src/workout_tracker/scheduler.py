@@ -0,0 +1,319 @@
+"""Lightweight in-process scheduler for periodic maintenance jobs.
+
+Every worker runs a `Scheduler` from the app lifespan. Jobs marked `leader_only` take a lease
+row in `scheduler_locks` before running, so one worker (or replica) runs each occurrence while
+the others skip it. The lease is held until the holder's next scheduled run, which keeps a
+job from firing once per process.
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Union
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from .database import DatabaseAdapter, adapter as default_adapter
+from .models import SchedulerLock
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Union[Any, Awaitable[Any]]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _normalize(ts: datetime) -> datetime:
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+class Interval:
+    def __init__(self, seconds: float) -> None:
+        if seconds <= 0:
+            raise ValueError("interval must be positive")
+        self.seconds = seconds
+
+    def next_run(self, after: datetime) -> datetime:
+        return after + timedelta(seconds=self.seconds)
+
+    def __repr__(self) -> str:
+        return f"every {self.seconds:g}s"
+
+
+class Cron:
+    """Five-field cron expression (minute hour day-of-month month day-of-week), evaluated in UTC.
+
+    Fields accept `*`, numbers, ranges (`1-5`), steps (`*/15`, `0-30/10`) and comma lists.
+    Day-of-week runs 0-6 from Sunday (7 is also Sunday).
+    """
+
+    _BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str) -> None:
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        fields = [self._parse(part, low, high) for part, (low, high) in zip(parts, self._BOUNDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {0 if day == 7 else day for day in weekdays}
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(part: str, low: int, high: int) -> set[int]:
+        values: set[int] = set()
+        for item in part.split(","):
+            base, _, step_text = item.partition("/")
+            step = int(step_text) if step_text else 1
+            if base == "*":
+                start, end = low, high
+            elif "-" in base:
+                start_text, end_text = base.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(base)
+                end = high if step_text else start
+            if step < 1 or start < low or end > high or start > end:
+                raise ValueError(f"invalid cron field {part!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_days = moment.day in self.days
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        # Classic cron: when both are restricted, either one matching is enough.
+        return in_days or in_weekdays
+
+    def next_run(self, after: datetime) -> datetime:
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+                moment = moment.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+                continue
+            if moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+                continue
+            return moment
+        raise ValueError(f"cron expression never fires: {self.expression!r}")
+
+    def __repr__(self) -> str:
+        return f"cron {self.expression!r}"
+
+
+Schedule = Union[Interval, Cron]
+
+
+@dataclass
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    skipped: int = 0
+    last_status: str | None = None
+    last_started_at: datetime | None = None
+    last_finished_at: datetime | None = None
+    last_duration_seconds: float | None = None
+    last_error: str | None = None
+    next_run_at: datetime | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "last_status": self.last_status,
+            "last_started_at": self.last_started_at.isoformat() if self.last_started_at else None,
+            "last_finished_at": self.last_finished_at.isoformat() if self.last_finished_at else None,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+        }
+
+
+@dataclass
+class Job:
+    name: str
+    func: JobFunc
+    schedule: Schedule
+    timeout: float | None = None
+    jitter: float = 0.0
+    leader_only: bool = True
+    stats: JobStats = field(default_factory=JobStats)
+
+
+class LeaseLock:
+    """Per-job lease rows; a lease is free once expired or when already held by this owner."""
+
+    def __init__(self, owner: str, db_adapter: DatabaseAdapter | None = None) -> None:
+        self.owner = owner
+        self._adapter = db_adapter
+
+    @property
+    def adapter(self) -> DatabaseAdapter:
+        return self._adapter or default_adapter
+
+    def acquire(self, name: str, hold_until: datetime) -> bool:
+        now = _now()
+        with self.adapter.session() as db:
+            stmt = (
+                update(SchedulerLock)
+                .where(SchedulerLock.name == name)
+                .where((SchedulerLock.expires_at < now) | (SchedulerLock.owner == self.owner))
+                .values(owner=self.owner, expires_at=hold_until)
+                .execution_options(synchronize_session=False)
+            )
+            if db.execute(stmt).rowcount:
+                return True
+            if db.scalar(select(SchedulerLock.name).where(SchedulerLock.name == name)) is not None:
+                return False
+            db.add(SchedulerLock(name=name, owner=self.owner, expires_at=hold_until))
+            try:
+                db.flush()
+            except IntegrityError:
+                # Another process inserted the row first.
+                db.rollback()
+                return False
+        return True
+
+    def extend(self, name: str, hold_until: datetime) -> None:
+        with self.adapter.session() as db:
+            db.execute(
+                update(SchedulerLock)
+                .where(SchedulerLock.name == name, SchedulerLock.owner == self.owner)
+                .values(expires_at=hold_until)
+                .execution_options(synchronize_session=False)
+            )
+
+
+def _default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Scheduler:
+    def __init__(self, owner: str | None = None, lock: LeaseLock | None = None) -> None:
+        self.owner = owner or _default_owner()
+        self.lock = lock or LeaseLock(self.owner)
+        self.jobs: dict[str, Job] = {}
+        self._tasks: list[asyncio.Task[None]] = []
+
+    def add_job(
+        self,
+        name: str,
+        func: JobFunc,
+        schedule: Schedule,
+        *,
+        timeout: float | None = None,
+        jitter: float = 0.0,
+        leader_only: bool = True,
+    ) -> Job:
+        if name in self.jobs:
+            raise ValueError(f"job {name!r} already registered")
+        job = Job(name, func, schedule, timeout=timeout, jitter=jitter, leader_only=leader_only)
+        self.jobs[name] = job
+        return job
+
+    def every(self, seconds: float, name: str, func: JobFunc, **options: Any) -> Job:
+        return self.add_job(name, func, Interval(seconds), **options)
+
+    def cron(self, expression: str, name: str, func: JobFunc, **options: Any) -> Job:
+        return self.add_job(name, func, Cron(expression), **options)
+
+    def start(self) -> None:
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"scheduler:{job.name}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {name: {"schedule": repr(job.schedule), **job.stats.as_dict()} for name, job in self.jobs.items()}
+
+    async def _loop(self, job: Job) -> None:
+        while True:
+            due = job.schedule.next_run(_now())
+            if job.jitter:
+                due += timedelta(seconds=random.uniform(0, job.jitter))
+            job.stats.next_run_at = due
+            await asyncio.sleep(max(0.0, (due - _now()).total_seconds()))
+            await self.run_job(job)
+
+    async def run_job(self, job: Job) -> str:
+        """Run one occurrence of `job` now, subject to leadership; returns the recorded status."""
+        if job.leader_only:
+            running_until = _now() + timedelta(seconds=job.timeout or 300)
+            try:
+                leader = await asyncio.to_thread(self.lock.acquire, job.name, running_until)
+            except Exception:
+                logger.exception("Could not take the lease for job %s", job.name)
+                leader = False
+            if not leader:
+                job.stats.skipped += 1
+                return "skipped"
+
+        stats = job.stats
+        stats.last_started_at = _now()
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(job.func):
+                awaitable = job.func()
+            else:
+                # A timed-out thread cannot be interrupted; it finishes in the background.
+                awaitable = asyncio.to_thread(job.func)
+            await asyncio.wait_for(awaitable, timeout=job.timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            stats.failures += 1
+            stats.last_status = "timeout"
+            stats.last_error = f"timed out after {job.timeout:g}s"
+            logger.warning("Job %s timed out after %ss", job.name, job.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            stats.failures += 1
+            stats.last_status = "failed"
+            stats.last_error = f"{type(exc).__name__}: {exc}"
+            logger.exception("Job %s failed", job.name)
+        else:
+            stats.last_status = "ok"
+            stats.last_error = None
+        finally:
+            stats.runs += 1
+            stats.last_duration_seconds = time.perf_counter() - started
+            stats.last_finished_at = _now()
+
+        if job.leader_only:
+            # Keep the lease until our next occurrence so other workers skip this one.
+            hold_until = job.schedule.next_run(_now()) - timedelta(seconds=1)
+            try:
+                await asyncio.to_thread(self.lock.extend, job.name, hold_until)
+            except Exception:  # pragma: no cover - the lease simply expires sooner
+                logger.exception("Could not extend the lease for job %s", job.name)
+        return stats.last_status or "ok"
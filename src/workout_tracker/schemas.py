@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Literal
+from typing import Any, Literal
 
 from pydantic import BaseModel, EmailStr, Field
 
 
 class WorkoutSet(BaseModel):
+    # Assigned by the server; addresses the set in /workouts/{id}/sets/{set_id}.
+    id: str | None = None
     exercise: str
     exercise_type: Literal["weighted", "bodyweight"] = "weighted"
     reps: int = Field(ge=0)
@@ -34,6 +36,13 @@ class WorkoutRead(WorkoutPayload):
     id: str
     created_at: datetime
     updated_at: datetime
+    # Echo as `If-Match: "<version>"` on PUT/PATCH to detect concurrent edits.
+    version: int
+
+
+class WorkoutSearchPage(BaseModel):
+    items: list[WorkoutRead]
+    next_offset: int | None = None
 
 
 class WorkoutUpdate(BaseModel):
@@ -110,3 +119,25 @@ class TemplateRead(TemplatePayload):
     id: str
     created_at: datetime
     updated_at: datetime
+    version: int
+
+
+class BatchOperation(BaseModel):
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"]
+    path: str = Field(pattern=r"^/")
+    headers: dict[str, str] = Field(default_factory=dict)
+    body: Any = None
+
+
+class BatchRequest(BaseModel):
+    requests: list[BatchOperation] = Field(min_length=1, max_length=20)
+
+
+class BatchResult(BaseModel):
+    status: int
+    headers: dict[str, str] = Field(default_factory=dict)
+    body: Any = None
+
+
+class BatchResponse(BaseModel):
+    responses: list[BatchResult]
@@ -0,0 +1,121 @@
+"""Full-text search over `Workout.notes_search`.
+
+SQLite gets an FTS5 table kept in sync by triggers; Postgres gets a generated `tsvector` column
+with a GIN index, which the database maintains itself. Both are created idempotently whenever
+the schema is, so existing databases pick them up on the next start. Other backends fall back
+to `LIKE` without ranking.
+
+`workouts` has a string primary key, so its implicit rowid is not stable: VACUUM may renumber
+it. The FTS rows are therefore keyed through `workouts_fts_keys`, whose `INTEGER PRIMARY KEY`
+VACUUM preserves, rather than pointing at `workouts.rowid`.
+"""
+from __future__ import annotations
+
+import re
+
+from sqlalchemy import Connection, event, select, text
+from sqlalchemy.orm import Session
+
+from .database import Base
+from .models import Workout
+
+_FTS_KEY = "(SELECT id FROM workouts_fts_keys WHERE workout_id = {row}.id)"
+
+_SQLITE_DDL = (
+    "CREATE TABLE IF NOT EXISTS workouts_fts_keys (id INTEGER PRIMARY KEY, workout_id TEXT NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS workouts_fts USING fts5("
+    "notes_search, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS workouts_fts_insert AFTER INSERT ON workouts BEGIN "
+    "INSERT INTO workouts_fts_keys(workout_id) VALUES (new.id); "
+    f"INSERT INTO workouts_fts(rowid, notes_search) VALUES ({_FTS_KEY.format(row='new')}, new.notes_search); END",
+    "CREATE TRIGGER IF NOT EXISTS workouts_fts_delete AFTER DELETE ON workouts BEGIN "
+    f"DELETE FROM workouts_fts WHERE rowid = {_FTS_KEY.format(row='old')}; "
+    "DELETE FROM workouts_fts_keys WHERE workout_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS workouts_fts_update AFTER UPDATE OF notes_search ON workouts BEGIN "
+    f"UPDATE workouts_fts SET notes_search = new.notes_search WHERE rowid = {_FTS_KEY.format(row='new')}; END",
+)
+
+# 'simple' rather than a language configuration: notes are short and in any language.
+_POSTGRES_DDL = (
+    "ALTER TABLE workouts ADD COLUMN IF NOT EXISTS notes_tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(notes_search, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_workouts_notes_tsv ON workouts USING GIN (notes_tsv)",
+)
+
+
+def rebuild_search_index(conn: Connection) -> None:
+    """Re-read every note into the FTS table, for databases that had workouts before it existed."""
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("DELETE FROM workouts_fts")
+        conn.exec_driver_sql("DELETE FROM workouts_fts_keys")
+        conn.exec_driver_sql("INSERT INTO workouts_fts_keys(workout_id) SELECT id FROM workouts")
+        conn.exec_driver_sql(
+            "INSERT INTO workouts_fts(rowid, notes_search) "
+            "SELECT k.id, w.notes_search FROM workouts_fts_keys AS k JOIN workouts AS w ON w.id = k.workout_id"
+        )
+
+
+def _install(target, connection: Connection, **kw) -> None:
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        existed = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'workouts_fts'"
+        ).first()
+        for statement in _SQLITE_DDL:
+            connection.exec_driver_sql(statement)
+        if not existed:
+            rebuild_search_index(connection)
+    elif dialect == "postgresql":
+        for statement in _POSTGRES_DDL:
+            connection.exec_driver_sql(statement)
+
+
+def _drop(target, connection: Connection, **kw) -> None:
+    # The FTS tables are not part of the metadata, so drop_all would otherwise leave them behind.
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("DROP TABLE IF EXISTS workouts_fts")
+        connection.exec_driver_sql("DROP TABLE IF EXISTS workouts_fts_keys")
+
+
+# Metadata-level after_create fires on every create_all, including for tables that already existed.
+event.listen(Base.metadata, "after_create", _install)
+event.listen(Workout.__table__, "after_drop", _drop)
+
+
+def _terms(query: str) -> list[str]:
+    return re.findall(r"\w+", query)
+
+
+def search_workout_ids(db: Session, user_id: str, query: str, *, limit: int, offset: int) -> list[str]:
+    """Ids of the user's workouts whose notes match every term in `query`, best match first."""
+    terms = _terms(query)
+    if not terms:
+        return []
+    params = {"user_id": user_id, "limit": limit, "offset": offset}
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        # Quoting each term keeps FTS5 operators in user input from being interpreted.
+        params["match"] = " ".join(f'"{term}"' for term in terms)
+        stmt = text(
+            "SELECT w.id FROM workouts_fts "
+            "JOIN workouts_fts_keys AS k ON k.id = workouts_fts.rowid JOIN workouts AS w ON w.id = k.workout_id "
+            "WHERE workouts_fts MATCH :match AND w.user_id = :user_id "
+            "ORDER BY bm25(workouts_fts), w.created_at DESC LIMIT :limit OFFSET :offset"
+        )
+    elif dialect == "postgresql":
+        params["query"] = " ".join(terms)
+        stmt = text(
+            "SELECT w.id FROM workouts AS w, plainto_tsquery('simple', :query) AS q "
+            "WHERE w.user_id = :user_id AND w.notes_tsv @@ q "
+            "ORDER BY ts_rank(w.notes_tsv, q) DESC, w.created_at DESC LIMIT :limit OFFSET :offset"
+        )
+    else:
+        fallback = (
+            select(Workout.id)
+            .where(Workout.user_id == user_id, *(Workout.notes_search.ilike(f"%{term}%") for term in terms))
+            .order_by(Workout.created_at.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        return list(db.scalars(fallback))
+    return list(db.scalars(stmt, params))
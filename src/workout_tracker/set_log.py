@@ -0,0 +1,135 @@
+"""Append-only set log for workouts edited one set at a time.
+
+A live session logs sets one by one. Rewriting the whole encrypted payload for each one makes
+a session quadratic. Instead, each set-level edit (`append`, `amend`, `remove`) is encrypted on
+its own into `workout_set_log`. `Workout.encrypted_payload` stays the compacted header. Reads
+replay the log over the header. Once a workout has `WORKOUT_SET_LOG_MAX_ENTRIES` entries, or on
+a full `PUT`, the log is folded back into the header. The amortised cost per set is then
+constant.
+"""
+from __future__ import annotations
+
+import uuid
+from collections import defaultdict
+from typing import Any, Iterable, Sequence
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .encryption import EncryptionService
+from .models import User, Workout, WorkoutSetLog
+
+
+def new_set_id() -> str:
+    return uuid.uuid4().hex
+
+
+def assign_set_ids(payload: dict[str, Any]) -> dict[str, Any]:
+    for item in payload.get("sets") or ():
+        if not item.get("id"):
+            item["id"] = new_set_id()
+    return payload
+
+
+def apply_ops(payload: dict[str, Any], ops: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    sets = list(payload.get("sets") or ())
+    for op in ops:
+        if op["op"] == "append":
+            sets.append(op["set"])
+        elif op["op"] == "amend":
+            sets = [op["set"] if item.get("id") == op["set"]["id"] else item for item in sets]
+        elif op["op"] == "remove":
+            sets = [item for item in sets if item.get("id") != op["id"]]
+    payload["sets"] = sets
+    return payload
+
+
+def load_ops(db: Session, workout_ids: Sequence[str]) -> dict[str, list[bytes]]:
+    """Encrypted log entries per workout, in the order they were written; one query."""
+    ops: dict[str, list[bytes]] = defaultdict(list)
+    if not workout_ids:
+        return ops
+    stmt = (
+        select(WorkoutSetLog.workout_id, WorkoutSetLog.encrypted_payload)
+        .where(WorkoutSetLog.workout_id.in_(workout_ids))
+        .order_by(WorkoutSetLog.seq, WorkoutSetLog.created_at)
+    )
+    for workout_id, blob in db.execute(stmt):
+        ops[workout_id].append(blob)
+    return ops
+
+
+def assemble(
+    encryption_service: EncryptionService, data_key: bytes, header: bytes, op_blobs: Iterable[bytes] = ()
+) -> dict[str, Any]:
+    payload = encryption_service.decrypt_payload(data_key, header)
+    return apply_ops(payload, (encryption_service.decrypt_payload(data_key, blob) for blob in op_blobs))
+
+
+def load_payloads(
+    db: Session, records: Sequence[Workout], data_key: bytes, encryption_service: EncryptionService
+) -> list[dict[str, Any]]:
+    """Decrypted, fully reassembled payloads for `records`, in the same order."""
+    ops = load_ops(db, [record.id for record in records if record.set_log_length])
+    return [
+        assemble(encryption_service, data_key, record.encrypted_payload, ops.get(record.id, ()))
+        for record in records
+    ]
+
+
+def clear_log(db: Session, record: Workout) -> None:
+    if record.set_log_length:
+        db.execute(
+            delete(WorkoutSetLog)
+            .where(WorkoutSetLog.workout_id == record.id)
+            .execution_options(synchronize_session=False)
+        )
+        record.set_log_length = 0
+
+
+def write_header(
+    db: Session,
+    record: Workout,
+    user: User,
+    payload: dict[str, Any],
+    data_key: bytes,
+    encryption_service: EncryptionService,
+) -> None:
+    """Store `payload` as the whole workout, dropping any log it supersedes."""
+    record.encrypted_payload = encryption_service.encrypt_payload(data_key, payload)
+    record.key_generation = user.key_generation
+    clear_log(db, record)
+
+
+def append_op(
+    db: Session,
+    record: Workout,
+    user: User,
+    op: dict[str, Any],
+    data_key: bytes,
+    encryption_service: EncryptionService,
+    *,
+    current: dict[str, Any] | None = None,
+) -> dict[str, Any] | None:
+    """Log one set-level edit. Once the log reaches its configured size it is folded into the
+    header instead, and the compacted payload is returned; `current` is the payload with `op`
+    already applied, when the caller has it."""
+    if record.set_log_length + 1 >= settings.workout_set_log_max_entries:
+        if current is None:
+            (payload,) = load_payloads(db, [record], data_key, encryption_service)
+            current = apply_ops(payload, [op])
+        write_header(db, record, user, current, data_key, encryption_service)
+        return current
+    db.add(
+        WorkoutSetLog(
+            workout_id=record.id,
+            user_id=user.id,
+            seq=record.set_log_length,
+            encrypted_payload=encryption_service.encrypt_payload(data_key, op),
+            key_generation=user.key_generation,
+        )
+    )
+    # Also bumps the workout's updated_at.
+    record.set_log_length += 1
+    return None
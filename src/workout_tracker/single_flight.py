@@ -0,0 +1,78 @@
+"""Coalescing of concurrent identical reads, in front of an optional result cache.
+
+Opening the app on two devices, or a re-render that fires the same request twice, makes
+`GET /workouts` and `GET /workouts/trends` decrypt and aggregate a user's whole history twice
+at the same moment. Requests with the same user, route and query share one computation: the
+first runs it in its threadpool thread and the rest wait for its result. Flights are keyed by
+the user's cache generation (see `cache`), so a read that starts after the user's latest write
+never joins a computation that began before it. Given a `cache.Namespace`, the result is also
+stored there under the same generation.
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable
+
+from . import cache
+
+
+@dataclass(eq=False)
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: BaseException | None = None
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._counts = {"computed": 0, "coalesced": 0, "cache_hits": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def do(self, user_id: str, key: str, compute: Callable[[], bytes], results: cache.Namespace | None = None) -> bytes:
+        """Return `compute()`, sharing it with identical concurrent calls for `user_id`."""
+        generation = cache.generation(user_id)
+        if generation is None:
+            self._count("computed")
+            return compute()
+        if results is not None:
+            cached = results.get(user_id, generation, key)
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+        flight = (user_id, generation, key)
+        with self._lock:
+            call = self._calls.get(flight)
+            leader = call is None
+            if leader:
+                call = self._calls[flight] = _Call()
+            self._counts["computed" if leader else "coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = compute()
+            if results is not None:
+                results.set(user_id, generation, key, call.result)
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[flight]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._counts, "in_flight": len(self._calls)}
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,168 @@
+"""Static file serving for the bundled single-page app."""
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from pathlib import Path
+
+from fastapi import HTTPException
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+
+from .compression import available_encodings, compress, is_compressible, negotiate_encoding
+
+# Vite emits content-hashed bundles such as `assets/index-4f9a2c1b.js`; those never change in place.
+# Only its output directory is matched: files copied from `public/` keep their own names, and a
+# name like `apple-touch-icon.png` must not be cached for a year.
+HASHED_ASSET = re.compile(r"^assets/(?:[^/]+/)*[^/]+-[A-Za-z0-9_]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+INDEX_CACHE_CONTROL = "public, max-age=60, must-revalidate"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+MIN_COMPRESS_BYTES = 1024
+MAX_COMPRESS_BYTES = 8 * 1024 * 1024
+PRECOMPRESSED_SUFFIXES = {".br": "br", ".gz": "gzip"}
+
+
+@dataclass(slots=True)
+class StaticAsset:
+    path: Path
+    stat_result: os.stat_result
+    media_type: str
+    cache_control: str
+    precompressed: dict[str, Path] = field(default_factory=dict)
+    compressed: dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def compressible(self) -> bool:
+        return (
+            is_compressible(self.media_type)
+            and MIN_COMPRESS_BYTES <= self.stat_result.st_size <= MAX_COMPRESS_BYTES
+        )
+
+    @property
+    def etag(self) -> str:
+        stamp = f"{self.stat_result.st_mtime}-{self.stat_result.st_size}"
+        return hashlib.md5(stamp.encode(), usedforsecurity=False).hexdigest()
+
+
+def _cache_control(relative: str) -> str:
+    if relative == "index.html" or relative.endswith("/index.html"):
+        return INDEX_CACHE_CONTROL
+    if HASHED_ASSET.match(relative):
+        return IMMUTABLE_CACHE_CONTROL
+    return DEFAULT_CACHE_CONTROL
+
+
+def build_manifest(directory: Path) -> dict[str, StaticAsset]:
+    manifest: dict[str, StaticAsset] = {}
+    siblings: list[tuple[str, str, Path]] = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            full_path = Path(root) / name
+            relative = full_path.relative_to(directory).as_posix()
+            suffix = full_path.suffix
+            if suffix in PRECOMPRESSED_SUFFIXES:
+                siblings.append((relative[: -len(suffix)], PRECOMPRESSED_SUFFIXES[suffix], full_path))
+                continue
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            manifest[relative] = StaticAsset(
+                path=full_path,
+                stat_result=full_path.stat(),
+                media_type=media_type,
+                cache_control=_cache_control(relative),
+            )
+    for relative, encoding, path in siblings:
+        asset = manifest.get(relative)
+        if asset is not None:
+            asset.precompressed[encoding] = path
+    return manifest
+
+
+class SPAStaticFiles(StaticFiles):
+    """Serves the Vite bundle from an in-memory manifest with precompression and cache headers.
+
+    Paths missing from the manifest resolve to `index.html` so client-side routes work on reload.
+    Compressed variants come from `.br`/`.gz` files written at build time when present, otherwise
+    they are produced on first request and kept in memory.
+    """
+
+    def __init__(self, *, directory: str | os.PathLike[str], refresh_on_miss: bool = False, **kwargs) -> None:
+        super().__init__(directory=directory, **kwargs)
+        self._root = Path(directory)
+        self._refresh_on_miss = refresh_on_miss
+        self._lock = threading.Lock()
+        self.manifest = build_manifest(self._root)
+
+    def _refresh(self, relative: str) -> StaticAsset | None:
+        if not (self._root / relative).is_file():
+            return None
+        # Dev builds replace the bundle in place; pick up the new file names.
+        self.manifest = build_manifest(self._root)
+        return self.manifest.get(relative)
+
+    async def _resolve(self, path: str) -> StaticAsset | None:
+        relative = Path(path).as_posix()
+        if relative in ("", "."):
+            relative = "index.html"
+        asset = self.manifest.get(relative) or self.manifest.get(f"{relative}/index.html")
+        if asset is None and self._refresh_on_miss:
+            asset = await run_in_threadpool(self._refresh, relative)
+        return asset or self.manifest.get("index.html")
+
+    def _compress(self, asset: StaticAsset, encoding: str) -> bytes:
+        with self._lock:
+            cached = asset.compressed.get(encoding)
+            if cached is None:
+                cached = compress(asset.path.read_bytes(), encoding)
+                asset.compressed[encoding] = cached
+        return cached
+
+    async def _compressed(self, asset: StaticAsset, encoding: str) -> bytes:
+        cached = asset.compressed.get(encoding)
+        if cached is None:
+            # A first request compresses up to MAX_COMPRESS_BYTES at a high level; keep it off the loop.
+            cached = await run_in_threadpool(self._compress, asset, encoding)
+        return cached
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405, headers={"Allow": "GET, HEAD"})
+        asset = await self._resolve(path)
+        if asset is None:
+            raise HTTPException(status_code=404)
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": asset.cache_control}
+        encoding = None
+        if asset.compressible or asset.precompressed:
+            headers["Vary"] = "Accept-Encoding"
+            installed = available_encodings() if asset.compressible else ()
+            supported = tuple(e for e in ("br", "zstd", "gzip") if e in asset.precompressed or e in installed)
+            encoding = negotiate_encoding(request_headers.get("accept-encoding"), supported)
+
+        if encoding is None:
+            response: Response = FileResponse(
+                asset.path, stat_result=asset.stat_result, media_type=asset.media_type, headers=headers
+            )
+        elif encoding in asset.precompressed:
+            headers["Content-Encoding"] = encoding
+            variant = asset.precompressed[encoding]
+            response = FileResponse(variant, media_type=asset.media_type, headers=headers)
+        else:
+            headers["Content-Encoding"] = encoding
+            headers["ETag"] = f'"{asset.etag}-{encoding}"'
+            headers["Last-Modified"] = formatdate(asset.stat_result.st_mtime, usegmt=True)
+            body = await self._compressed(asset, encoding)
+            response = Response(body, media_type=asset.media_type, headers=headers)
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
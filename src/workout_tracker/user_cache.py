@@ -0,0 +1,130 @@
+"""Short-lived in-process cache of user rows."""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from .config import settings
+from .models import User
+
+
+@dataclass(slots=True)
+class _Entry:
+    user: User
+    updated_at: datetime
+    expires_at: float
+
+
+class UserCache:
+    """Caches detached snapshots of `User` rows keyed by id and `updated_at`.
+
+    Hits are merged into the caller's session with `load=False`, so they cost no query. Any
+    flush that touches a user in this process drops its entry, and so does the commit that
+    follows; changes made by other processes become visible once the TTL
+    (`USER_CACHE_TTL_SECONDS`, disabled when 0) lapses.
+
+    Each invalidation is stamped from a counter. A miss notes the counter before it queries and
+    only stores its row if the user was not invalidated meanwhile, so a reader that loaded the
+    row just before a write cannot put the outdated copy back. `purge_expired` forgets the
+    stamps and raises a floor instead; a miss that started below the floor is not stored.
+
+    Bulk `update(User)`/`delete(User)` statements bypass the flush hook, so their call sites
+    invalidate explicitly (see `invalidate_on_commit`) or say why they need not.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, _Entry] = {}
+        self._invalidated: dict[str, int] = {}
+        self._clock = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self) -> float:
+        return settings.user_cache_ttl_seconds
+
+    def get(self, db: Session, user_id: str) -> User | None:
+        if self.ttl <= 0:
+            return db.get(User, user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return db.merge(entry.user, load=False)
+        with self._lock:
+            started = self._clock
+        user = db.get(User, user_id)
+        if user is not None:
+            self._store(user, started)
+        return user
+
+    def _store(self, user: User, started: int) -> None:
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        snapshot = User(**values)
+        make_transient_to_detached(snapshot)
+        with self._lock:
+            if started < self._floor or self._invalidated.get(user.id, 0) > started:
+                return
+            current = self._entries.get(user.id)
+            if current is not None and current.updated_at > snapshot.updated_at:
+                return
+            self._entries[user.id] = _Entry(snapshot, snapshot.updated_at, time.monotonic() + self.ttl)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._clock += 1
+            self._invalidated[user_id] = self._clock
+
+    def purge_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            stale = [user_id for user_id, entry in self._entries.items() if entry.expires_at <= now]
+            for user_id in stale:
+                del self._entries[user_id]
+            # Misses in flight right now skip storing their row; every later one starts above it.
+            self._clock += 1
+            self._floor = self._clock
+            self._invalidated.clear()
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._clock += 1
+            self._floor = self._clock
+            self._invalidated.clear()
+
+
+user_cache = UserCache()
+
+_FLUSHED = "user_cache_flushed"
+
+
+def invalidate_on_commit(db: Session, user_id: str) -> None:
+    """Drop `user_id` now and again once `db` commits; for bulk statements the flush hook misses."""
+    user_cache.invalidate(user_id)
+    db.info.setdefault(_FLUSHED, set()).add(user_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed_users(session: Session, _flush_context) -> None:
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            user_cache.invalidate(obj.id)
+            session.info.setdefault(_FLUSHED, set()).add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    # Until the commit, other connections still read the old row; drop anything cached from it.
+    for user_id in session.info.pop(_FLUSHED, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_flushed_users(session: Session, previous_transaction) -> None:
+    session.info.pop(_FLUSHED, None)
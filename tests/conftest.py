@@ -1,5 +1,7 @@
+import asyncio
 import importlib
 import os
+import traceback
 from pathlib import Path
 
 import pytest
@@ -10,6 +12,8 @@ DB_PATH = Path("test-workout.sqlite3")
 os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_PATH}")
 os.environ.setdefault("AUTH_ORIGIN", "http://testserver")
 os.environ.setdefault("FRONTEND_BASE_URL", "http://testserver")
+# Every test shares the test client's address; rate limiting is exercised in test_rate_limit.py.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
 
 import workout_tracker.config as config  # noqa: E402
 
@@ -24,10 +28,54 @@ import workout_tracker.app as app_module  # noqa: E402
 importlib.reload(app_module)
 
 
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@pytest.fixture(autouse=True)
+def blocking_calls_off_the_loop(monkeypatch):
+    """Fail any test in which a database query or key derivation runs on an event-loop thread.
+
+    Sync handlers and `run_in_threadpool` calls run in worker threads with no running loop, so
+    this catches blocking work inside `async def` code however fast it happens to be here.
+    """
+    from sqlalchemy import event
+
+    from workout_tracker.database import adapter
+    from workout_tracker.encryption import KdfParams
+
+    offenders: list[str] = []
+
+    def check(what: str) -> None:
+        if _on_event_loop():
+            offenders.append(f"{what} on the event loop:\n{''.join(traceback.format_stack(limit=25)[:-2])}")
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        check(f"query {statement.split(None, 1)[0]}")
+
+    derive = KdfParams.derive
+
+    def guarded_derive(self, secret: bytes, salt: bytes, length: int) -> bytes:
+        check(f"{self.algorithm} key derivation")
+        return derive(self, secret, salt, length)
+
+    monkeypatch.setattr(KdfParams, "derive", guarded_derive)
+    event.listen(adapter.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield
+    finally:
+        event.remove(adapter.engine, "before_cursor_execute", before_cursor_execute)
+    if offenders:
+        pytest.fail(offenders[0], pytrace=False)
+
+
 @pytest.fixture
 def client(clean_database):
-    app = app_module.create_app()
-    with TestClient(app) as test_client:
+    with TestClient(app_module.create_app()) as test_client:
         yield test_client
 
 
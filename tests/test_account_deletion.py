@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, insert, select
+
+from workout_tracker.account_deletion import resume_account_deletions
+from workout_tracker.config import settings
+from workout_tracker.database import adapter
+from workout_tracker.models import AccountDeletion, AuthSession, User, Workout, WorkoutTemplate
+
+PAYLOAD = b"x" * 512
+
+
+def _sign_up(client: TestClient) -> str:
+    resp = client.post("/users", json={"display_name": "Bye", "email": "bye@example.com", "encryption_token": "t0k3n"})
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def _seed(user_id: str, workouts: int, templates: int = 10) -> None:
+    with adapter.session() as db:
+        db.execute(insert(Workout), [{"user_id": user_id, "encrypted_payload": PAYLOAD} for _ in range(workouts)])
+        db.execute(
+            insert(WorkoutTemplate), [{"user_id": user_id, "encrypted_payload": PAYLOAD} for _ in range(templates)]
+        )
+
+
+def _count(model, user_id: str) -> int:
+    with adapter.session() as db:
+        return db.scalar(select(func.count()).select_from(model).where(model.user_id == user_id))
+
+
+class _StatementCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *args) -> None:
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(adapter.engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        event.remove(adapter.engine, "before_cursor_execute", self)
+
+
+def test_small_account_is_deleted_inline(client: TestClient):
+    user_id = _sign_up(client)
+    _seed(user_id, workouts=5)
+    assert client.delete("/users/me").status_code == 204
+    assert _count(Workout, user_id) == 0
+    assert _count(WorkoutTemplate, user_id) == 0
+    with adapter.session() as db:
+        assert db.get(User, user_id) is None
+        assert db.scalar(select(func.count()).select_from(AuthSession)) == 0
+
+
+def test_deletion_query_count_and_memory_do_not_grow_with_history(client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "account_deletion_background_threshold", 100_000)
+    user_id = _sign_up(client)
+    _seed(user_id, workouts=5000)
+
+    tracemalloc.start()
+    try:
+        with _StatementCounter() as statements:
+            assert client.delete("/users/me").status_code == 204
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert _count(Workout, user_id) == 0
+    # Loading 5000 workouts (2.5 MB of payload alone) would blow well past this.
+    assert peak < 1_500_000
+    assert statements.count < 25
+
+
+def test_large_account_is_deleted_in_background_batches(client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "account_deletion_background_threshold", 100)
+    monkeypatch.setattr(settings, "account_deletion_batch_size", 250)
+    user_id = _sign_up(client)
+    _seed(user_id, workouts=1000, templates=20)
+
+    with _StatementCounter() as statements:
+        resp = client.delete("/users/me")
+    assert resp.status_code == 202
+    job = resp.json()
+    assert job["total_rows"] == 1020
+    assert resp.headers["Location"] == f"/users/deletions/{job['id']}"
+    # Roughly a delete plus a progress update per batch, not per row.
+    assert statements.count < 60
+
+    status = client.get(f"/users/deletions/{job['id']}").json()
+    assert status["status"] == "done"
+    assert status["deleted_rows"] == 1020
+    assert _count(Workout, user_id) == 0
+    with adapter.session() as db:
+        assert db.get(User, user_id) is None
+
+
+def test_deactivated_account_cannot_use_its_session(client: TestClient):
+    user_id = _sign_up(client)
+    with adapter.session() as db:
+        db.get(User, user_id).is_active = False
+    assert client.get("/users/me").status_code == 401
+
+
+def test_stale_jobs_are_resumed(client: TestClient):
+    user_id = _sign_up(client)
+    _seed(user_id, workouts=30)
+    with adapter.session() as db:
+        db.get(User, user_id).is_active = False
+        db.add(
+            AccountDeletion(
+                user_id=user_id,
+                status="running",
+                total_rows=40,
+                updated_at=datetime.now(timezone.utc) - timedelta(hours=1),
+            )
+        )
+    assert resume_account_deletions() == 1
+    assert _count(Workout, user_id) == 0
+    with adapter.session() as db:
+        job = db.scalar(select(AccountDeletion))
+        assert job.status == "done"
+        assert db.get(User, user_id) is None
+
+
+def test_unknown_deletion_job_is_404(client: TestClient):
+    assert client.get("/users/deletions/missing").status_code == 404
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from workout_tracker.auth.apple import APPLE_ISSUER, AppleClient
+from workout_tracker.config import settings
+
+AUDIENCE = "com.example.app"
+
+
+def _rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class StubApple:
+    """Local stand-in for Apple's key and token endpoints that counts requests and connections."""
+
+    def __init__(self) -> None:
+        self.signing_keys = {"kid-1": _rsa_key()}
+        self.key_requests = 0
+        self.token_requests: list[dict[str, list[str]]] = []
+        self.connections = 0
+        self.delay = 0.0
+        self.max_age: int | None = None
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body: dict, headers: dict[str, str] | None = None) -> None:
+                raw = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self):
+                stub.key_requests += 1
+                time.sleep(stub.delay)
+                keys = []
+                for kid, key in stub.signing_keys.items():
+                    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+                    keys.append({**jwk, "kid": kid, "alg": "RS256", "use": "sig"})
+                headers = {"Cache-Control": f"max-age={stub.max_age}"} if stub.max_age is not None else None
+                self._send({"keys": keys}, headers)
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                stub.token_requests.append(parse_qs(self.rfile.read(length).decode()))
+                self._send({"id_token": "token", "access_token": "access"})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def identity_token(self, kid: str = "kid-1") -> str:
+        now = int(time.time())
+        claims = {"iss": APPLE_ISSUER, "aud": AUDIENCE, "sub": "apple-user", "iat": now, "exp": now + 600}
+        return jwt.encode(claims, self.signing_keys[kid], algorithm="RS256", headers={"kid": kid})
+
+    def client(self, **options) -> AppleClient:
+        return AppleClient(f"{self.base_url}/auth/keys", f"{self.base_url}/auth/token", **options)
+
+
+@pytest.fixture
+def stub():
+    server = StubApple()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def test_keys_are_fetched_once_over_a_pooled_connection(stub):
+    client = stub.client()
+
+    async def run():
+        try:
+            for _ in range(3):
+                claims = await client.verify_identity_token(stub.identity_token(), AUDIENCE)
+                assert claims["sub"] == "apple-user"
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert stub.key_requests == 1
+
+
+def test_concurrent_logins_share_one_key_fetch(stub):
+    stub.delay = 0.2
+    client = stub.client()
+    token = stub.identity_token()
+
+    async def run():
+        try:
+            results = await asyncio.gather(*(client.verify_identity_token(token, AUDIENCE) for _ in range(20)))
+        finally:
+            await client.aclose()
+        return results
+
+    assert len(asyncio.run(run())) == 20
+    assert stub.key_requests == 1
+    assert stub.connections == 1
+
+
+def test_keys_refresh_ahead_of_expiry_in_the_background(stub):
+    stub.max_age = 2
+    client = stub.client(refresh_ahead=5)
+    token = stub.identity_token()
+
+    async def run():
+        try:
+            await client.verify_identity_token(token, AUDIENCE)
+            stub.delay = 0.2
+            started = time.perf_counter()
+            # Already inside the refresh-ahead window: served from cache, refresh runs behind it.
+            await client.verify_identity_token(token, AUDIENCE)
+            await client.verify_identity_token(token, AUDIENCE)
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0.3)
+        finally:
+            await client.aclose()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.2
+    assert stub.key_requests == 2
+
+
+def test_unknown_kid_triggers_refetch(stub, monkeypatch):
+    monkeypatch.setattr("workout_tracker.auth.apple.KEYS_MIN_REFRESH_SECONDS", 0)
+    client = stub.client()
+
+    async def run():
+        try:
+            await client.verify_identity_token(stub.identity_token(), AUDIENCE)
+            stub.signing_keys["kid-2"] = _rsa_key()
+            claims = await client.verify_identity_token(stub.identity_token("kid-2"), AUDIENCE)
+            assert claims["aud"] == AUDIENCE
+            with pytest.raises(ValueError):
+                await client.public_key("missing")
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert stub.key_requests == 3
+
+
+def test_client_secret_reused_within_validity(stub, monkeypatch):
+    signing_key = ec.generate_private_key(ec.SECP256R1())
+    pem = signing_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    monkeypatch.setattr(settings, "apple_client_id", AUDIENCE)
+    monkeypatch.setattr(settings, "apple_team_id", "TEAM123")
+    monkeypatch.setattr(settings, "apple_key_id", "ABC123")
+    monkeypatch.setattr(settings, "apple_private_key", pem)
+    client = stub.client()
+
+    async def run():
+        try:
+            for code in ("one", "two"):
+                assert (await client.exchange_authorization_code(code))["id_token"] == "token"
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    secrets = {request["client_secret"][0] for request in stub.token_requests}
+    assert len(secrets) == 1
+    claims = jwt.decode(
+        secrets.pop(), signing_key.public_key(), algorithms=["ES256"], audience=APPLE_ISSUER
+    )
+    assert claims["iss"] == "TEAM123" and claims["sub"] == AUDIENCE
+    assert [request["code"] for request in stub.token_requests] == [["one"], ["two"]]
+    assert stub.connections == 1
+
+    monkeypatch.setattr(settings, "apple_key_id", "ROTATED")
+    assert jwt.get_unverified_header(client.client_secret())["kid"] == "ROTATED"
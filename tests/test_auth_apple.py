@@ -59,3 +59,11 @@ def test_existing_user_can_login_without_encryption(client: TestClient, apple_se
     resp = client.post("/auth/apple/complete", json={"authorization_code": "code"})
     assert resp.status_code == 200
     assert resp.json()["email"] == "appleuser@example.com"
+
+
+def test_apple_provisioning_runs_off_the_event_loop(client: TestClient, apple_settings):
+    # New Apple users get an envelope, which runs the KDF; the conftest guard fails the test if
+    # that happens on the event loop.
+    payload = {"authorization_code": "code", "encryption_token": "sync-token"}
+    resp = client.post("/auth/apple/complete", json=payload)
+    assert resp.status_code == 200
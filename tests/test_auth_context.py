@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import re
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from workout_tracker.auth.session_store import get_session_store
+from workout_tracker.config import settings
+from workout_tracker.database import adapter
+from workout_tracker.user_cache import user_cache
+
+USER_SELECT = re.compile(r"FROM users\b", re.IGNORECASE)
+
+
+@pytest.fixture
+def signed_in(client: TestClient) -> TestClient:
+    resp = client.post(
+        "/users",
+        json={"display_name": "Ctx", "email": "ctx@example.com", "encryption_token": "ctx-token"},
+    )
+    assert resp.status_code == 201, resp.text
+    return client
+
+
+@pytest.fixture(autouse=True)
+def _reset_user_cache():
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+
+@contextmanager
+def _count_user_queries():
+    statements: list[str] = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and USER_SELECT.search(statement):
+            statements.append(statement)
+
+    event.listen(adapter.engine, "before_cursor_execute", before_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(adapter.engine, "before_cursor_execute", before_execute)
+
+
+def test_session_resolved_once_and_user_loaded_once_per_request(signed_in: TestClient, monkeypatch):
+    calls = []
+    store = get_session_store()
+    original = store.get
+
+    def counting_get(db, key):
+        calls.append(key)
+        return original(db, key)
+
+    monkeypatch.setattr(store, "get", counting_get)
+    with _count_user_queries() as user_queries:
+        resp = signed_in.get("/workouts")
+    assert resp.status_code == 200, resp.text
+    assert len(calls) == 1
+    assert len(user_queries) <= 1
+
+
+def test_user_cache_serves_repeat_requests_without_query(signed_in: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "user_cache_ttl_seconds", 30)
+    assert signed_in.get("/users/me").status_code == 200
+    with _count_user_queries() as user_queries:
+        resp = signed_in.get("/workouts")
+    assert resp.status_code == 200, resp.text
+    assert user_queries == []
+
+
+def test_user_writes_invalidate_cache(signed_in: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "user_cache_ttl_seconds", 30)
+    assert signed_in.get("/users/me").status_code == 200
+    rotate = signed_in.post("/users/encryption/rotate", json={"encryption_token": "ctx-token-2"})
+    assert rotate.status_code == 200, rotate.text
+    with _count_user_queries() as user_queries:
+        resp = signed_in.get("/workouts", headers={"X-Encryption-Token": "ctx-token-2"})
+    assert resp.status_code == 200, resp.text
+    assert len(user_queries) == 1
+
+
+def test_reader_that_raced_an_invalidation_does_not_cache_its_row(signed_in: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "user_cache_ttl_seconds", 30)
+    user_id = signed_in.get("/users/me").json()["id"]
+    user_cache.clear()
+
+    with adapter.session() as db:
+        original_get = db.get
+
+        def get_then_write(model, ident):
+            row = original_get(model, ident)
+            # Another request updates the user after this read but before it is cached.
+            user_cache.invalidate(ident)
+            return row
+
+        monkeypatch.setattr(db, "get", get_then_write)
+        assert user_cache.get(db, user_id) is not None
+
+    with adapter.session() as db, _count_user_queries() as user_queries:
+        user_cache.get(db, user_id)
+    assert len(user_queries) == 1
+
+
+def test_purging_forgets_invalidations_without_caching_in_flight_reads(signed_in: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "user_cache_ttl_seconds", 30)
+    user_id = signed_in.get("/users/me").json()["id"]
+    user_cache.clear()
+    for index in range(50):
+        user_cache.invalidate(f"gone-{index}")
+
+    with adapter.session() as db:
+        original_get = db.get
+
+        def get_then_purge(model, ident):
+            row = original_get(model, ident)
+            user_cache.invalidate(ident)
+            user_cache.purge_expired()
+            return row
+
+        monkeypatch.setattr(db, "get", get_then_purge)
+        assert user_cache.get(db, user_id) is not None
+    assert user_cache._invalidated == {}
+
+    with adapter.session() as db, _count_user_queries() as user_queries:
+        user_cache.get(db, user_id)
+        user_cache.get(db, user_id)
+    assert len(user_queries) == 1
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from fastapi import Response
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from workout_tracker import deps
+from workout_tracker.auth.session_store import key_handles
+from workout_tracker.encryption import EncryptionService
+
+WORKOUT = {"title": "Pull", "start_time": "2024-01-01T08:00:00", "sets": [{"exercise": "Row", "reps": 10}]}
+
+
+def _sign_up(client: TestClient) -> str:
+    user = {"display_name": "Batch", "email": "batch@example.com", "encryption_token": "b4tch"}
+    resp = client.post("/users", json=user)
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def _batch(client: TestClient, *requests: dict) -> list[dict]:
+    resp = client.post("/batch", json={"requests": list(requests)})
+    assert resp.status_code == 200, resp.text
+    return resp.json()["responses"]
+
+
+def test_home_screen_loads_under_one_unwrap_and_one_session_lookup(client: TestClient, monkeypatch):
+    user_id = _sign_up(client)
+    assert client.post("/workouts", json=WORKOUT).status_code == 201
+    key_handles.drop_user(user_id)
+
+    unwraps, lookups = [], []
+    real_unwrap, real_resolve = EncryptionService.unwrap_data_key, deps.resolve_session
+
+    def counting_unwrap(self, ctx):
+        unwraps.append(ctx)
+        return real_unwrap(self, ctx)
+
+    def counting_resolve(db, token):
+        lookups.append(token)
+        return real_resolve(db, token)
+
+    monkeypatch.setattr(EncryptionService, "unwrap_data_key", counting_unwrap)
+    monkeypatch.setattr(deps, "resolve_session", counting_resolve)
+    session, templates, workouts, trends = _batch(
+        client,
+        {"method": "GET", "path": "/auth/session"},
+        {"method": "GET", "path": "/templates"},
+        {"method": "GET", "path": "/workouts?exercise=row"},
+        {"method": "GET", "path": "/workouts/trends"},
+    )
+    assert len(unwraps) == 1 and len(lookups) == 1
+    assert session["status"] == 200 and session["body"]["display_name"] == "Batch"
+    assert templates == {"status": 200, "headers": {}, "body": []}
+    assert [item["title"] for item in workouts["body"]] == ["Pull"]
+    assert trends["body"]["exercise_volume"][0]["exercise"] == "Row"
+
+
+def test_writes_run_in_order_and_fail_independently(client: TestClient):
+    _sign_up(client)
+    created, invalid, listed, patched, missing, reread = _batch(
+        client,
+        {"method": "POST", "path": "/workouts", "body": WORKOUT, "headers": {"Idempotency-Key": "home-1"}},
+        {"method": "POST", "path": "/workouts", "body": {"title": "no start"}},
+        {"method": "GET", "path": "/workouts"},
+        {
+            "method": "PATCH",
+            "path": "/workouts/placeholder",
+            "body": {"notes": "x"},
+            "headers": {"Content-Type": "application/merge-patch+json"},
+        },
+        {"method": "DELETE", "path": "/templates/nope"},
+        {"method": "GET", "path": "/workouts"},
+    )
+    assert created["status"] == 201
+    assert invalid["status"] == 422
+    assert [item["id"] for item in listed["body"]] == [created["body"]["id"]]
+    assert patched["status"] == 404
+    assert missing["status"] == 404 and missing["body"] == {"detail": "Template not found"}
+    assert len(reread["body"]) == 1
+
+    workout_id = created["body"]["id"]
+    (patched,) = _batch(client, {"method": "PATCH", "path": f"/workouts/{workout_id}", "body": {"notes": "x"}})
+    assert patched["status"] == 200 and patched["headers"]["etag"] == '"2"'
+    assert client.get(f"/workouts/{workout_id}").json()["notes"] == "x"
+    (replay,) = _batch(
+        client, {"method": "POST", "path": "/workouts", "body": WORKOUT, "headers": {"Idempotency-Key": "home-1"}}
+    )
+    assert replay["body"]["id"] == workout_id
+    assert len(client.get("/workouts").json()) == 1
+
+
+def test_batch_rejects_nesting_unknown_paths_and_anonymous_calls(client: TestClient):
+    nested, spa, anonymous = _batch(
+        client,
+        {"method": "POST", "path": "/batch", "body": {"requests": []}},
+        {"method": "GET", "path": "/index.html"},
+        {"method": "GET", "path": "/workouts"},
+    )
+    assert nested["status"] == 400
+    assert spa["status"] == 404
+    assert anonymous["status"] == 401
+    assert client.post("/batch", json={"requests": []}).status_code == 422
+
+
+def test_batch_refuses_calls_that_change_credentials(client: TestClient):
+    _sign_up(client)
+    rotate, logout, created = _batch(
+        client,
+        {"method": "POST", "path": "/users/encryption/rotate-key"},
+        {"method": "POST", "path": "/auth/logout"},
+        {"method": "POST", "path": "/workouts", "body": WORKOUT},
+    )
+    assert rotate["status"] == 400 and "cannot be batched" in rotate["body"]["detail"]
+    assert logout["status"] == 400
+    assert created["status"] == 201
+    # The workout was written under the key that is still current, so it reads back.
+    listed = client.get("/workouts")
+    assert listed.status_code == 200 and [item["id"] for item in listed.json()] == [created["body"]["id"]]
+
+
+def test_sub_request_cookies_go_on_the_batch_response_not_its_body(client: TestClient, monkeypatch):
+    def set_probe_cookie(response: Response) -> dict:
+        response.set_cookie("probe", "secret", httponly=True)
+        return {}
+
+    router = client.app.router
+    monkeypatch.setattr(router, "routes", [APIRoute("/workouts/probe", set_probe_cookie), *router.routes])
+    resp = client.post("/batch", json={"requests": [{"method": "GET", "path": "/workouts/probe"}]})
+    assert resp.status_code == 200
+    (probe,) = resp.json()["responses"]
+    assert probe["status"] == 200 and "set-cookie" not in probe["headers"]
+    assert "HttpOnly" in resp.headers["set-cookie"]
+    assert client.cookies.get("probe") == "secret"
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, func, select
+
+from workout_tracker import blind_index, cli
+from workout_tracker.database import adapter
+from workout_tracker.encryption import EncryptionService
+from workout_tracker.models import User, WorkoutIndexToken
+from workout_tracker.routers import workouts as workouts_router
+
+
+def _sign_up(client: TestClient, email: str = "index@example.com") -> str:
+    resp = client.post("/users", json={"display_name": "Idx", "email": email, "encryption_token": "idx-token"})
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def _workout(client: TestClient, title: str, exercises: list[str], template_id: str | None = None) -> str:
+    payload = {
+        "title": title,
+        "start_time": "2024-01-01T08:00:00",
+        "template_id": template_id,
+        "sets": [{"exercise": name, "reps": 5} for name in exercises],
+    }
+    resp = client.post("/workouts", json=payload)
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def _titles(client: TestClient, **params) -> list[str]:
+    resp = client.get("/workouts", params=params)
+    assert resp.status_code == 200
+    return sorted(item["title"] for item in resp.json())
+
+
+def _token_count() -> int:
+    with adapter.session() as db:
+        return db.scalar(select(func.count()).select_from(WorkoutIndexToken))
+
+
+def test_filters_decrypt_only_matching_rows(client: TestClient, monkeypatch):
+    _sign_up(client)
+    _workout(client, "pull", ["Deadlift", "Row"], template_id="t-pull")
+    _workout(client, "legs", ["Squat", "deadlift "], template_id="t-legs")
+    for index in range(5):
+        _workout(client, f"push{index}", ["Bench"], template_id="t-push")
+
+    decrypted = []
+    real_decrypt = EncryptionService.decrypt_payload
+
+    def counting(self, data_key, blob):
+        decrypted.append(blob)
+        return real_decrypt(self, data_key, blob)
+
+    monkeypatch.setattr(EncryptionService, "decrypt_payload", counting)
+    assert _titles(client, exercise="  DEADLIFT") == ["legs", "pull"]
+    assert len(decrypted) == 2
+    assert _titles(client, template_id="t-pull") == ["pull"]
+    assert _titles(client, exercise="deadlift", template_id="t-legs") == ["legs"]
+    assert _titles(client, exercise="Curl") == []
+    assert len(_titles(client)) == 7
+
+
+def test_index_follows_updates_and_deletes(client: TestClient):
+    _sign_up(client)
+    workout_id = _workout(client, "day", ["Squat"])
+    assert _titles(client, exercise="squat") == ["day"]
+
+    updated = {"title": "day", "start_time": "2024-01-01T08:00:00", "sets": [{"exercise": "Lunge", "reps": 8}]}
+    assert client.put(f"/workouts/{workout_id}", json=updated).status_code == 200
+    assert _titles(client, exercise="squat") == []
+    assert _titles(client, exercise="lunge") == ["day"]
+
+    assert client.delete(f"/workouts/{workout_id}").status_code == 204
+    assert _token_count() == 0
+
+
+def test_tokens_are_per_user_and_opaque(client: TestClient):
+    _sign_up(client, "a@example.com")
+    _workout(client, "a", ["Deadlift"])
+    client.cookies.clear()
+    _sign_up(client, "b@example.com")
+    _workout(client, "b", ["Deadlift"])
+    with adapter.session() as db:
+        tokens = db.scalars(select(WorkoutIndexToken.token)).all()
+    assert len(set(tokens)) == 2
+    assert all(b"eadlift" not in token for token in tokens)
+
+
+def test_stale_index_falls_back_to_a_scan_and_rebuilds_after_the_response(client: TestClient, capsys, monkeypatch):
+    user_id = _sign_up(client)
+    _workout(client, "pull", ["Deadlift"])
+    _workout(client, "push", ["Bench"])
+    # Simulate history written before the index existed.
+    with adapter.session() as db:
+        db.execute(delete(WorkoutIndexToken))
+    cli.main(["blind-index-reset"])
+    assert "Marked 1 users" in capsys.readouterr().out
+
+    deferred = []
+    monkeypatch.setattr(workouts_router, "rebuild_stale_index", lambda *args: deferred.append(args))
+    assert _titles(client, exercise="deadlift") == ["pull"]
+    assert _token_count() == 0 and [args[0] for args in deferred] == [user_id]
+
+    blind_index.rebuild_stale_index(*deferred[0])
+    assert _token_count() == 2
+    with adapter.session() as db:
+        assert db.get(User, user_id).blind_index_version == 1
+    assert _titles(client, exercise="deadlift") == ["pull"]
+    assert len(deferred) == 1
+    assert client.post("/workouts/index/rebuild").json() == {"indexed": 2}
+
+
+def test_key_rotation_moves_tokens_to_the_new_key(client: TestClient):
+    _sign_up(client)
+    _workout(client, "pull", ["Deadlift"], template_id="t1")
+    with adapter.session() as db:
+        before = set(db.scalars(select(WorkoutIndexToken.token)).all())
+    assert client.post("/users/encryption/rotate-key").status_code == 202
+    with adapter.session() as db:
+        after = set(db.scalars(select(WorkoutIndexToken.token)).all())
+    assert len(after) == 2 and not before & after
+    assert _titles(client, exercise="deadlift", template_id="t1") == ["pull"]
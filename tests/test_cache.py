@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from workout_tracker import cache
+from workout_tracker.cache import CacheBackend, MemoryCacheBackend, Namespace, SocketCacheBackend
+from workout_tracker.cache.server import serve
+
+WORKOUT = {"title": "Pull", "start_time": "2024-01-01T08:00:00", "sets": [{"exercise": "Row", "reps": 8}]}
+
+
+@pytest.fixture
+def cache_server():
+    path = os.path.join(tempfile.mkdtemp(prefix="wt-cache-"), "cache.sock")
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(serve(path, max_bytes=4096))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    yield path
+
+    async def stop():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+@pytest.fixture
+def socket_backend(cache_server, monkeypatch):
+    monkeypatch.setattr(cache.settings, "cache_backend", "socket")
+    monkeypatch.setattr(cache.settings, "cache_socket_path", cache_server)
+    return cache.get_cache_backend()
+
+
+def test_memory_backend_evicts_by_bytes_and_expires(monkeypatch):
+    backend = MemoryCacheBackend(max_bytes=100)
+    backend.set("a", b"x" * 40, ttl=60)
+    backend.set("b", b"x" * 40, ttl=60)
+    assert backend.get("a") is not None
+    backend.set("c", b"x" * 40, ttl=60)
+    assert backend.get("b") is None and backend.get("a") is not None and backend.get("c") is not None
+    backend.set("huge", b"x" * 200, ttl=60)
+    assert backend.get("huge") is None
+    assert backend.stats()["bytes"] == 82 and backend.stats()["evictions"] == 1
+
+    clock = [time.monotonic()]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    backend.set("short", b"v", ttl=1)
+    backend.set("brief", b"v", ttl=1)
+    clock[0] += 2
+    assert backend.get("short") is None
+    assert backend.purge_expired() == 1
+    assert backend.stats()["expirations"] == 2
+
+    first = backend.incr("generation:u")
+    assert backend.counter("generation:u") == first
+    assert MemoryCacheBackend(100).counter("generation:u") > first
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoCounters(CacheBackend):
+        get = set = delete = MemoryCacheBackend.get
+
+    with pytest.raises(TypeError, match="counter"):
+        NoCounters()
+
+
+def test_socket_backend_round_trips_and_reconnects(cache_server):
+    backend = SocketCacheBackend(cache_server, timeout=1)
+    assert backend.get("missing") is None
+    backend.set("k", b"\x00binary\xff", ttl=60)
+    assert backend.get("k") == b"\x00binary\xff"
+    assert backend.incr("n") == backend.counter("n")
+    backend.delete("k")
+    assert backend.get("k") is None
+    backend._local.sock.close()
+    assert backend.stats()["max_bytes"] == 4096
+
+    unreachable = SocketCacheBackend(cache_server + ".missing", timeout=0.1)
+    with pytest.raises(OSError):
+        unreachable.get("k")
+
+
+def test_sensitive_entries_stay_in_process_and_generations_are_shared(socket_backend):
+    secret = Namespace("tests.secret", lambda: 60, sensitive=True)
+    public = Namespace("tests.public", lambda: 60, sensitive=False)
+    generation = cache.generation("u1")
+    secret.set("u1", generation, "k", b"decrypted")
+    public.set("u1", generation, "k", b"public")
+    assert socket_backend.get(f"tests.secret:u1:{generation}:k") is None
+    assert socket_backend.get(f"tests.public:u1:{generation}:k") == b"public"
+    assert secret.get("u1", generation, "k") == b"decrypted"
+
+    # Another worker's write bumps the shared counter.
+    SocketCacheBackend(socket_backend.path, timeout=1).incr("generation:u1")
+    assert cache.generation("u1") != generation
+    assert cache.stats()["shared"]["counters"] == 1
+
+
+def test_reads_skip_the_cache_when_the_server_is_down(client: TestClient, monkeypatch):
+    monkeypatch.setattr(cache.settings, "read_cache_ttl_seconds", 60)
+    monkeypatch.setattr(cache.settings, "cache_backend", "socket")
+    monkeypatch.setattr(cache.settings, "cache_socket_path", "/nonexistent/cache.sock")
+    resp = client.post("/users", json={"display_name": "C", "email": "c@example.com", "encryption_token": "c4che"})
+    assert resp.status_code == 201
+    assert client.post("/workouts", json=WORKOUT).status_code == 201
+    assert len(client.get("/workouts").json()) == 1
+    assert len(client.get("/workouts").json()) == 1
+    assert client.get("/metrics").json()["cache"]["shared"] is None
+
+
+def test_template_writes_invalidate_cached_reads(client: TestClient, monkeypatch):
+    monkeypatch.setattr(cache.settings, "read_cache_ttl_seconds", 60)
+    resp = client.post("/users", json={"display_name": "T", "email": "t@example.com", "encryption_token": "t3mpl"})
+    user_id = resp.json()["id"]
+    before = cache.generation(user_id)
+    template = client.post("/templates", json={"name": "Plan", "exercises": []}).json()
+    assert cache.generation(user_id) == before + 1
+    assert client.delete(f"/templates/{template['id']}").status_code == 204
+    assert cache.generation(user_id) == before + 2
+
+    client.get("/workouts/trends")
+    trends = client.get("/workouts/trends")
+    assert trends.status_code == 200 and trends.json()["overview"] == []
+    stats = client.get("/metrics").json()["cache"]
+    assert stats["namespaces"]["workouts.reads"]["hits"] >= 1
+    assert stats["local"]["bytes"] > 0
@@ -3,8 +3,17 @@ from datetime import datetime, timedelta, timezone
 import pytest
 from fastapi import HTTPException, status
 
-from workout_tracker.auth.challenge_store import consume_challenge, persist_challenge, purge_expired_challenges
+from sqlalchemy import create_engine, inspect
+
+from workout_tracker.auth.challenge_store import (
+    ChallengeStore,
+    MemoryChallengeStore,
+    consume_challenge,
+    persist_challenge,
+    purge_expired_challenges,
+)
 from workout_tracker.config import settings
+from workout_tracker.database import DatabaseAdapter, SchemaSyncError
 from workout_tracker.models import AuthChallenge, User
 
 
@@ -64,3 +73,107 @@ def test_purge_expired_challenges(db_session):
     remaining = db_session.query(AuthChallenge).all()
     assert len(remaining) == 1
     assert remaining[0].challenge == "fresh"
+
+
+def test_persist_leaves_expired_rows_to_the_sweeper(db_session):
+    user = _seed_user(db_session)
+    stale = AuthChallenge(
+        user=user,
+        challenge="stale",
+        purpose="register",
+        created_at=datetime.now(timezone.utc) - timedelta(seconds=settings.challenge_ttl_seconds + 5),
+    )
+    db_session.add(stale)
+    db_session.flush()
+
+    persist_challenge(db_session, "fresh", "register", user)
+    assert db_session.query(AuthChallenge).count() == 2
+
+
+def test_memory_store_is_single_use_and_scoped(db_session):
+    store = MemoryChallengeStore()
+    user = _seed_user(db_session)
+    store.persist(db_session, "abc", "register", user)
+    with pytest.raises(HTTPException):
+        store.consume(db_session, "abc", "authenticate", user)
+    record = store.consume(db_session, "abc", "register", user)
+    assert record.user_id == user.id
+    with pytest.raises(HTTPException):
+        store.consume(db_session, "abc", "register", user)
+
+
+def test_memory_store_purges_in_expiry_order(db_session, monkeypatch):
+    store = MemoryChallengeStore()
+    clock = [1000.0]
+    monkeypatch.setattr("workout_tracker.auth.challenge_store.time.monotonic", lambda: clock[0])
+    store.persist(db_session, "first", "authenticate")
+    clock[0] += 10
+    store.persist(db_session, "second", "authenticate")
+    store.persist(db_session, "consumed", "authenticate")
+    store.consume(db_session, "consumed", "authenticate")
+
+    clock[0] += settings.challenge_ttl_seconds - 5
+    assert store.purge_expired(db_session) == 1
+    assert len(store) == 1
+    clock[0] += 10
+    with pytest.raises(HTTPException) as excinfo:
+        store.consume(db_session, "second", "authenticate")
+    assert excinfo.value.detail == "Challenge expired"
+    assert store.purge_expired(db_session) == 0
+
+
+def test_schema_sync_adds_created_at_index_to_existing_table(tmp_path):
+    url = f"sqlite:///{tmp_path / 'legacy.sqlite3'}"
+    legacy = create_engine(url)
+    with legacy.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE auth_challenges (id VARCHAR(36) PRIMARY KEY, user_id VARCHAR(36), "
+            "challenge VARCHAR(255) NOT NULL, purpose VARCHAR(32) NOT NULL, created_at DATETIME)"
+        )
+    legacy.dispose()
+
+    adapter = DatabaseAdapter(url)
+    adapter.create_schema()
+    indexed = {tuple(index["column_names"]) for index in inspect(adapter.engine).get_indexes("auth_challenges")}
+    assert ("created_at",) in indexed
+    adapter.engine.dispose()
+
+
+def _legacy_database(tmp_path, *ddl: str) -> DatabaseAdapter:
+    url = f"sqlite:///{tmp_path / 'legacy.sqlite3'}"
+    legacy = create_engine(url)
+    with legacy.begin() as conn:
+        for statement in ddl:
+            conn.exec_driver_sql(statement)
+    legacy.dispose()
+    return DatabaseAdapter(url)
+
+
+def test_schema_sync_keeps_not_null_on_server_defaulted_columns(tmp_path):
+    adapter = _legacy_database(
+        tmp_path,
+        "CREATE TABLE workout_templates (id VARCHAR(36) PRIMARY KEY, user_id VARCHAR(36) NOT NULL, "
+        "encrypted_payload BLOB NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)",
+        "INSERT INTO workout_templates VALUES ('t1', 'u1', x'00', '2024-01-01', '2024-01-01')",
+    )
+    adapter.create_schema()
+    columns = {column["name"]: column for column in inspect(adapter.engine).get_columns("workout_templates")}
+    assert columns["version"]["nullable"] is False and columns["key_generation"]["nullable"] is False
+    with adapter.engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT version, key_generation FROM workout_templates").one() == (1, 1)
+    adapter.engine.dispose()
+
+
+def test_schema_sync_refuses_not_null_columns_it_cannot_fill(tmp_path):
+    adapter = _legacy_database(tmp_path, "CREATE TABLE auth_challenges (id VARCHAR(36) PRIMARY KEY)")
+    with pytest.raises(SchemaSyncError, match="auth_challenges.challenge"):
+        adapter.create_schema()
+    adapter.engine.dispose()
+
+
+def test_incomplete_challenge_store_fails_at_construction():
+    class NoConsume(ChallengeStore):
+        persist = purge_expired = MemoryChallengeStore.persist
+
+    with pytest.raises(TypeError, match="consume"):
+        NoConsume()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import pytest
+
+from workout_tracker import cli
+from workout_tracker.config import Settings
+
+STRONG_SECRET = "x" * 48
+
+
+def test_prod_defaults_to_one_worker_per_cpu(monkeypatch):
+    monkeypatch.setattr(cli.os, "cpu_count", lambda: 6)
+    settings = Settings(environment="prod", session_secret=STRONG_SECRET)
+    options = cli.build_server_options(cli.parse_args([]), settings)
+    assert options["workers"] == 6
+    assert options["reload"] is False
+    assert options["timeout_graceful_shutdown"] == 30
+
+
+def test_dev_runs_single_reloading_worker():
+    options = cli.build_server_options(cli.parse_args([]), Settings(environment="dev"))
+    assert options["workers"] == 1
+    assert options["reload"] is True
+
+
+def test_serving_flags_are_forwarded():
+    args = cli.parse_args(
+        [
+            "--workers",
+            "3",
+            "--loop",
+            "uvloop",
+            "--http",
+            "httptools",
+            "--timeout-keep-alive",
+            "20",
+            "--backlog",
+            "4096",
+            "--limit-max-requests",
+            "10000",
+        ]
+    )
+    options = cli.build_server_options(args, Settings(environment="dev"))
+    assert options["workers"] == 3
+    assert options["reload"] is False
+    assert options["loop"] == "uvloop"
+    assert options["http"] == "httptools"
+    assert options["timeout_keep_alive"] == 20
+    assert options["backlog"] == 4096
+    assert options["limit_max_requests"] == 10000
+
+
+def test_default_session_secret_rejected_for_multiple_workers():
+    with pytest.raises(SystemExit) as excinfo:
+        cli.validate_settings(Settings(environment="dev", session_secret=cli.DEFAULT_SESSION_SECRET), workers=2)
+    assert "SESSION_SECRET" in str(excinfo.value)
+
+
+def test_short_session_secret_rejected_in_prod():
+    with pytest.raises(SystemExit):
+        cli.validate_settings(Settings(environment="prod", session_secret="short"), workers=1)
+
+
+def test_memory_sessions_rejected_for_multiple_workers():
+    with pytest.raises(SystemExit) as excinfo:
+        cli.validate_settings(
+            Settings(environment="prod", session_secret=STRONG_SECRET, session_backend="memory"), workers=4
+        )
+    assert "SESSION_BACKEND" in str(excinfo.value)
+
+
+def test_memory_challenges_rejected_for_multiple_workers():
+    with pytest.raises(SystemExit) as excinfo:
+        cli.validate_settings(
+            Settings(environment="prod", session_secret=STRONG_SECRET, challenge_backend="memory"), workers=2
+        )
+    assert "CHALLENGE_BACKEND" in str(excinfo.value)
+
+
+def test_main_runs_uvicorn_with_validated_options(monkeypatch):
+    import uvicorn
+
+    captured = {}
+    monkeypatch.setattr(uvicorn, "run", lambda app, **kwargs: captured.update(app=app, **kwargs))
+    monkeypatch.setattr(cli.os, "cpu_count", lambda: 2)
+    monkeypatch.setenv("ENVIRONMENT", "prod")
+    monkeypatch.setenv("SESSION_SECRET", STRONG_SECRET)
+    from workout_tracker.config import get_settings
+
+    get_settings.cache_clear()
+    try:
+        cli.main(["--host", "0.0.0.0"])
+    finally:
+        get_settings.cache_clear()
+    assert captured["app"] == "workout_tracker.app:app"
+    assert captured["workers"] == 2
+    assert captured["host"] == "0.0.0.0"
+
+
+def test_memory_rate_limits_rejected_for_multiple_workers():
+    settings = Settings(
+        environment="dev", session_secret=STRONG_SECRET, rate_limit_enabled=True, rate_limit_backend="memory"
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        cli.validate_settings(settings, workers=2)
+    assert "RATE_LIMIT_BACKEND" in str(excinfo.value)
+    cli.validate_settings(settings, workers=1)
+
+
+def test_pbkdf2_iterations_below_the_floor_rejected():
+    with pytest.raises(SystemExit) as excinfo:
+        cli.validate_settings(Settings(session_secret=STRONG_SECRET, kdf_iterations=390_000), workers=1)
+    assert "KDF_ITERATIONS" in str(excinfo.value)
+    cli.validate_settings(Settings(session_secret=STRONG_SECRET), workers=1)
+
+
+def test_trusted_proxies_are_forwarded_to_uvicorn():
+    settings = Settings(environment="dev", forwarded_allow_ips="10.0.0.2")
+    options = cli.build_server_options(cli.parse_args([]), settings)
+    assert options["proxy_headers"] is True
+    assert options["forwarded_allow_ips"] == "10.0.0.2"
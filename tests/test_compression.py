@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import gzip
+import zlib
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from workout_tracker.compression import CompressionMiddleware, negotiate_encoding
+
+ROWS = [{"exercise": "Deadlift", "reps": 5, "weight": 140.0, "unit": "kg"} for _ in range(200)]
+
+
+def _app(minimum_size: int = 1024) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size, level=6, encodings=("gzip",))
+
+    @app.get("/rows")
+    def rows():
+        return ROWS
+
+    @app.get("/tiny")
+    def tiny():
+        return {"ok": True}
+
+    @app.get("/export")
+    def export():
+        def chunks():
+            for row in ROWS[:50]:
+                yield (str(row) + "\n").encode()
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([b"data: x\n\n" * 400]), media_type="text/event-stream")
+
+    @app.get("/already")
+    def already():
+        body = gzip.compress(b"x" * 4096)
+        return StreamingResponse(iter([body]), media_type="text/plain", headers={"Content-Encoding": "gzip"})
+
+    return app
+
+
+def test_large_json_is_gzipped():
+    client = TestClient(_app())
+    resp = client.get("/rows", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["vary"]
+    assert int(resp.headers["content-length"]) < len(resp.content)
+    assert resp.json() == ROWS
+
+
+def test_small_and_unaccepted_responses_pass_through():
+    client = TestClient(_app())
+    assert "content-encoding" not in client.get("/tiny", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/rows", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_streaming_responses_are_compressed_incrementally():
+    client = TestClient(_app())
+    with client.stream("GET", "/export", headers={"Accept-Encoding": "gzip"}) as resp:
+        assert resp.headers["content-encoding"] == "gzip"
+        assert "content-length" not in resp.headers
+        raw = b"".join(resp.iter_raw())
+    text = zlib.decompress(raw, 31).decode()
+    assert text.count("\n") == 50
+
+
+def test_already_encoded_responses_are_not_recompressed():
+    client = TestClient(_app())
+    resp = client.get("/already", headers={"Accept-Encoding": "gzip"})
+    assert resp.content == b"x" * 4096
+
+
+def test_event_streams_are_not_compressed():
+    client = TestClient(_app())
+    resp = client.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert resp.content == b"data: x\n\n" * 400
+
+
+def test_workout_listing_is_compressed_end_to_end(client: TestClient):
+    token = "compress-token"
+    assert client.post(
+        "/users", json={"display_name": "Zip", "email": "zip@example.com", "encryption_token": token}
+    ).status_code == 201
+    workout = {
+        "title": "Pull",
+        "start_time": "2024-03-01T08:00:00",
+        "sets": [{"exercise": "Deadlift", "reps": 5, "weight": 140, "unit": "kg"}] * 40,
+    }
+    assert client.post("/workouts", json=workout).status_code == 201
+    resp = client.get("/workouts", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert len(resp.json()[0]["sets"]) == 40
+
+
+def test_negotiate_encoding_honours_q_values():
+    assert negotiate_encoding("gzip;q=0, br", ("br", "gzip")) == "br"
+    assert negotiate_encoding("br;q=0, gzip", ("br", "gzip")) == "gzip"
+    assert negotiate_encoding("*", ("gzip",)) == "gzip"
+    assert negotiate_encoding("identity", ("gzip",)) is None
+    assert negotiate_encoding(None, ("gzip",)) is None
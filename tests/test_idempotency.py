@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select, update
+
+from workout_tracker.database import adapter
+from workout_tracker.encryption import EncryptionService
+from workout_tracker.idempotency import expire_idempotency_keys
+from workout_tracker.models import IdempotencyKey, Workout, WorkoutTemplate
+from workout_tracker.routers import workouts as workouts_router
+
+WORKOUT = {"title": "Gym", "start_time": "2024-01-01T08:00:00", "sets": [{"exercise": "Squat", "reps": 5}]}
+
+
+def _sign_up(client: TestClient, email: str = "retry@example.com") -> None:
+    resp = client.post("/users", json={"display_name": "Retry", "email": email, "encryption_token": "r3try"})
+    assert resp.status_code == 201
+
+
+def _count(model) -> int:
+    with adapter.session() as db:
+        return db.scalar(select(func.count()).select_from(model))
+
+
+def _post(client: TestClient, key: str, payload: dict = WORKOUT):
+    return client.post("/workouts", json=payload, headers={"Idempotency-Key": key})
+
+
+def test_retry_replays_the_original_response_without_encrypting(client: TestClient, monkeypatch):
+    _sign_up(client)
+    first = _post(client, "abc")
+    assert first.status_code == 201
+    assert "idempotent-replayed" not in first.headers
+
+    encrypted = []
+    real_encrypt = EncryptionService.encrypt_payload
+
+    def counting(self, data_key, payload):
+        encrypted.append(payload)
+        return real_encrypt(self, data_key, payload)
+
+    monkeypatch.setattr(EncryptionService, "encrypt_payload", counting)
+    retry = _post(client, "abc")
+    assert retry.status_code == 201
+    assert retry.headers["idempotent-replayed"] == "true"
+    # Timestamps differ only in how SQLite round-trips their timezone.
+    assert {k: v for k, v in retry.json().items() if not k.endswith("_at")} == {
+        k: v for k, v in first.json().items() if not k.endswith("_at")
+    }
+    assert encrypted == []
+    assert _count(Workout) == 1
+
+    assert _post(client, "other").status_code == 201
+    assert client.post("/workouts", json=WORKOUT).status_code == 201
+    assert _count(Workout) == 3
+
+
+def test_key_reuse_is_checked_and_scoped(client: TestClient):
+    _sign_up(client, "a@example.com")
+    assert _post(client, "k1").status_code == 201
+    mismatch = _post(client, "k1", {**WORKOUT, "title": "Different"})
+    assert mismatch.status_code == 422
+
+    template = {"name": "Plan", "exercises": []}
+    created = client.post("/templates", json=template, headers={"Idempotency-Key": "k1"})
+    assert created.status_code == 201
+    replay = client.post("/templates", json=template, headers={"Idempotency-Key": "k1"})
+    assert replay.json()["id"] == created.json()["id"]
+    assert _count(WorkoutTemplate) == 1
+
+    client.cookies.clear()
+    _sign_up(client, "b@example.com")
+    assert _post(client, "k1").headers.get("idempotent-replayed") is None
+    assert _count(Workout) == 2
+
+
+def test_duplicate_arriving_mid_request_gets_409_then_replays(client: TestClient, monkeypatch):
+    _sign_up(client)
+    entered, release = threading.Event(), threading.Event()
+    real_index = workouts_router.index_workouts
+
+    def slow_index(*args, **kwargs):
+        entered.set()
+        assert release.wait(5)
+        return real_index(*args, **kwargs)
+
+    monkeypatch.setattr(workouts_router, "index_workouts", slow_index)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        first = pool.submit(_post, client, "same")
+        assert entered.wait(5)
+        duplicate = _post(client, "same")
+        assert duplicate.status_code == 409
+        assert duplicate.headers["retry-after"] == "1"
+        release.set()
+        assert first.result().status_code == 201
+    assert _post(client, "same").json()["id"] == first.result().json()["id"]
+    assert _count(Workout) == 1
+
+
+def test_simultaneous_duplicates_create_one_row(client: TestClient):
+    _sign_up(client)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda _: _post(client, "burst"), range(8)))
+    assert {resp.status_code for resp in responses} <= {201, 409}
+    ids = {resp.json()["id"] for resp in responses if resp.status_code == 201}
+    assert len(ids) == 1
+    assert _count(Workout) == 1
+
+
+def test_failed_request_releases_its_key_and_keys_expire(client: TestClient, monkeypatch):
+    _sign_up(client)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(workouts_router, "index_workouts", broken)
+    with pytest.raises(RuntimeError):
+        _post(client, "flaky")
+    monkeypatch.undo()
+    assert _post(client, "flaky").status_code == 201
+    assert _count(Workout) == 1
+
+    with adapter.session() as db:
+        db.execute(update(IdempotencyKey).values(created_at=datetime.now(timezone.utc) - timedelta(days=2)))
+    assert expire_idempotency_keys() == 1
+    assert _count(IdempotencyKey) == 0
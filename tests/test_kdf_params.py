@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+from workout_tracker import cli, encryption
+from workout_tracker.auth.session_store import key_handles
+from workout_tracker.config import Settings, settings
+from workout_tracker.database import adapter
+from workout_tracker.encryption import (
+    PBKDF2_MIN_ITERATIONS,
+    EncryptionContext,
+    EncryptionService,
+    KdfParams,
+    calibrate_kdf,
+)
+from workout_tracker.models import User
+
+TOKEN = "kdf-token"
+
+
+@pytest.fixture
+def cheap_kdf(monkeypatch):
+    monkeypatch.setattr(settings, "kdf_algorithm", "pbkdf2-sha256")
+    monkeypatch.setattr(settings, "kdf_iterations", 1_000)
+    monkeypatch.setattr(settings, "kdf_legacy_iterations", 1_000)
+    monkeypatch.setattr(settings, "kdf_scrypt_n", 2**10)
+
+
+def _sign_up(client: TestClient) -> str:
+    resp = client.post("/users", json={"display_name": "Kdf", "email": "kdf@example.com", "encryption_token": TOKEN})
+    assert resp.status_code == 201, resp.text
+    return resp.json()["id"]
+
+
+def _stored(user_id: str) -> User:
+    with adapter.session() as db:
+        return db.get(User, user_id)
+
+
+def test_params_round_trip(cheap_kdf):
+    for params in (
+        KdfParams("pbkdf2-sha256", 600_000),
+        KdfParams("scrypt", 2**15, block_size=8, parallelism=1),
+        KdfParams("argon2id", 3, memory_kib=65_536, parallelism=1),
+    ):
+        assert KdfParams.decode(params.encode()) == params
+    assert KdfParams.decode(None) == KdfParams("pbkdf2-sha256", 1_000)
+
+
+def test_new_users_record_their_parameters(client: TestClient, cheap_kdf):
+    user = _stored(_sign_up(client))
+    assert user.kdf_params == "pbkdf2-sha256$i=1000"
+
+
+def test_unlock_rewraps_to_current_parameters(client: TestClient, cheap_kdf, monkeypatch):
+    user_id = _sign_up(client)
+    before = _stored(user_id)
+    monkeypatch.setattr(settings, "kdf_algorithm", "scrypt")
+    key_handles.drop_user(user_id)
+
+    assert client.get("/workouts").status_code == 200
+    after = _stored(user_id)
+    assert after.kdf_params == "scrypt$n=1024,r=8,p=1"
+    assert after.encrypted_data_key != before.encrypted_data_key
+    assert after.encryption_version == before.encryption_version
+
+    service = EncryptionService()
+    old_key = service.unwrap_data_key(
+        EncryptionContext(TOKEN, before.encryption_salt, before.encrypted_data_key, before.kdf_params)
+    )
+    new_key = service.unwrap_data_key(
+        EncryptionContext(TOKEN, after.encryption_salt, after.encrypted_data_key, after.kdf_params)
+    )
+    assert old_key == new_key
+
+
+def test_legacy_envelope_unlocks_after_global_setting_changes(client: TestClient, cheap_kdf, monkeypatch):
+    user_id = _sign_up(client)
+    with adapter.session() as db:
+        db.get(User, user_id).kdf_params = None
+    # Raising the global target no longer breaks envelopes written with the old count.
+    monkeypatch.setattr(settings, "kdf_iterations", 2_000)
+    key_handles.drop_user(user_id)
+
+    assert client.get("/workouts").status_code == 200
+    assert _stored(user_id).kdf_params == "pbkdf2-sha256$i=2000"
+
+
+def test_kdf_calibrate_command(monkeypatch, capsys):
+    monkeypatch.setattr(
+        "workout_tracker.encryption.calibrate_kdf",
+        lambda algorithm, target, max_memory_kib: (KdfParams("pbkdf2-sha256", 480_000), target),
+    )
+    cli.main(["kdf-calibrate", "--target-ms", "300"])
+    out = capsys.readouterr().out
+    assert "pbkdf2-sha256$i=480000" in out
+    assert "KDF_ITERATIONS=480000" in out
+
+
+def test_calibration_scales_to_target(monkeypatch):
+    # One microsecond per iteration.
+    monkeypatch.setattr(encryption, "_time_derivation", lambda params, rounds: params.cost / 1_000_000)
+    params, seconds = calibrate_kdf("pbkdf2-sha256", 1.5, rounds=1)
+    assert params.cost == 1_500_000 and seconds == 1.5
+
+
+def test_calibration_never_goes_below_the_owasp_floor(monkeypatch):
+    monkeypatch.setattr(encryption, "_time_derivation", lambda params, rounds: params.cost / 1_000_000)
+    params, _ = calibrate_kdf("pbkdf2-sha256", 0.01, rounds=1)
+    assert params.cost == PBKDF2_MIN_ITERATIONS == 600_000
+
+
+def test_unavailable_kdf_rejected_at_startup(monkeypatch):
+    monkeypatch.setattr(encryption, "Argon2id", None)
+    with pytest.raises(SystemExit) as excinfo:
+        cli.validate_settings(Settings(kdf_algorithm="argon2id"), workers=1)
+    assert "KDF_ALGORITHM=argon2id" in str(excinfo.value)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+from workout_tracker import key_rotation
+from workout_tracker.database import adapter
+from workout_tracker.encryption import EncryptionContext, EncryptionService
+from workout_tracker.models import KeyRotation, User, Workout, WorkoutTemplate
+from workout_tracker.routers import users as users_router
+
+TOKEN = "rotate-me"
+TEMPLATE = {"name": "Plan", "exercises": [{"name": "Squat", "target_sets": 3, "target_reps": 5}]}
+
+
+def _workout(title: str) -> dict:
+    return {"title": title, "start_time": "2024-01-01T08:00:00", "sets": [{"exercise": "Squat", "reps": 5}]}
+
+
+def _setup(client: TestClient, workouts: int = 3) -> str:
+    resp = client.post("/users", json={"display_name": "Rot", "email": "rot@example.com", "encryption_token": TOKEN})
+    assert resp.status_code == 201
+    for index in range(workouts):
+        assert client.post("/workouts", json=_workout(f"w{index}")).status_code == 201
+    assert client.post("/templates", json=TEMPLATE).status_code == 201
+    return resp.json()["id"]
+
+
+def _data_key(user_id: str, token: str = TOKEN) -> bytes:
+    with adapter.session() as db:
+        user = db.get(User, user_id)
+        ctx = EncryptionContext(token, user.encryption_salt, user.encrypted_data_key, user.kdf_params)
+    return EncryptionService().unwrap_data_key(ctx)
+
+
+def _generations(model) -> list[int]:
+    with adapter.session() as db:
+        return sorted(db.scalars(select(model.key_generation)).all())
+
+
+def test_rotation_replaces_the_data_key_everywhere(client: TestClient):
+    user_id = _setup(client)
+    old_key = _data_key(user_id)
+
+    resp = client.post("/users/encryption/rotate-key")
+    assert resp.status_code == 202
+    job_id = resp.json()["id"]
+    assert resp.headers["Location"] == f"/users/encryption/rotations/{job_id}"
+
+    status = client.get(f"/users/encryption/rotations/{job_id}").json()
+    assert status == {"id": job_id, "status": "done", "generation": 2, "total_rows": 4, "rotated_rows": 4}
+    assert _generations(Workout) == [2, 2, 2]
+    assert _generations(WorkoutTemplate) == [2]
+
+    new_key = _data_key(user_id)
+    assert new_key != old_key and b"," not in new_key
+    with adapter.session() as db:
+        assert db.get(User, user_id).pending_data_key is None
+        blob = db.scalars(select(Workout.encrypted_payload)).first()
+    with pytest.raises(InvalidToken):
+        Fernet(old_key).decrypt(blob)
+    assert sorted(item["title"] for item in client.get("/workouts").json()) == ["w0", "w1", "w2"]
+    assert client.get("/templates").json()[0]["name"] == "Plan"
+
+
+def test_interrupted_rotation_keeps_reads_working_and_resumes(client: TestClient, monkeypatch):
+    user_id = _setup(client, workouts=5)
+    monkeypatch.setattr(users_router, "run_key_rotation", lambda job_id, keyring: None)
+    job_id = client.post("/users/encryption/rotate-key").json()["id"]
+    keyring = _data_key(user_id)
+
+    # Crash after the first batch.
+    batches = []
+    real_batch = key_rotation._rotate_batch
+
+    def crash_after_one(*args):
+        if batches:
+            raise RuntimeError("worker died")
+        batches.append(args)
+        return real_batch(*args)
+
+    monkeypatch.setattr(key_rotation, "_rotate_batch", crash_after_one)
+    key_rotation.run_key_rotation(job_id, keyring, batch_size=2)
+    assert client.get(f"/users/encryption/rotations/{job_id}").json()["status"] == "failed"
+    assert _generations(Workout) == [1, 1, 1, 2, 2]
+
+    # Mixed generations read fine, new writes use the new key, and a second rotation must wait.
+    assert client.post("/workouts", json=_workout("during")).status_code == 201
+    assert len(client.get("/workouts").json()) == 6
+    # Changing the token mid-rotation re-wraps both envelopes.
+    assert client.post("/users/encryption/rotate", json={"encryption_token": "new-token"}).status_code == 200
+
+    # The user resumes the failed job with their token; nothing else can unwrap the keyring.
+    monkeypatch.setattr(key_rotation, "_rotate_batch", real_batch)
+    monkeypatch.undo()
+    resumed = client.post("/users/encryption/rotate-key", headers={"X-Encryption-Token": "new-token"})
+    assert resumed.status_code == 202 and resumed.json()["id"] == job_id
+
+    status = client.get(f"/users/encryption/rotations/{job_id}").json()
+    assert status["status"] == "done"
+    assert _generations(Workout) == [2] * 6
+    assert b"," not in _data_key(user_id, "new-token")
+    assert len(client.get("/workouts").json()) == 6
+
+
+def test_writers_from_before_a_rotation_cannot_write_under_the_retired_key(client: TestClient, monkeypatch):
+    user_id = _setup(client, workouts=1)
+    workout = client.get("/workouts").json()[0]
+    with adapter.session() as db:
+        stale_user = db.get(User, user_id)
+        db.expunge(stale_user)
+
+    monkeypatch.setattr(users_router, "run_key_rotation", lambda job_id, keyring: None)
+    job_id = client.post("/users/encryption/rotate-key").json()["id"]
+    with adapter.session() as db, pytest.raises(HTTPException) as refused:
+        key_rotation.lock_key_generation(db, stale_user)
+    assert refused.value.status_code == 409
+
+    key_rotation.run_key_rotation(job_id, _data_key(user_id))
+    # Re-encryption bumps the version, so a save based on the pre-rotation copy is refused.
+    stale_save = client.put(
+        f"/workouts/{workout['id']}", json=_workout("stale"), headers={"If-Match": f'"{workout["version"]}"'}
+    )
+    assert stale_save.status_code == 412
+
+
+def test_unknown_rotation_is_404(client: TestClient):
+    _setup(client, workouts=0)
+    assert client.get("/users/encryption/rotations/unknown").status_code == 404
+
+
+def test_running_rotation_is_not_resumed_twice_and_dead_workers_are_reported(client: TestClient, monkeypatch):
+    _setup(client, workouts=1)
+    monkeypatch.setattr(users_router, "run_key_rotation", lambda job_id, keyring: None)
+    job_id = client.post("/users/encryption/rotate-key").json()["id"]
+    assert client.post("/users/encryption/rotate-key").status_code == 409
+
+    assert key_rotation.mark_stalled_key_rotations() == 0
+    with adapter.session() as db:
+        db.execute(
+            update(KeyRotation)
+            .where(KeyRotation.id == job_id)
+            .values(updated_at=datetime.now(timezone.utc) - timedelta(hours=1))
+        )
+    assert key_rotation.mark_stalled_key_rotations() == 1
+    with adapter.session() as db:
+        job = db.get(KeyRotation, job_id)
+        assert job.status == "failed"
+    assert client.post("/users/encryption/rotate-key").json()["id"] == job_id
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from workout_tracker import live
+from workout_tracker.database import adapter
+from workout_tracker.live import hub, publish_after_commit
+from workout_tracker.models import Workout
+
+WORKOUT = {"title": "Legs", "start_time": "2024-01-01T08:00:00", "sets": [{"exercise": "Squat", "reps": 5}]}
+
+
+def _sign_up(client: TestClient, email: str = "live@example.com") -> None:
+    resp = client.post("/users", json={"display_name": "Live", "email": email, "encryption_token": "l1ve"})
+    assert resp.status_code == 201
+
+
+def _parse(chunk: str) -> tuple[str, dict]:
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+
+async def _open_stream(client: TestClient, path: str):
+    """Drive the app's ASGI interface directly; the test client buffers whole responses."""
+    messages: asyncio.Queue = asyncio.Queue()
+    disconnect = asyncio.Event()
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await messages.put(message)
+
+    cookie = "; ".join(f"{name}={value}" for name, value in client.cookies.items())
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+        "state": {},
+    }
+    task = asyncio.create_task(client.app(scope, receive, send))
+    start = await asyncio.wait_for(messages.get(), 5)
+
+    async def next_chunk() -> str:
+        message = await asyncio.wait_for(messages.get(), 5)
+        return message["body"].decode()
+
+    async def close() -> None:
+        disconnect.set()
+        await asyncio.wait_for(task, 5)
+
+    return start, next_chunk, close
+
+
+def test_other_devices_receive_committed_edits(client: TestClient):
+    _sign_up(client)
+    workout_id = client.post("/workouts", json=WORKOUT).json()["id"]
+
+    async def run():
+        start, next_chunk, close = await _open_stream(client, f"/workouts/{workout_id}/live")
+        assert start["status"] == 200
+        assert dict(start["headers"])[b"content-type"].startswith(b"text/event-stream")
+        assert (await next_chunk()).startswith("retry: ")
+
+        loop = asyncio.get_running_loop()
+        added = await loop.run_in_executor(
+            None, lambda: client.post(f"/workouts/{workout_id}/sets", json={"exercise": "Squat", "reps": 3})
+        )
+        assert added.status_code == 201
+        event, data = _parse(await next_chunk())
+        assert event == "set.appended" and data["set"] == added.json()
+
+        patched = await loop.run_in_executor(
+            None,
+            lambda: client.patch(
+                f"/workouts/{workout_id}",
+                json={"notes": "heavy"},
+                headers={"Content-Type": "application/merge-patch+json"},
+            ),
+        )
+        assert patched.status_code == 200
+        assert _parse(await next_chunk()) == (
+            "workout.updated", {"workout_id": workout_id, "version": patched.json()["version"]}
+        )
+        assert hub.stats()["streams"] == 1
+        await close()
+        assert hub.stats()["streams"] == 0
+
+    asyncio.run(run())
+
+
+def test_streams_are_private_and_capped(client: TestClient, monkeypatch):
+    _sign_up(client, "owner@example.com")
+    workout_id = client.post("/workouts", json=WORKOUT).json()["id"]
+    client.cookies.clear()
+    _sign_up(client, "other@example.com")
+    assert client.get(f"/workouts/{workout_id}/live").status_code == 404
+    client.cookies.clear()
+    assert client.get(f"/workouts/{workout_id}/live").status_code == 401
+
+    _sign_up(client, "third@example.com")
+    own_workout = client.post("/workouts", json=WORKOUT).json()["id"]
+    monkeypatch.setattr(live.settings, "live_max_streams_per_user", 1)
+
+    async def run():
+        _, _, close = await _open_stream(client, f"/workouts/{own_workout}/live")
+        second, _, close_second = await _open_stream(client, f"/workouts/{own_workout}/live")
+        assert second["status"] == 429
+        await close_second()
+        await close()
+
+    asyncio.run(run())
+
+
+def test_rolled_back_edits_are_not_published(client: TestClient, monkeypatch):
+    _sign_up(client)
+    workout_id = client.post("/workouts", json=WORKOUT).json()["id"]
+    published = []
+    monkeypatch.setattr(hub, "publish", lambda *event: published.append(event))
+
+    assert client.delete(f"/workouts/{workout_id}/sets/missing").status_code == 404
+    with adapter.session() as db:
+        db.get(Workout, workout_id).notes_search = "edited"
+        publish_after_commit(db, workout_id, "workout.updated", {})
+        db.rollback()
+    assert published == []
+
+    assert client.delete(f"/workouts/{workout_id}").status_code == 204
+    assert published == [(workout_id, "workout.deleted", {"workout_id": workout_id})]
+
+
+def test_slow_streams_get_a_resync_and_idle_streams_a_heartbeat(monkeypatch):
+    monkeypatch.setattr(live.settings, "live_queue_size", 2)
+    monkeypatch.setattr(live.settings, "live_heartbeat_seconds", 0.05)
+
+    async def run():
+        subscription = hub.subscribe("user", "workout")
+        body = live.stream(subscription)
+        assert (await anext(body)).startswith("retry: ")
+        assert await anext(body) == live.HEARTBEAT
+
+        for number in range(3):
+            assert hub.publish("workout", "set.appended", {"n": number}) == 1
+        await asyncio.sleep(0)
+        assert _parse(await anext(body)) == ("resync", {"workout_id": "workout"})
+        assert await anext(body) == live.HEARTBEAT
+        assert hub.stats()["resyncs"] >= 1
+
+        await body.aclose()
+        assert hub.publish("workout", "set.appended", {}) == 0
+
+    asyncio.run(run())
+
+
+def test_revoking_the_session_ends_its_streams(client: TestClient, monkeypatch):
+    _sign_up(client)
+    workout_id = client.post("/workouts", json=WORKOUT).json()["id"]
+    monkeypatch.setattr(live.settings, "live_heartbeat_seconds", 0.05)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        _, next_chunk, close = await _open_stream(client, f"/workouts/{workout_id}/live")
+        assert (await next_chunk()).startswith("retry: ")
+        assert (await loop.run_in_executor(None, client.post, "/auth/logout")).status_code == 204
+        while (chunk := await next_chunk()) == live.HEARTBEAT:
+            pass
+        assert chunk == ""
+        await close()
+
+    asyncio.run(run())
+
+
+def test_streams_recheck_their_session(monkeypatch):
+    monkeypatch.setattr(live.settings, "live_heartbeat_seconds", 0.01)
+    monkeypatch.setattr(live.settings, "live_session_check_seconds", 0.01)
+    alive = {"session-key": True}
+    monkeypatch.setattr(live, "_session_alive", lambda key: alive[key])
+
+    async def run():
+        body = live.stream(hub.subscribe("user", "workout", "session-key"))
+        assert (await anext(body)).startswith("retry: ")
+        assert await anext(body) == live.HEARTBEAT
+        # Revoked by another worker: the next check ends the stream.
+        alive["session-key"] = False
+        with pytest.raises(StopAsyncIteration):
+            while True:
+                await anext(body)
+
+    asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def _no_leaked_streams():
+    yield
+    assert hub.stats()["streams"] == 0
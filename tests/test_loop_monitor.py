@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from workout_tracker.loop_monitor import LoopLagMonitor
+
+
+def _blocking_handler():
+    time.sleep(0.3)
+
+
+def test_monitor_reports_blocking_call_with_stack():
+    monitor = LoopLagMonitor(0.1)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        _blocking_handler()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    asyncio.run(run())
+    assert len(monitor.stalls) == 1
+    assert "_blocking_handler" in monitor.stalls[0].stack
+    assert monitor.stats()["max_lag_ms"] >= 100
+
+
+def test_monitor_quiet_when_loop_yields():
+    monitor = LoopLagMonitor(0.1)
+
+    async def run():
+        monitor.start()
+        for _ in range(10):
+            await asyncio.to_thread(time.sleep, 0.03)
+        await monitor.stop()
+
+    asyncio.run(run())
+    assert monitor.stalls == []
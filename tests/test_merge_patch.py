@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from workout_tracker.database import adapter
+from workout_tracker.merge_patch import flush_versioned, merge_patch
+from workout_tracker.models import WorkoutTemplate
+
+MERGE_PATCH = {"Content-Type": "application/merge-patch+json"}
+
+
+def _sign_up(client: TestClient) -> None:
+    user = {"display_name": "Patch", "email": "patch@example.com", "encryption_token": "p4tch"}
+    resp = client.post("/users", json=user)
+    assert resp.status_code == 201
+
+
+def _workout(client: TestClient) -> dict:
+    payload = {
+        "title": "Legs",
+        "start_time": "2024-01-01T08:00:00",
+        "notes": "felt strong",
+        "sets": [{"exercise": "Squat", "reps": 5, "weight": 100}],
+    }
+    resp = client.post("/workouts", json=payload)
+    assert resp.status_code == 201
+    return resp.json()
+
+
+def test_merge_patch_follows_rfc_7396():
+    assert merge_patch({"a": "b"}, {"a": "c"}) == {"a": "c"}
+    assert merge_patch({"a": "b"}, {"b": "c"}) == {"a": "b", "b": "c"}
+    assert merge_patch({"a": "b", "b": "c"}, {"a": None}) == {"b": "c"}
+    assert merge_patch({"a": [{"b": "c"}]}, {"a": [1]}) == {"a": [1]}
+    assert merge_patch({"a": {"b": "c"}}, {"a": {"b": "d", "c": None}}) == {"a": {"b": "d"}}
+    assert merge_patch({"e": None}, {"a": 1}) == {"e": None, "a": 1}
+    assert merge_patch({"a": "foo"}, ["c"]) == ["c"]
+    target = {"a": {"b": 1}}
+    merge_patch(target, {"a": {"b": 2}})
+    assert target == {"a": {"b": 1}}
+
+
+def test_patch_workout_changes_only_the_given_fields(client: TestClient):
+    _sign_up(client)
+    workout = _workout(client)
+    assert workout["version"] == 1
+
+    resp = client.patch(
+        f"/workouts/{workout['id']}", json={"end_time": "2024-01-01T09:00:00", "notes": None}, headers=MERGE_PATCH
+    )
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["end_time"] == "2024-01-01T09:00:00"
+    assert body["notes"] is None
+    assert body["sets"] == workout["sets"]
+    assert body["version"] == 2 and resp.headers["etag"] == '"2"'
+    assert client.get("/workouts/search", params={"q": "strong"}).json()["items"] == []
+
+    # Arrays are replaced wholesale; new sets get ids.
+    resp = client.patch(f"/workouts/{workout['id']}", json={"sets": [{"exercise": "Lunge", "reps": 8}]})
+    assert [item["exercise"] for item in resp.json()["sets"]] == ["Lunge"]
+    assert resp.json()["sets"][0]["id"]
+    assert [item["id"] for item in client.get("/workouts", params={"exercise": "lunge"}).json()] == [workout["id"]]
+
+    invalid = client.patch(f"/workouts/{workout['id']}", json={"title": None, "sets": [{"reps": -1}]})
+    assert invalid.status_code == 422
+    assert client.get(f"/workouts/{workout['id']}").json()["title"] == "Legs"
+
+
+def test_if_match_rejects_stale_edits(client: TestClient):
+    _sign_up(client)
+    workout = _workout(client)
+    etag = client.get(f"/workouts/{workout['id']}").headers["etag"]
+    assert etag == '"1"'
+
+    first = client.patch(f"/workouts/{workout['id']}", json={"title": "Phone"}, headers={"If-Match": etag})
+    assert first.status_code == 200
+    second = client.patch(f"/workouts/{workout['id']}", json={"title": "Laptop"}, headers={"If-Match": etag})
+    assert second.status_code == 412
+    assert second.headers["etag"] == first.headers["etag"]
+    replaced = {"title": "Laptop", "start_time": "2024-01-01T08:00:00", "sets": []}
+    assert client.put(f"/workouts/{workout['id']}", json=replaced, headers={"If-Match": etag}).status_code == 412
+    assert client.get(f"/workouts/{workout['id']}").json()["title"] == "Phone"
+
+    # Set-level edits change the workout too.
+    assert client.post(f"/workouts/{workout['id']}/sets", json={"exercise": "Row", "reps": 10}).status_code == 201
+    stale = client.patch(f"/workouts/{workout['id']}", json={"title": "x"}, headers={"If-Match": etag})
+    assert stale.status_code == 412
+    current = client.get(f"/workouts/{workout['id']}").headers["etag"]
+    resp = client.put(f"/workouts/{workout['id']}", json=replaced, headers={"If-Match": f'"0", {current}'})
+    assert resp.status_code == 200
+    assert client.patch(f"/workouts/{workout['id']}", json={}, headers={"If-Match": "*"}).status_code == 200
+
+
+def test_patch_template_and_concurrent_writer(client: TestClient):
+    _sign_up(client)
+    template = {"name": "Push", "exercises": [{"name": "Bench", "target_sets": 3, "target_reps": 5}]}
+    created = client.post("/templates", json=template).json()
+    resp = client.patch(f"/templates/{created['id']}", json={"notes": "deload week"}, headers={"If-Match": '"1"'})
+    assert resp.status_code == 200
+    assert resp.json()["notes"] == "deload week"
+    assert resp.json()["exercises"] == created["exercises"]
+    stale = client.patch(f"/templates/{created['id']}", json={"name": "x"}, headers={"If-Match": '"1"'})
+    assert stale.status_code == 412
+
+    # Another request commits between this one's read and its write.
+    with adapter.session() as db:
+        record = db.get(WorkoutTemplate, created["id"])
+        with adapter.session() as other:
+            other.get(WorkoutTemplate, created["id"]).encrypted_payload = b"other device"
+        record.encrypted_payload = b"lost update"
+        with pytest.raises(HTTPException) as excinfo:
+            flush_versioned(db)
+        assert excinfo.value.status_code == 412
+        db.rollback()
+    with adapter.session() as db:
+        assert db.get(WorkoutTemplate, created["id"]).version == 3
@@ -1,10 +1,18 @@
 from __future__ import annotations
 
 import base64
+import hashlib
 import json
 from types import SimpleNamespace
 
+import cbor2
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from sqlalchemy import event
+
 from workout_tracker.auth import passkeys
+from workout_tracker.auth.challenge_store import get_challenge_store
+from workout_tracker.config import settings
 from workout_tracker.models import PasskeyCredential, User
 
 
@@ -93,3 +101,71 @@ def test_finish_authentication_normalizes_payload(db_session, monkeypatch):
     assert result_user.id == user.id
     assert captured["credential"].raw_id == b"\x02"
     assert encryption_token == _b64(b"\x02")
+
+
+def _signed_assertion(private_key, credential_id: bytes, challenge: bytes, origin: str, sign_count: int) -> dict:
+    client_data = json.dumps(
+        {"type": "webauthn.get", "challenge": _b64(challenge), "origin": origin, "crossOrigin": False}
+    ).encode()
+    authenticator_data = (
+        hashlib.sha256(settings.auth_rp_id.encode()).digest() + b"\x05" + sign_count.to_bytes(4, "big")
+    )
+    signature = private_key.sign(authenticator_data + hashlib.sha256(client_data).digest(), ec.ECDSA(hashes.SHA256()))
+    return {
+        "id": _b64(credential_id),
+        "rawId": _b64(credential_id),
+        "type": "public-key",
+        "response": {
+            "clientDataJSON": _b64(client_data),
+            "authenticatorData": _b64(authenticator_data),
+            "signature": _b64(signature),
+        },
+    }
+
+
+def _cose_public_key(private_key) -> bytes:
+    numbers = private_key.public_key().public_numbers()
+    return cbor2.dumps({1: 2, 3: -7, -1: 1, -2: numbers.x.to_bytes(32, "big"), -3: numbers.y.to_bytes(32, "big")})
+
+
+def test_finish_authentication_loads_credential_once_and_verifies_once(db_session, monkeypatch):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    user = User(encryption_salt=b"salt", encrypted_data_key=b"key")
+    credential = PasskeyCredential(
+        user=user, credential_id=b"\x03" * 16, public_key=_cose_public_key(private_key), sign_count=0
+    )
+    db_session.add_all([user, credential])
+    db_session.commit()
+    db_session.expunge_all()
+
+    challenge = b"c" * 32
+    get_challenge_store().persist(db_session, passkeys._encode(challenge), "authenticate")
+    # Any allowed origin but the first used to cost failed signature checks before the match.
+    origin = passkeys._allowed_origins()[-1]
+    payload = _signed_assertion(private_key, credential.credential_id, challenge, origin, sign_count=1)
+
+    verify_calls = []
+    real_verify = passkeys.verify_authentication_response
+
+    def counting_verify(**kwargs):
+        verify_calls.append(kwargs["expected_origin"])
+        return real_verify(**kwargs)
+
+    monkeypatch.setattr(passkeys, "verify_authentication_response", counting_verify)
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        result_user, _ = passkeys.finish_authentication(db_session, payload)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert result_user.id == user.id
+    assert verify_calls == [origin]
+    lookups = [s for s in statements if s.lstrip().upper().startswith("SELECT") and "passkey_credentials" in s]
+    assert len(lookups) == 1 and "JOIN users" in lookups[0]
+    assert not [s for s in statements if s.lstrip().upper().startswith("SELECT") and "FROM users" in s]
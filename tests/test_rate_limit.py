@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from workout_tracker import rate_limit
+from workout_tracker.config import settings
+from workout_tracker.encryption import kdf_gate
+from workout_tracker.rate_limit import BucketPolicy, MemoryRateLimitBackend, RateLimitBackend, SqlRateLimitBackend
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(settings, "rate_limits", {})
+    rate_limit._build_backend.cache_clear()
+    yield settings.rate_limits
+    rate_limit._build_backend.cache_clear()
+
+
+def _create_user(client: TestClient, email: str | None = None):
+    return client.post("/users", json={"display_name": "Rate", "email": email, "encryption_token": "token123"})
+
+
+def test_policy_parsing():
+    assert BucketPolicy.parse("10/minute") == BucketPolicy(capacity=10, refill_per_second=10 / 60)
+    assert BucketPolicy.parse("3/hours") == BucketPolicy(capacity=3, refill_per_second=3 / 3600)
+    assert BucketPolicy.parse("0") is None
+    assert BucketPolicy.parse("") is None
+    with pytest.raises(ValueError):
+        BucketPolicy.parse("5/fortnight")
+
+
+@pytest.mark.parametrize("backend_cls", [MemoryRateLimitBackend, SqlRateLimitBackend])
+def test_bucket_allows_burst_then_reports_wait(backend_cls, clean_database):
+    backend = backend_cls()
+    policy = BucketPolicy.parse("2/minute")
+    assert backend.take("k", policy) == 0
+    assert backend.take("k", policy) == 0
+    wait = backend.take("k", policy)
+    assert 29 < wait <= 30
+    assert backend.take("other", policy) == 0
+
+
+def test_sql_backend_never_spends_a_token_twice(clean_database):
+    backend = SqlRateLimitBackend()
+    policy = BucketPolicy.parse("5/day")
+    backend.take("shared", policy, cost=0)
+    with ThreadPoolExecutor(8) as pool:
+        waits = list(pool.map(lambda _: backend.take("shared", policy), range(20)))
+    assert waits.count(0) == 5
+
+
+def test_memory_backend_purges_refilled_buckets():
+    backend = MemoryRateLimitBackend()
+    backend.take("slow", BucketPolicy.parse("1/day"))
+    backend.take("fast", BucketPolicy(capacity=1, refill_per_second=1e9))
+    assert backend.purge_idle() == 1
+
+
+def test_backend_without_take_fails_at_construction():
+    class Unlimited(RateLimitBackend):
+        pass
+
+    with pytest.raises(TypeError, match="take"):
+        Unlimited()
+
+
+def test_route_returns_429_with_retry_after(client: TestClient, limits):
+    limits["users.create.ip"] = "2/hour"
+    assert _create_user(client, "a@example.com").status_code == 201
+    assert _create_user(client, "b@example.com").status_code == 201
+    resp = _create_user(client, "c@example.com")
+    assert resp.status_code == 429
+    assert 1700 <= int(resp.headers["Retry-After"]) <= 1800
+
+
+def test_per_user_policy_applies_to_signed_in_caller(client: TestClient, limits):
+    limits["encryption.rotate.ip"] = "0"
+    limits["encryption.rotate.user"] = "1/hour"
+    assert _create_user(client).status_code == 201
+    first = client.post("/users/encryption/rotate", json={"encryption_token": "token456"})
+    assert first.status_code == 200
+    second = client.post("/users/encryption/rotate", json={"encryption_token": "token789"})
+    assert second.status_code == 429
+    assert "Retry-After" in second.headers
+
+
+def test_disabled_limits_are_not_enforced(client: TestClient, limits, monkeypatch):
+    limits["users.create.ip"] = "1/hour"
+    monkeypatch.setattr(settings, "rate_limit_enabled", False)
+    assert _create_user(client, "a@example.com").status_code == 201
+    assert _create_user(client, "b@example.com").status_code == 201
+
+
+def test_kdf_concurrency_cap_sheds_load(client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "kdf_max_concurrency", 1)
+    monkeypatch.setattr(settings, "kdf_queue_timeout_seconds", 0.05)
+    holding, release = threading.Event(), threading.Event()
+
+    def hold_slot():
+        with kdf_gate.slot():
+            holding.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold_slot)
+    holder.start()
+    try:
+        holding.wait(5)
+        resp = _create_user(client)
+    finally:
+        release.set()
+        holder.join()
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    assert _create_user(client).status_code == 201
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from workout_tracker.config import settings
+from workout_tracker.maintenance import optimize_database, prune_abandoned_users
+from workout_tracker.models import PasskeyCredential, User
+from workout_tracker.scheduler import Cron, Interval, Scheduler
+
+
+def _at(*args: int) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_cron_next_run():
+    assert Cron("*/15 * * * *").next_run(_at(2024, 1, 1, 10, 7)) == _at(2024, 1, 1, 10, 15)
+    assert Cron("17 4 * * *").next_run(_at(2024, 1, 1, 4, 17)) == _at(2024, 1, 2, 4, 17)
+    assert Cron("0 0 1 * *").next_run(_at(2024, 12, 15, 0, 0)) == _at(2025, 1, 1, 0, 0)
+    # 2024-01-06 is a Saturday; the next Monday is the 8th.
+    assert Cron("30 9 * * 1-5").next_run(_at(2024, 1, 6, 12, 0)) == _at(2024, 1, 8, 9, 30)
+    assert Cron("0 12 * * 7").next_run(_at(2024, 1, 1, 0, 0)) == _at(2024, 1, 7, 12, 0)
+
+
+def test_cron_rejects_malformed_expressions():
+    for expression in ("* * * *", "61 * * * *", "*/0 * * * *", "5-1 * * * *"):
+        with pytest.raises(ValueError):
+            Cron(expression)
+
+
+def test_run_job_records_outcomes():
+    scheduler = Scheduler()
+
+    def broken():
+        raise RuntimeError("boom")
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    ok = scheduler.every(60, "ok", lambda: None, leader_only=False)
+    failed = scheduler.every(60, "failed", broken, leader_only=False)
+    timed_out = scheduler.every(60, "slow", slow, timeout=0.01, leader_only=False)
+
+    async def run_all():
+        for job in (ok, failed, timed_out):
+            await scheduler.run_job(job)
+
+    asyncio.run(run_all())
+    stats = scheduler.stats()
+    assert stats["ok"]["last_status"] == "ok" and stats["ok"]["runs"] == 1
+    assert stats["failed"]["failures"] == 1 and stats["failed"]["last_error"] == "RuntimeError: boom"
+    assert stats["slow"]["last_status"] == "timeout" and stats["slow"]["timeouts"] == 1
+    assert stats["slow"]["last_duration_seconds"] < 1
+
+
+def test_only_one_worker_runs_leader_jobs():
+    calls: list[str] = []
+    leader, follower = Scheduler(owner="worker-a"), Scheduler(owner="worker-b")
+    job_a = leader.every(60, "sweep", lambda: calls.append("a"))
+    job_b = follower.every(60, "sweep", lambda: calls.append("b"))
+
+    async def run():
+        assert await leader.run_job(job_a) == "ok"
+        assert await follower.run_job(job_b) == "skipped"
+        # The lease is held until the leader's next occurrence, so it keeps running the job.
+        assert await leader.run_job(job_a) == "ok"
+
+    asyncio.run(run())
+    assert calls == ["a", "a"]
+    assert follower.stats()["sweep"]["skipped"] == 1
+
+
+def test_expired_lease_passes_to_another_worker():
+    calls: list[str] = []
+    leader, follower = Scheduler(owner="worker-a"), Scheduler(owner="worker-b")
+    job_a = leader.add_job("tick", lambda: calls.append("a"), Interval(1.5))
+    job_b = follower.add_job("tick", lambda: calls.append("b"), Interval(1.5))
+
+    asyncio.run(leader.run_job(job_a))
+    time.sleep(0.6)
+    asyncio.run(follower.run_job(job_b))
+    assert calls == ["a", "b"]
+
+
+def test_scheduler_loop_runs_interval_jobs():
+    calls: list[int] = []
+    scheduler = Scheduler()
+    scheduler.every(0.05, "tick", lambda: calls.append(1), leader_only=False)
+
+    async def run():
+        scheduler.start()
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert len(calls) >= 2
+    assert scheduler.stats()["tick"]["next_run_at"] is not None
+
+
+def test_prune_abandoned_users(db_session):
+    old = datetime.now(timezone.utc) - timedelta(days=2)
+    abandoned = User(encryption_salt=b"", encrypted_data_key=b"", created_at=old)
+    pending = User(encryption_salt=b"", encrypted_data_key=b"")
+    registered = User(encryption_salt=b"salt", encrypted_data_key=b"key", created_at=old)
+    with_credential = User(encryption_salt=b"", encrypted_data_key=b"", created_at=old)
+    db_session.add_all([abandoned, pending, registered, with_credential])
+    db_session.flush()
+    db_session.add(PasskeyCredential(user_id=with_credential.id, credential_id=b"cred", public_key=b"pk"))
+    db_session.commit()
+
+    assert prune_abandoned_users() == 1
+    db_session.expire_all()
+    remaining = {user.id for user in db_session.query(User)}
+    assert remaining == {pending.id, registered.id, with_credential.id}
+
+
+def test_optimize_database_runs(clean_database):
+    optimize_database()
+
+
+def test_metrics_lists_scheduled_jobs(client):
+    jobs = client.get("/metrics").json()["jobs"]
+    assert {"expire-challenges", "prune-abandoned-users", "optimize-database", "refresh-caches"} <= set(jobs)
+    assert jobs["optimize-database"]["schedule"] == "cron '17 4 * * *'"
+    assert jobs["refresh-caches"]["runs"] == 0
+
+
+def test_metrics_require_a_token_outside_dev(client, monkeypatch):
+    monkeypatch.setattr(settings, "environment", "prod")
+    assert client.get("/metrics").status_code == 404
+    monkeypatch.setattr(settings, "metrics_token", "scrape-me")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-me"}).status_code == 200
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from workout_tracker.database import adapter
+from workout_tracker.encryption import EncryptionService
+from workout_tracker.maintenance import optimize_database
+
+
+def _sign_up(client: TestClient, email: str = "search@example.com") -> None:
+    resp = client.post("/users", json={"display_name": "Search", "email": email, "encryption_token": "s3arch"})
+    assert resp.status_code == 201
+
+
+def _workout(client: TestClient, title: str, notes: str | None) -> str:
+    payload = {"title": title, "start_time": "2024-01-01T08:00:00", "notes": notes, "sets": []}
+    resp = client.post("/workouts", json=payload)
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def _search(client: TestClient, q: str, **params) -> dict:
+    resp = client.get("/workouts/search", params={"q": q, **params})
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def _titles(page: dict) -> list[str]:
+    return [item["title"] for item in page["items"]]
+
+
+def test_search_ranks_and_stays_in_sync(client: TestClient):
+    _sign_up(client)
+    _workout(client, "once", "Heavy bench day, shoulders tired")
+    _workout(client, "twice", "Bench bench bench, paused reps")
+    _workout(client, "other", "Squats only")
+    edited = _workout(client, "edited", "Rest day")
+
+    assert _titles(_search(client, "bench")) == ["twice", "once"]
+    assert _titles(_search(client, "BENCH shoulders")) == ["once"]
+    assert _search(client, "deadlift")["items"] == []
+    # FTS operators and quotes in user input are treated as plain words.
+    assert _titles(_search(client, 'squats" OR (')) == []
+    assert _titles(_search(client, "squats ~*")) == ["other"]
+
+    update = {"title": "edited", "start_time": "2024-01-01T08:00:00", "notes": "Bench singles", "sets": []}
+    assert client.put(f"/workouts/{edited}", json=update).status_code == 200
+    assert _titles(_search(client, "singles")) == ["edited"]
+    assert _search(client, "rest")["items"] == []
+    assert client.delete(f"/workouts/{edited}").status_code == 204
+    assert _search(client, "singles")["items"] == []
+
+
+def test_search_is_scoped_to_the_caller(client: TestClient):
+    _sign_up(client, "a@example.com")
+    _workout(client, "mine", "tempo squats")
+    client.cookies.clear()
+    _sign_up(client, "b@example.com")
+    assert _search(client, "tempo")["items"] == []
+
+
+def test_search_paginates_and_decrypts_only_the_page(client: TestClient, monkeypatch):
+    _sign_up(client)
+    for index in range(5):
+        _workout(client, f"w{index}", f"interval run number {index}")
+    _workout(client, "unrelated", "mobility")
+
+    decrypted = []
+    real_decrypt = EncryptionService.decrypt_payload
+
+    def counting(self, data_key, blob):
+        decrypted.append(blob)
+        return real_decrypt(self, data_key, blob)
+
+    monkeypatch.setattr(EncryptionService, "decrypt_payload", counting)
+    seen = []
+    offset = 0
+    while offset is not None:
+        page = _search(client, "interval", limit=2, offset=offset)
+        assert len(page["items"]) <= 2
+        seen += _titles(page)
+        offset = page["next_offset"]
+    assert sorted(seen) == [f"w{index}" for index in range(5)]
+    assert len(decrypted) == 5
+
+
+def test_index_is_backfilled_for_existing_databases_and_survives_vacuum(client: TestClient):
+    _sign_up(client)
+    _workout(client, "old", "hill sprints")
+    with adapter.engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE workouts_fts")
+        conn.exec_driver_sql("DROP TABLE workouts_fts_keys")
+        for suffix in ("insert", "delete", "update"):
+            conn.exec_driver_sql(f"DROP TRIGGER workouts_fts_{suffix}")
+    adapter.create_schema()
+    assert _titles(_search(client, "sprints")) == ["old"]
+
+    fillers = [_workout(client, f"filler{index}", "filler") for index in range(20)]
+    _workout(client, "late", "hill repeats")
+    # Deleting rows leaves gaps in workouts' implicit rowids for VACUUM to close up.
+    for workout_id in fillers[::2]:
+        assert client.delete(f"/workouts/{workout_id}").status_code == 204
+    optimize_database()
+    assert sorted(_titles(_search(client, "hill"))) == ["late", "old"]
+    assert len(_search(client, "filler", limit=50)["items"]) == 10
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+from workout_tracker.auth.session_store import MemorySessionStore, SessionStore, key_handles
+from workout_tracker.config import settings
+from workout_tracker.database import adapter
+from workout_tracker.encryption import EncryptionService
+from workout_tracker.models import AuthSession
+
+TOKEN = "session-secret-token"
+
+
+@pytest.fixture(params=["sql", "memory", "file"])
+def backend(request, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "session_backend", request.param)
+    monkeypatch.setattr(settings, "session_file_dir", str(tmp_path / "sessions"))
+    return request.param
+
+
+def _sign_up(client: TestClient) -> str:
+    resp = client.post(
+        "/users", json={"display_name": "Sess", "email": "sess@example.com", "encryption_token": TOKEN}
+    )
+    assert resp.status_code == 201, resp.text
+    return resp.cookies["session"]
+
+
+def test_cookie_is_opaque_and_store_holds_no_plaintext(client: TestClient, backend):
+    session_id = _sign_up(client)
+    assert TOKEN not in session_id
+    assert len(session_id) >= 40
+    if backend == "sql":
+        with adapter.session() as db:
+            rows = db.query(AuthSession).all()
+        assert len(rows) == 1
+        assert rows[0].id != session_id
+        assert TOKEN.encode() not in (rows[0].sealed_token or b"")
+
+
+def test_logout_revokes_immediately(client: TestClient, backend):
+    session_id = _sign_up(client)
+    assert client.get("/users/me").status_code == 200
+    assert client.post("/auth/logout").status_code == 204
+    client.cookies.set("session", session_id)
+    assert client.get("/users/me").status_code == 401
+
+
+def test_warm_session_skips_kdf(client: TestClient, backend, monkeypatch):
+    _sign_up(client)
+    derivations = []
+    original = EncryptionService._derive_wrapping_key
+
+    def counting(self, token, salt, params):
+        derivations.append(token)
+        return original(self, token, salt, params)
+
+    monkeypatch.setattr(EncryptionService, "_derive_wrapping_key", counting)
+    assert client.get("/workouts").status_code == 200
+    assert client.get("/templates").status_code == 200
+    assert client.get("/workouts/trends").status_code == 200
+    assert len(derivations) == 1
+
+
+def test_cold_session_unwraps_again_after_idle_expiry(client: TestClient, backend, monkeypatch):
+    _sign_up(client)
+    assert client.get("/workouts").status_code == 200
+    key_handles.purge_idle()
+    monkeypatch.setattr(settings, "session_key_idle_seconds", 0)
+    derivations = []
+    original = EncryptionService._derive_wrapping_key
+    monkeypatch.setattr(
+        EncryptionService,
+        "_derive_wrapping_key",
+        lambda self, token, salt, params: derivations.append(token) or original(self, token, salt, params),
+    )
+    assert client.get("/workouts").status_code == 200
+    assert derivations == [TOKEN]
+
+
+def test_account_deletion_revokes_sessions(client: TestClient, backend):
+    session_id = _sign_up(client)
+    assert client.delete("/users/me").status_code == 204
+    client.cookies.set("session", session_id)
+    assert client.get("/auth/session").json() is None
+
+
+def test_incomplete_session_store_fails_at_construction():
+    class NoPurge(SessionStore):
+        create = get = revoke = revoke_user = MemorySessionStore.create
+
+    with pytest.raises(TypeError, match="purge_expired"):
+        NoPurge()
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from workout_tracker.config import settings
+from workout_tracker.database import adapter
+from workout_tracker.encryption import EncryptionService
+from workout_tracker.models import Workout, WorkoutSetLog
+
+
+def _sign_up(client: TestClient) -> None:
+    resp = client.post("/users", json={"display_name": "Sets", "email": "sets@example.com", "encryption_token": "s3ts"})
+    assert resp.status_code == 201
+
+
+def _workout(client: TestClient, sets: list[dict] | None = None) -> dict:
+    payload = {"title": "Session", "start_time": "2024-01-01T08:00:00", "sets": sets or []}
+    resp = client.post("/workouts", json=payload)
+    assert resp.status_code == 201
+    return resp.json()
+
+
+def _sets(client: TestClient, workout_id: str) -> list[dict]:
+    resp = client.get(f"/workouts/{workout_id}")
+    assert resp.status_code == 200
+    return resp.json()["sets"]
+
+
+def _log_length(workout_id: str) -> int:
+    with adapter.session() as db:
+        stored = db.get(Workout, workout_id).set_log_length
+        rows = db.scalar(
+            select(func.count()).select_from(WorkoutSetLog).where(WorkoutSetLog.workout_id == workout_id)
+        )
+    assert stored == rows
+    return rows
+
+
+def test_set_edits_are_logged_and_replayed_on_read(client: TestClient):
+    _sign_up(client)
+    workout = _workout(client, [{"exercise": "Squat", "reps": 5}])
+    (first,) = workout["sets"]
+    assert first["id"]
+
+    added = client.post(f"/workouts/{workout['id']}/sets", json={"exercise": "Bench", "reps": 8})
+    assert added.status_code == 201
+    bench = added.json()
+    resp = client.put(f"/workouts/{workout['id']}/sets/{first['id']}", json={"exercise": "Squat", "reps": 3})
+    assert resp.status_code == 200 and resp.json()["id"] == first["id"]
+    assert client.post(f"/workouts/{workout['id']}/sets", json={"exercise": "Row", "reps": 10}).status_code == 201
+    assert client.delete(f"/workouts/{workout['id']}/sets/{bench['id']}").status_code == 204
+
+    assert [(item["exercise"], item["reps"]) for item in _sets(client, workout["id"])] == [("Squat", 3), ("Row", 10)]
+    assert _log_length(workout["id"]) == 4
+    listed = client.get("/workouts").json()
+    assert [item["exercise"] for item in listed[0]["sets"]] == ["Squat", "Row"]
+
+    missing = client.delete(f"/workouts/{workout['id']}/sets/{bench['id']}")
+    assert missing.status_code == 404 and missing.json()["detail"] == "Set not found"
+
+
+def test_append_encrypts_only_the_new_set(client: TestClient, monkeypatch):
+    _sign_up(client)
+    workout = _workout(client, [{"exercise": "Deadlift", "reps": 5, "notes": "x" * 500} for _ in range(20)])
+    with adapter.session() as db:
+        header = db.get(Workout, workout["id"]).encrypted_payload
+
+    encrypted, decrypted = [], []
+    real_encrypt, real_decrypt = EncryptionService.encrypt_payload, EncryptionService.decrypt_payload
+
+    def counting_encrypt(self, data_key, payload):
+        encrypted.append(payload)
+        return real_encrypt(self, data_key, payload)
+
+    def counting_decrypt(self, data_key, blob):
+        decrypted.append(blob)
+        return real_decrypt(self, data_key, blob)
+
+    monkeypatch.setattr(EncryptionService, "encrypt_payload", counting_encrypt)
+    monkeypatch.setattr(EncryptionService, "decrypt_payload", counting_decrypt)
+    assert client.post(f"/workouts/{workout['id']}/sets", json={"exercise": "Curl", "reps": 12}).status_code == 201
+    assert [op["op"] for op in encrypted] == ["append"]
+    assert decrypted == []
+    with adapter.session() as db:
+        assert db.get(Workout, workout["id"]).encrypted_payload == header
+
+
+def test_log_is_compacted_at_the_threshold_and_by_put(client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "workout_set_log_max_entries", 3)
+    _sign_up(client)
+    workout = _workout(client)
+    for reps in range(1, 5):
+        resp = client.post(f"/workouts/{workout['id']}/sets", json={"exercise": "Press", "reps": reps})
+        assert resp.status_code == 201
+        if reps == 3:
+            assert _log_length(workout["id"]) == 0
+    assert _log_length(workout["id"]) == 1
+    assert [item["reps"] for item in _sets(client, workout["id"])] == [1, 2, 3, 4]
+
+    sets = _sets(client, workout["id"])[:2]
+    update = {"title": "Session", "start_time": "2024-01-01T08:00:00", "sets": sets}
+    resp = client.put(f"/workouts/{workout['id']}", json=update)
+    assert resp.status_code == 200
+    assert [item["id"] for item in resp.json()["sets"]] == [item["id"] for item in sets]
+    assert _log_length(workout["id"]) == 0
+
+
+def test_logged_sets_are_filterable_and_rotated(client: TestClient):
+    _sign_up(client)
+    workout = _workout(client, [{"exercise": "Squat", "reps": 5}])
+    assert client.post(f"/workouts/{workout['id']}/sets", json={"exercise": "Lunge", "reps": 8}).status_code == 201
+    assert [item["id"] for item in client.get("/workouts", params={"exercise": "lunge"}).json()] == [workout["id"]]
+
+    assert client.post("/users/encryption/rotate-key").status_code == 202
+    with adapter.session() as db:
+        generations = set(db.scalars(select(WorkoutSetLog.key_generation)))
+    assert generations == {2}
+    assert [item["exercise"] for item in _sets(client, workout["id"])] == ["Squat", "Lunge"]
+    assert [item["id"] for item in client.get("/workouts", params={"exercise": "lunge"}).json()] == [workout["id"]]
+
+
+def test_concurrent_appends_never_acknowledge_a_lost_set(client: TestClient):
+    _sign_up(client)
+    workout_id = _workout(client)["id"]
+
+    def append(reps: int) -> int:
+        return client.post(f"/workouts/{workout_id}/sets", json={"exercise": "Squat", "reps": reps}).status_code
+
+    with ThreadPoolExecutor(8) as pool:
+        statuses = list(pool.map(append, range(1, 9)))
+    assert set(statuses) <= {201, 412} and 201 in statuses
+    assert sorted(item["reps"] for item in _sets(client, workout_id)) == sorted(
+        reps for reps, status in zip(range(1, 9), statuses) if status == 201
+    )
+
+
+def test_set_endpoints_honour_if_match(client: TestClient):
+    _sign_up(client)
+    workout = _workout(client)
+    path = f"/workouts/{workout['id']}/sets"
+    stale = f'"{workout["version"]}"'
+    appended = client.post(path, json={"exercise": "Row", "reps": 8}, headers={"If-Match": stale})
+    assert appended.status_code == 201 and appended.headers["ETag"] != stale
+    set_id = appended.json()["id"]
+    refused = client.put(f"{path}/{set_id}", json={"exercise": "Row", "reps": 9}, headers={"If-Match": stale})
+    assert refused.status_code == 412
+    removed = client.delete(f"{path}/{set_id}", headers={"If-Match": appended.headers["ETag"]})
+    assert removed.status_code == 204
+    assert _sets(client, workout["id"]) == []
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from workout_tracker.routers import workouts as workouts_router
+from workout_tracker.cache import Namespace, invalidate_user
+from workout_tracker.single_flight import SingleFlight, single_flight
+
+WORKOUT = {"title": "Push", "start_time": "2024-01-01T08:00:00", "sets": [{"exercise": "Bench", "reps": 5}]}
+
+
+def _sign_up(client: TestClient) -> None:
+    user = {"display_name": "Flight", "email": "flight@example.com", "encryption_token": "fl1ght"}
+    resp = client.post("/users", json=user)
+    assert resp.status_code == 201
+
+
+def _wait_for(predicate) -> None:
+    deadline = time.monotonic() + 5
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        assert release.wait(5)
+        return b"result"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(flights.do, "user", "trends", compute) for _ in range(3)]
+        other = pool.submit(flights.do, "other", "trends", lambda: b"other")
+        _wait_for(lambda: flights.stats()["coalesced"] == 2)
+        release.set()
+        results = [future.result() for future in futures]
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert other.result() == b"other"
+    assert flights.stats() == {"computed": 2, "coalesced": 2, "cache_hits": 0, "in_flight": 0}
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flights = SingleFlight()
+    results = Namespace("tests.flights", lambda: 60, sensitive=True)
+    entered, release = threading.Event(), threading.Event()
+
+    def failing():
+        entered.set()
+        assert release.wait(5)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(flights.do, "user", "key", failing, results)
+        assert entered.wait(5)
+        second = pool.submit(flights.do, "user", "key", lambda: b"unused", results)
+        _wait_for(lambda: flights.stats()["coalesced"] == 1)
+        release.set()
+        for future in (first, second):
+            with pytest.raises(ValueError):
+                future.result()
+    assert flights.do("user", "key", lambda: b"recovered", results) == b"recovered"
+    assert flights.do("user", "key", lambda: b"cached?", results) == b"recovered"
+    invalidate_user("user")
+    assert flights.do("user", "key", lambda: b"fresh", results) == b"fresh"
+
+
+def test_duplicate_trend_requests_decrypt_once(client: TestClient, monkeypatch):
+    _sign_up(client)
+    assert client.post("/workouts", json=WORKOUT).status_code == 201
+    entered, release = threading.Event(), threading.Event()
+    computed = []
+    real_compute = workouts_router._compute_trends
+
+    def slow_compute(*args):
+        computed.append(1)
+        entered.set()
+        assert release.wait(5)
+        return real_compute(*args)
+
+    monkeypatch.setattr(workouts_router, "_compute_trends", slow_compute)
+    before = single_flight.stats()["coalesced"]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(client.get, "/workouts/trends")
+        assert entered.wait(5)
+        second = pool.submit(client.get, "/workouts/trends")
+        _wait_for(lambda: single_flight.stats()["coalesced"] == before + 1)
+        release.set()
+        assert first.result().json() == second.result().json()
+    assert len(computed) == 1
+    assert client.get("/metrics").json()["reads"]["in_flight"] == 0
+
+
+def test_cached_lists_are_dropped_when_the_user_writes(client: TestClient, monkeypatch):
+    monkeypatch.setattr("workout_tracker.cache.settings.read_cache_ttl_seconds", 60)
+    _sign_up(client)
+    workout_id = client.post("/workouts", json=WORKOUT).json()["id"]
+    computed = []
+    real_list = workouts_router._list_workouts
+
+    def counting(*args):
+        computed.append(args[2:4])
+        return real_list(*args)
+
+    monkeypatch.setattr(workouts_router, "_list_workouts", counting)
+    assert len(client.get("/workouts").json()) == 1
+    assert len(client.get("/workouts").json()) == 1
+    assert client.get("/workouts?exercise=bench").status_code == 200
+    assert computed == [(None, None), ("bench", None)]
+
+    assert client.post(f"/workouts/{workout_id}/sets", json={"exercise": "Dip", "reps": 8}).status_code == 201
+    (listed,) = client.get("/workouts").json()
+    assert [item["exercise"] for item in listed["sets"]] == ["Bench", "Dip"]
+    assert client.delete(f"/workouts/{workout_id}/sets/missing").status_code == 404
+    client.get("/workouts")
+    assert len(computed) == 3
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from workout_tracker import spa
+from workout_tracker.spa import (
+    DEFAULT_CACHE_CONTROL,
+    IMMUTABLE_CACHE_CONTROL,
+    INDEX_CACHE_CONTROL,
+    SPAStaticFiles,
+)
+
+BUNDLE = ("console.log('workout tracker');\n" * 200).encode()
+INDEX = b"<!doctype html><html><body><div id='root'></div></body></html>"
+
+
+@pytest.fixture
+def dist(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_bytes(INDEX)
+    (tmp_path / "assets" / "index-4f9a2c1b.js").write_bytes(BUNDLE)
+    (tmp_path / "favicon.svg").write_bytes(b"<svg/>")
+    return tmp_path
+
+
+@pytest.fixture
+def spa_client(dist):
+    app = FastAPI()
+    app.mount("/", SPAStaticFiles(directory=dist, html=True), name="spa")
+    return TestClient(app)
+
+
+def test_hashed_assets_are_immutable_and_gzipped(spa_client):
+    resp = spa_client.get("/assets/index-4f9a2c1b.js", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert resp.content == BUNDLE  # httpx transparently decodes gzip
+    assert int(resp.headers["content-length"]) < len(BUNDLE)
+
+
+def test_identity_when_client_does_not_accept_compression(spa_client):
+    resp = spa_client.get("/assets/index-4f9a2c1b.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in resp.headers
+    assert int(resp.headers["content-length"]) == len(BUNDLE)
+
+
+def test_precompressed_sibling_is_served(dist):
+    marker = gzip.compress(b"from-build-step")
+    (dist / "assets" / "index-4f9a2c1b.js.gz").write_bytes(marker)
+    app = FastAPI()
+    app.mount("/", SPAStaticFiles(directory=dist, html=True), name="spa")
+    resp = TestClient(app).get("/assets/index-4f9a2c1b.js", headers={"Accept-Encoding": "gzip"})
+    assert resp.content == b"from-build-step"
+    assert "javascript" in resp.headers["content-type"]
+
+
+def test_only_bundle_output_is_treated_as_hashed(dist):
+    (dist / "brand-wordmark.svg").write_bytes(b"<svg/>")
+    (dist / "docs").mkdir()
+    (dist / "docs" / "release-20240101.txt").write_bytes(b"notes")
+    app = FastAPI()
+    app.mount("/", SPAStaticFiles(directory=dist, html=True), name="spa")
+    client = TestClient(app)
+    assert client.get("/brand-wordmark.svg").headers["cache-control"] == DEFAULT_CACHE_CONTROL
+    assert client.get("/docs/release-20240101.txt").headers["cache-control"] == DEFAULT_CACHE_CONTROL
+    assert client.get("/assets/index-4f9a2c1b.js").headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_unknown_routes_fall_back_to_index_with_short_cache(spa_client):
+    resp = spa_client.get("/workouts/history/123")
+    assert resp.status_code == 200
+    assert resp.content == INDEX
+    assert resp.headers["cache-control"] == INDEX_CACHE_CONTROL
+
+
+def test_first_request_compresses_off_the_event_loop(spa_client, monkeypatch):
+    calls = []
+
+    def recording_compress(data: bytes, encoding: str) -> bytes:
+        try:
+            asyncio.get_running_loop()
+            calls.append("loop")
+        except RuntimeError:
+            calls.append("thread")
+        return gzip.compress(data)
+
+    monkeypatch.setattr(spa, "compress", recording_compress)
+    for _ in range(2):
+        resp = spa_client.get("/assets/index-4f9a2c1b.js", headers={"Accept-Encoding": "gzip"})
+        assert resp.content == BUNDLE
+    assert calls == ["thread"]
+
+
+def test_etag_revalidation_returns_not_modified(spa_client):
+    first = spa_client.get("/assets/index-4f9a2c1b.js", headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["etag"]
+    again = spa_client.get(
+        "/assets/index-4f9a2c1b.js", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert again.status_code == 304
+
+
+def test_small_files_skip_compression(spa_client):
+    resp = spa_client.get("/favicon.svg", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+# Generous ceiling for the cumulative import time of the app module; the real guard is that
+# the optional auth stacks below never load at import time.
+IMPORT_BUDGET_US = int(os.environ.get("WORKOUT_TRACKER_IMPORT_BUDGET_US", 4_000_000))
+LAZY_MODULES = {"webauthn", "jwt", "httpx", "uvicorn"}
+
+
+def _importtime(code: str) -> dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "DATABASE_URL": "sqlite:///./does-not-exist/never-opened.sqlite3"},
+    )
+    cumulative: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = (part.strip() for part in line.split("|"))
+        if cum.isdigit():
+            cumulative[name] = int(cum)
+    return cumulative
+
+
+def test_app_import_skips_optional_stacks_and_fits_budget():
+    imported = _importtime("import workout_tracker.app")
+    assert LAZY_MODULES.isdisjoint(imported), sorted(LAZY_MODULES & imported.keys())
+    assert imported["workout_tracker.app"] < IMPORT_BUDGET_US
+
+
+def test_app_import_does_not_open_database():
+    code = (
+        "import workout_tracker.app as m, workout_tracker.database as d; "
+        "assert d.adapter._engine is None, 'engine built at import time'"
+    )
+    _importtime(code)
+
+
+def test_cli_help_does_not_import_fastapi():
+    code = (
+        "from workout_tracker.cli import main\n"
+        "try:\n"
+        "    main(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+    )
+    imported = _importtime(code)
+    assert "fastapi" not in imported
+    assert "uvicorn" not in imported
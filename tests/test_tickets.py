@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+from workout_tracker.auth import tickets
+from workout_tracker.auth.session_store import key_handles
+from workout_tracker.config import settings
+from workout_tracker.encryption import EncryptionService
+
+DATA_KEY = b"0" * 44
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture(autouse=True)
+def ticket_settings(monkeypatch):
+    monkeypatch.setattr(settings, "data_key_tickets_enabled", True)
+    monkeypatch.setattr(settings, "data_key_ticket_secret", "ticket-secret-" + "x" * 32)
+    monkeypatch.setattr(settings, "data_key_ticket_previous_secret", None)
+    monkeypatch.setattr(settings, "data_key_ticket_ttl_seconds", 300)
+    monkeypatch.setattr(settings, "data_key_ticket_rotation_seconds", 3600)
+
+
+def test_ticket_round_trip_is_bound_to_user_and_version():
+    ticket = tickets.seal_ticket(DATA_KEY, "user-1", 1, now=NOW)
+    assert tickets.open_ticket(ticket, "user-1", 1, now=NOW) == DATA_KEY
+    assert tickets.open_ticket(ticket, "user-2", 1, now=NOW) is None
+    assert tickets.open_ticket(ticket, "user-1", 2, now=NOW) is None
+    assert tickets.open_ticket(ticket[:-4] + "AAAA", "user-1", 1, now=NOW) is None
+    assert tickets.open_ticket("not-a-ticket", "user-1", 1, now=NOW) is None
+
+
+def test_expired_ticket_rejected():
+    ticket = tickets.seal_ticket(DATA_KEY, "user-1", 1, now=NOW)
+    assert tickets.open_ticket(ticket, "user-1", 1, now=NOW + 301) is None
+
+
+def test_previous_epoch_accepted_during_overlap_only(monkeypatch):
+    monkeypatch.setattr(settings, "data_key_ticket_ttl_seconds", 3 * 3600)
+    ticket = tickets.seal_ticket(DATA_KEY, "user-1", 1, now=NOW)
+    assert tickets.open_ticket(ticket, "user-1", 1, now=NOW + 3600) == DATA_KEY
+    assert tickets.open_ticket(ticket, "user-1", 1, now=NOW + 2 * 3600 + 1) is None
+
+
+def test_previous_secret_still_opens_tickets(monkeypatch):
+    ticket = tickets.seal_ticket(DATA_KEY, "user-1", 1, now=NOW)
+    monkeypatch.setattr(settings, "data_key_ticket_previous_secret", settings.data_key_ticket_secret)
+    monkeypatch.setattr(settings, "data_key_ticket_secret", "rotated-secret-" + "y" * 32)
+    assert tickets.open_ticket(ticket, "user-1", 1, now=NOW) == DATA_KEY
+
+
+def test_other_replica_uses_ticket_instead_of_kdf(client: TestClient, monkeypatch):
+    resp = client.post(
+        "/users", json={"display_name": "Ticket", "email": "ticket@example.com", "encryption_token": "tok"}
+    )
+    assert resp.status_code == 201
+    first = client.get("/workouts")
+    assert first.status_code == 200
+    assert tickets.TICKET_HEADER in first.headers
+    assert client.cookies.get(tickets.TICKET_COOKIE)
+
+    # A different replica has no key handle for this session.
+    key_handles.drop_user(resp.json()["id"])
+    derivations = []
+    original = EncryptionService._derive_wrapping_key
+    monkeypatch.setattr(
+        EncryptionService,
+        "_derive_wrapping_key",
+        lambda self, token, salt, params: derivations.append(token) or original(self, token, salt, params),
+    )
+    assert client.get("/workouts").status_code == 200
+    assert derivations == []
+
+
+def test_invalid_ticket_falls_back_to_unwrap(client: TestClient):
+    resp = client.post(
+        "/users", json={"display_name": "Ticket", "email": "ticket2@example.com", "encryption_token": "tok"}
+    )
+    assert resp.status_code == 201
+    key_handles.drop_user(resp.json()["id"])
+    listing = client.get("/workouts", headers={tickets.TICKET_HEADER: "garbage"})
+    assert listing.status_code == 200
+    assert tickets.TICKET_HEADER in listing.headers